@@ -1,22 +1,42 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from typing import List
-from app.models import Transaction, Anomaly, IngestResponse, GraphSnapshot
-from app.models_orm import TransactionDB, AnomalyDB, SnapshotDB
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from typing import Iterator, List, Optional, Tuple, Union
+from datetime import datetime, timezone
+from app.models import IngestResponse, GraphSnapshot, StreamResponse, StreamTransaction
+from app.models_orm import TransactionDB, AnomalyDB, SnapshotDB, IngestBatchDB
 from pydantic import BaseModel
-from app.core import ingest, graph, hashing, database
-from app.engine import detectors, gnn
-from web3 import Web3
+from app.core import ingest, database, hashing
+from app.core.lazy import lazy_import
+from app.core.jobs import AnalysisJob, job_manager
+from app.engine.analysis import AnalysisError, AnalysisCancelled
+from app.engine import slices
+from app.engine.stream import stream_detector
+from sqlalchemy import select, or_
 from sqlalchemy.orm import Session
-import networkx as nx
 import os
 import json
+import time
+import uuid
+import asyncio
+import pandas as pd
+from concurrent.futures import CancelledError
+from functools import lru_cache
 from app.core.context import context_manager
-from app.engine.overlays import TaxOverlay
+from app.core.loader import BulkLoader, DEFAULT_BATCH_SIZE
 
 router = APIRouter()
 
-# Web3 Setup
-w3 = Web3(Web3.HTTPProvider(os.getenv("ETHEREUM_NODE_URL", "http://localhost:8545")))
+# web3 loads on first use, so routes like /context or /transactions never pay for it
+# (the GNN engine is loaded lazily by app.engine.analysis, inside the analysis workers)
+web3 = lazy_import("web3")
+
+@lru_cache(maxsize=None)
+def get_w3():
+    """Web3 Setup (HTTP provider created on first blockchain call)"""
+    return web3.Web3(web3.Web3.HTTPProvider(os.getenv("ETHEREUM_NODE_URL", "http://localhost:8545")))
+
 # Minimal ABI for verifyHash
 CONTRACT_ABI = [
     {
@@ -60,40 +80,97 @@ CONTRACT_ABI = [
 ]
 CONTRACT_ADDRESS = os.getenv("ANCHOR_CONTRACT_ADDRESS", "0x5FbDB2315678afecb367f032d93F642f64180aa3") 
 
-@router.post("/ingest", response_model=IngestResponse)
-async def ingest_data(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
-    try:
-        print(f"DEBUG: Receiving file {file.filename}")
-        txs_pydantic, raw_hash = await ingest.ingest_csv(file)
-        
-        print("DEBUG: CSV parsed. clearing DB")
-        # Clear old data for simple prototype flow (or append? treating as new batch replaces old for now)
+INGEST_MODES = ("replace", "append")
+
+def _begin_batch(db: Session, mode: str) -> IngestBatchDB:
+    """
+    Prepares the DB for an upload and registers its batch row.
+    'replace' clears previous data; 'append' keeps it and dedups on transaction_id.
+    """
+    if mode == "replace":
+        # Clear old data: the upload is treated as the full history
+        print("DEBUG: replace mode, clearing DB")
         db.query(TransactionDB).delete()
         db.query(AnomalyDB).delete()
-        
-        print("DEBUG: DB cleared. preparing insert")
-        # Bulk insert
-        db_objs = []
-        for tx in txs_pydantic:
-            db_objs.append(TransactionDB(
-                transaction_id=tx.transaction_id,
-                source_entity=tx.source_entity,
-                target_entity=tx.target_entity,
-                amount=tx.amount,
-                timestamp=tx.timestamp,
-                transaction_type=tx.transaction_type
-            ))
-        
-        print(f"DEBUG: inserting {len(db_objs)} rows")
-        db.add_all(db_objs)
-        db.commit()
-        print("DEBUG: commit complete")
-        
+        db.query(IngestBatchDB).delete()
+
+    batch_row = IngestBatchDB(batch_id=uuid.uuid4().hex[:16], mode=mode)
+    db.add(batch_row)
+    return batch_row
+
+def _finish_batch(db: Session, batch_row: IngestBatchDB, loader: BulkLoader, content_hash: str):
+    batch_row.content_hash = content_hash
+    batch_row.record_count = loader.rows_loaded
+    batch_row.inserted_count = loader.rows_inserted
+    batch_row.duplicate_count = loader.rows_skipped
+    db.commit()
+
+def _ingest_stream(csv_stream: ingest.CsvStream, mode: str, batch_size: int, db: Session) -> Tuple[IngestBatchDB, BulkLoader]:
+    """
+    Writes each validated chunk as soon as it is parsed. Runs in a worker thread.
+    Everything happens in one DB transaction, so a bad chunk rolls back the
+    whole upload (including the clear of the previous data).
+    """
+    try:
+        batch_row = _begin_batch(db, mode)
+        loader = BulkLoader(db, batch_size=batch_size, batch_id=batch_row.batch_id, skip_duplicates=(mode == "append"))
+        for batch in csv_stream:
+            print(f"DEBUG: streaming chunk of {len(batch)} rows ({csv_stream.bytes_read} bytes read)")
+            loader.load(batch)
+        _finish_batch(db, batch_row, loader, csv_stream.content_hash)
+    except Exception:
+        db.rollback()
+        raise
+    return batch_row, loader
+
+def _ingest_batch(batch: ingest.TransactionBatch, raw_hash: str, mode: str, batch_size: int, db: Session) -> Tuple[IngestBatchDB, BulkLoader]:
+    try:
+        batch_row = _begin_batch(db, mode)
+        loader = BulkLoader(db, batch_size=batch_size, batch_id=batch_row.batch_id, skip_duplicates=(mode == "append"))
+        print(f"DEBUG: inserting {len(batch)} rows via {loader.method} (batch size {loader.batch_size})")
+        loader.load(batch)
+        _finish_batch(db, batch_row, loader, raw_hash)
+    except Exception:
+        db.rollback()
+        raise
+    print("DEBUG: commit complete")
+    return batch_row, loader
+
+@router.post("/ingest", response_model=IngestResponse)
+async def ingest_data(
+    file: UploadFile = File(...),
+    mode: str = "replace",
+    stream: bool = False,
+    chunk_rows: int = ingest.STREAM_CHUNK_ROWS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    db: Session = Depends(database.get_db)
+):
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown ingest mode '{mode}'. Use one of: {', '.join(INGEST_MODES)}")
+
+    try:
+        print(f"DEBUG: Receiving file {file.filename} ({mode})")
+
+        if stream:
+            # Streaming mode: parse, validate and write chunk by chunk (flat memory)
+            csv_stream = ingest.CsvStream(file, chunk_rows=chunk_rows)
+            batch_row, loader = await run_in_threadpool(_ingest_stream, csv_stream, mode, batch_size, db)
+            how = "Streamed"
+        else:
+            batch, raw_hash = await ingest.ingest_csv(file)
+            batch_row, loader = await run_in_threadpool(_ingest_batch, batch, raw_hash, mode, batch_size, db)
+            how = "Persisted"
+
+        print(f"DEBUG: loaded {loader.rows_loaded} rows ({loader.rows_skipped} duplicates) at {loader.rows_per_second} rows/s")
         return IngestResponse(
-            batch_id=raw_hash[:8],
-            record_count=len(db_objs),
-            content_hash=raw_hash,
-            message="Ingestion successful (Persisted to SQLite)"
+            batch_id=batch_row.batch_id,
+            record_count=loader.rows_loaded,
+            content_hash=batch_row.content_hash,
+            message=f"Ingestion successful ({how} via {loader.method}, {mode})",
+            rows_per_second=loader.rows_per_second,
+            mode=mode,
+            inserted_count=loader.rows_inserted,
+            duplicate_count=loader.rows_skipped
         )
     except HTTPException as he:
         # Re-raise HTTP exceptions (like validation errors from ingest_csv)
@@ -119,243 +196,163 @@ async def set_context(context_id: str):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _naive_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC; align tz-aware query bounds with them."""
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
 @router.post("/analyze")
-async def run_analysis(db: Session = Depends(database.get_db)):
-    print("DEBUG: entering run_analysis")
-    
-    # Fetch from DB
-    tx_rows = db.query(TransactionDB).all()
-    if not tx_rows:
-        raise HTTPException(status_code=400, detail="No data ingested")
-        
-    # Convert back to Pydantic/Dict for graph build
-    txs = [Transaction(
-        transaction_id=t.transaction_id,
-        source_entity=t.source_entity,
-        target_entity=t.target_entity,
-        amount=t.amount,
-        timestamp=t.timestamp,
-        transaction_type=t.transaction_type
-    ) for t in tx_rows]
-    
-    print("DEBUG: building time-sliced graphs")
-    time_slices = graph.build_time_sliced_graphs(txs, window='M')
-    
-    raw_anomalies = []
-    all_gnn_scores = []
-    
-    # Analyze each slice
-    for slice_key, sub_G in time_slices:
-        print(f"DEBUG: analyzing slice {slice_key}")
-        
-        # 1. Heuristics (Deterministic)
-        print("DEBUG: detect circular")
-        circ_anomalies = detectors.detect_circular_trading(sub_G)
-        for c in circ_anomalies:
-            # Update Existing Anomaly Object
-            c.anomaly_id = f"DETERM-CIRC-{slice_key}-{hashing.hash_content(c.entities_involved)}"
-            c.evidence_data["slice"] = slice_key
-            c.detection_method = "DETERMINISTIC"
-            c.confidence = "Low" # Placeholder
-            c.explanation_metadata = {
-                "metric": "Suspicious Loop", 
-                "value": f"{len(c.entities_involved)} Entities Involved",
-                "context": "Funds returned to origin (Circular Logic)"
-            }
-            raw_anomalies.append(c)
-
-        print("DEBUG: detect dense")
-        dense_anomalies = detectors.detect_dense_clusters(sub_G)
-        for d in dense_anomalies:
-             # Update Existing Anomaly Object
-             d.anomaly_id = f"DETERM-DENSE-{slice_key}-{d.evidence_data.get('density')}"
-             d.evidence_data["slice"] = slice_key
-             d.detection_method = "DETERMINISTIC"
-             d.confidence = "Low"
-             d.explanation_metadata = {
-                "metric": "Network Density",
-                "value": f"{round(d.evidence_data.get('density', 0), 2)} (High)",
-                "context": "Abnormal Clustering > 2x Average"
-             }
-             raw_anomalies.append(d)
-        
-        print("DEBUG: detect wash trading")
-        wash_anomalies = detectors.detect_wash_trading(sub_G)
-        for w in wash_anomalies:
-            w.anomaly_id = f"DETERM-WASH-{slice_key}-{w.evidence_data.get('total_volume')}"
-            w.evidence_data["slice"] = slice_key
-            w.detection_method = "DETERMINISTIC"
-            w.confidence = "Low"
-            w.explanation_metadata = {
-                "metric": "Fake Volume Ratio",
-                "value": f"{round((w.evidence_data.get('total_volume', 0) - w.evidence_data.get('net_flow', 0))/w.evidence_data.get('total_volume', 1)*100)}%",
-                "context": "High Volume with Zero Net Transfer"
-            }
-            raw_anomalies.append(w)
-
-        print("DEBUG: detect structuring")
-        struct_anomalies = detectors.detect_structuring(sub_G)
-        for s in struct_anomalies:
-             s.anomaly_id = f"DETERM-STRUCT-{slice_key}-{hash(s.description)}"
-             s.evidence_data["slice"] = slice_key
-             s.detection_method = "DETERMINISTIC"
-             s.confidence = "Low"
-             s.explanation_metadata = {
-                "metric": "Split-Transactions",
-                "value": f"Count: {s.evidence_data.get('count', '?')}",
-                "context": "Repeated payments just below reporting limit"
-             }
-             raw_anomalies.append(s)
-        
-        # 2. Real AI (GNN)
-        print("DEBUG: running GNN inference")
-        try:
-            if sub_G.number_of_edges() > 10: # Tuned for Demo: Min 10 edges to trigger AI
-                detector = gnn.AnomalyDetector()
-                detector.train_baseline(sub_G, epochs=100) # Keep high epochs for quality
-                gnn_output = detector.detect(sub_G)
-                gnn_results = gnn_output["anomalies"]
-                
-                # Collect scores for visualization
-                if "edge_scores" in gnn_output:
-                     all_gnn_scores.extend(gnn_output["edge_scores"])
-
-                # Convert GNN dicts to Pydantic Anomaly objects
-                for ga in gnn_results:
-                    # Calculate Explainability Metrics
-                    src = ga['source']
-                    tgt = ga['target']
-                    src_deg = sub_G.degree(src)
-                    tgt_deg = sub_G.degree(tgt)
-                    
-                    raw_anomalies.append(Anomaly(
-                        anomaly_id=f"GNN-{slice_key}-{src}-{tgt}",
-                        anomaly_type="STRUCTURAL_ANOMALY",
-                        severity=ga['score'],
-                        description=f"EXISTENCE PARADOX: The AI Model predicts with >99% confidence that a transaction link between these entities is topologically invalid / Impossible, yet it exists.",
-                        entities_involved=[src, tgt],
-                        evidence_data={"score": ga['score'], "slice": slice_key, "tag": "Existence Verification Failed"},
-                        detection_method="LEARNED",
-                        confidence="High",
-                        explanation_metadata={
-                            "factors": [
-                                {"name": "Probability of Fraud", "value": f"{float(ga['score'])*100:.1f}%"},
-                                {"name": "Model Decision", "value": "Structurally Impossible"},
-                                {"name": "Reality Check", "value": "Link Exists (Deviation)"},
-                                {"name": f"Source Activity", "value": f"{src_deg} connections"},
-                                {"name": f"Target Activity", "value": f"{tgt_deg} connections"}
-                            ],
-                            "corroboration": "Violates Economic & Graph Logic"
-                        }
-                    ))
-        except Exception as e:
-            print(f"ERROR: GNN failed for slice {slice_key}: {e}")
-
-    # Post-Processing: Temporal Persistence & Confidence
-    signature_counts = {}
-    first_seen = {}
-    
-    for a in raw_anomalies:
-        sig = (a.anomaly_type, frozenset(a.entities_involved))
-        if sig not in signature_counts:
-            signature_counts[sig] = 0
-            first_seen[sig] = a.evidence_data.get("slice", "Unknown")
-        signature_counts[sig] += 1
-        
-    final_anomalies = []
-    for a in raw_anomalies:
-        sig = (a.anomaly_type, frozenset(a.entities_involved))
-        count = signature_counts[sig]
-        
-        # Confidence Evolution
-        if count >= 3:
-            a.confidence = "High"
-        elif count == 2:
-            a.confidence = "Medium"
-        else:
-            a.confidence = "Low"
-        
-        # Watchlist Status for Learned Anomalies
-        if a.detection_method == "LEARNED":
-             if a.confidence == "Low":
-                 a.anomaly_type = "WATCHLIST (Possible Anomaly)" # Change type/title for UI
-             elif a.confidence == "Medium":
-                 a.anomaly_type = "LEARNED ANOMALY (Evolving)"
-        
-        if count > 1:
-             if "Persists" not in a.description:
-                a.description += f" [First observed: {first_seen[sig]}]"
-            
-        final_anomalies.append(a)
-    
-    # --- 3. APPLY OBSERVATIONAL TAX OVERLAY ---
-    # This layer never creates anomalies, only adds explanatory context if enabled logic (GST/VAT) matches
-    print("DEBUG: applying tax overlay")
-    overlay = TaxOverlay()
-    anomalies = overlay.apply(final_anomalies, txs)
-            
-    # For snapshot, we still take the full graph for the overview
-    G = graph.build_graph(txs)
-    print("DEBUG: creating snapshot")
-    snapshot = graph.snapshot_graph(G)
-    
-    # Persist Anomalies
-    for a in anomalies:
-        db.add(AnomalyDB(
-            anomaly_id=a.anomaly_id,
-            anomaly_type=a.anomaly_type,
-            severity=a.severity,
-            description=a.description,
-            entities_involved=a.entities_involved,
-            evidence_data=a.evidence_data,
-            confidence=a.confidence,
-            detection_method=a.detection_method,
-            explanation_metadata=a.explanation_metadata
-        ))
-    db.commit()
-    
-    # Hash the result set
-    results_hash = hashing.hash_content([a.dict() for a in anomalies])
-    
-    # Map max GNN scores to edges for visualization
-    edge_score_map = {}
-    for score_item in all_gnn_scores:
-        key = f"{score_item['source']}-{score_item['target']}"
-        # Keep max score across slices
-        if key not in edge_score_map or score_item['score'] > edge_score_map[key]:
-            edge_score_map[key] = score_item['score']
-
-    # Construct safe graph data
-    nodes = [{"data": {"id": str(n), "label": str(n)}} for n in G.nodes()]
-    edges = []
-    
-    for u, v, d in G.edges(data=True):
-         edge_key = f"{u}-{v}"
-         gnn_score = edge_score_map.get(edge_key, 0.0)
-         
-         edge_data = {
-             "source": str(u), 
-             "target": str(v), 
-             "label": f"{d.get('count', 1)} tx",
-             "gnn_score": gnn_score,
-             "id": edge_key,
-             "amount": d.get("weight", 0),
-             "types": d.get("types", []),
-             "dates": d.get("dates", [])
-         }
-         edges.append({"data": edge_data})
+async def run_analysis(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    window: str = 'M',
+    stride: Optional[str] = None,
+    cycle_duration: str = '30D',
+    mode: str = 'exact',
+    gnn_training: Optional[str] = None,
+    background: bool = False
+):
+    """
+    Analyzes transactions in [start, end) (everything when unbounded),
+    sliced by `window`: D, W, M, Q, ALL or a sliding length such as 30D
+    advancing by `stride`. The range is pushed down to the indexed timestamp column.
+    Time-ordered round-trips closing within `cycle_duration` are searched
+    across the whole range.
+    The work runs in the analysis worker pool so the event loop stays free:
+    with `background=true` the job id is returned immediately (poll
+    /analyze/jobs/{job_id}), otherwise the request waits for the result.
+    `mode=approximate` scans the full range with bounded-memory sketches and
+    only verifies wash trading / structuring candidates exactly.
+    `gnn_training` (per_slice, baseline or finetune; GNN_TRAINING by default)
+    trains the GNN per slice, or once on a baseline window and reuses it.
+    """
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="'start' must be before 'end'")
     
-    graph_data = {
-        "elements": nodes + edges
-    }
+    job = job_manager.submit(
+        start=_naive_utc(start),
+        end=_naive_utc(end),
+        window=window,
+        stride=stride,
+        cycle_duration=cycle_duration,
+        mode=mode,
+        gnn_training=gnn_training or slices.GNN_TRAINING,
+        context_id=context_manager.get_active_context().get("context_id", "global")
+    )
+    if background:
+        return JSONResponse(status_code=202, content=jsonable_encoder(job.describe()))
     
-    return {
-        "snapshot": snapshot,
-        "anomalies": anomalies,
-        "results_hash": results_hash,
-        "model_hash": hashing.hash_content("PoEC_GNN_v1.0")[:66], # Simulate model hash
-        "graph_data": graph_data
-    }
+    try:
+        return await asyncio.wrap_future(job.future)
+    except AnalysisError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except (AnalysisCancelled, CancelledError):
+        raise HTTPException(status_code=409, detail=f"Analysis job {job.job_id} was cancelled")
+
+@router.get("/analyze/jobs")
+async def list_analysis_jobs():
+    return [job.describe() for job in job_manager.list()]
+
+def _get_job(job_id: str) -> AnalysisJob:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown analysis job {job_id}")
+    return job
+
+@router.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """Status and per-slice progress of an analysis job."""
+    return _get_job(job_id).describe()
+
+@router.get("/analyze/jobs/{job_id}/result")
+async def get_analysis_result(job_id: str):
+    job = _get_job(job_id)
+    status = job.status
+    if status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Analysis job {job_id} is still {status}")
+    if status == "cancelled":
+        raise HTTPException(status_code=409, detail=f"Analysis job {job_id} was cancelled")
+    error = job.future.exception()
+    if isinstance(error, AnalysisError):
+        raise HTTPException(status_code=error.status_code, detail=error.detail)
+    if error is not None:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {error}")
+    return job.future.result()
+
+@router.delete("/analyze/jobs/{job_id}")
+async def cancel_analysis_job(job_id: str):
+    """Cancels a queued job, or asks a running one to stop before its next slice."""
+    job = _get_job(job_id)
+    job_manager.cancel(job_id)
+    return job.describe()
+
+def _persist_stream(records: List[dict], db: Session) -> Tuple[IngestBatchDB, BulkLoader]:
+    """Appends streamed transactions as one 'stream' batch (ids already stored are skipped)."""
+    try:
+        batch_row = _begin_batch(db, "stream")
+        loader = BulkLoader(db, batch_id=batch_row.batch_id, skip_duplicates=True)
+        loader.load(ingest.normalize_frame(pd.DataFrame(records)))
+        _finish_batch(db, batch_row, loader, hashing.hash_content(records))
+    except Exception:
+        db.rollback()
+        raise
+    return batch_row, loader
+
+@router.post("/stream/transactions", response_model=StreamResponse)
+async def stream_transactions(
+    transactions: Union[StreamTransaction, List[StreamTransaction]],
+    persist: bool = True,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Real-time detection for one transaction or a micro-batch, in order.
+    The streaming detectors keep wash trading, structuring and short-cycle
+    state for the current window (see engine.stream.StreamDetector) and
+    return the alerts these transactions raised. With `persist`, the
+    transactions are first appended to the store for later /analyze runs;
+    the window state is only updated once that succeeded.
+    """
+    if isinstance(transactions, StreamTransaction):
+        transactions = [transactions]
+    records = []
+    for t in transactions:
+        rec = t.model_dump()
+        rec["transaction_id"] = rec["transaction_id"] or f"stream_{uuid.uuid4().hex[:16]}"
+        rec["timestamp"] = _naive_utc(rec["timestamp"])
+        records.append(rec)
+
+    # Persist first: a failed write must not leave the transactions in the window state
+    batch_id, inserted = None, 0
+    if persist and records:
+        batch_row, loader = await run_in_threadpool(_persist_stream, records, db)
+        batch_id, inserted = batch_row.batch_id, loader.rows_inserted
+
+    started = time.perf_counter()
+    alerts = await run_in_threadpool(stream_detector.process, records)
+    seconds = time.perf_counter() - started
+
+    return StreamResponse(
+        processed=len(records),
+        alerts=alerts,
+        detection_ms=round(seconds * 1000, 3),
+        transactions_per_second=round(len(records) / seconds, 1) if seconds > 0 else 0.0,
+        batch_id=batch_id,
+        inserted_count=inserted
+    )
+
+@router.get("/stream/status")
+async def stream_status():
+    return stream_detector.stats()
+
+@router.post("/stream/reset")
+async def reset_stream(window: Optional[str] = None):
+    """Clears the streaming window state, optionally switching the window length (e.g. 7D)."""
+    try:
+        stream_detector.reset(window)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid window '{window}'. Use a positive length like '30D' or '12h'")
+    return stream_detector.stats()
 
 class AnchorRequest(BaseModel):
     data_hash: str
@@ -368,6 +365,7 @@ async def get_anchor_status():
     """
     Returns the server-side wallet configuration for transparency.
     """
+    w3 = get_w3()
     if not w3.is_connected():
          return {"status": "disconnected", "network": "Unknown"}
     
@@ -397,6 +395,7 @@ async def anchor_hash(req: AnchorRequest):
     """
     Anchors the hash triplet to the registry.
     """
+    w3 = get_w3()
     if not w3.is_connected():
          raise HTTPException(status_code=503, detail="Blockchain node not connected")
     
@@ -440,6 +439,7 @@ async def anchor_hash(req: AnchorRequest):
 
 @router.get("/verify/{result_hash}")
 async def verify_on_chain(result_hash: str):
+    w3 = get_w3()
     if not w3.is_connected():
          raise HTTPException(status_code=503, detail="Blockchain node not connected")
     
@@ -459,23 +459,93 @@ async def verify_on_chain(result_hash: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Rows per cursor fetch when streaming NDJSON
+TRANSACTION_STREAM_CHUNK = 5000
+
+def _transactions_query(after_id: Optional[int], entity: Optional[str],
+                        start: Optional[datetime], end: Optional[datetime], limit: int):
+    """
+    Keyset page over TransactionDB.id (primary key), optionally filtered by
+    entity (either side) and by timestamp range; all served by existing indexes.
+    """
+    stmt = select(
+        TransactionDB.id,
+        TransactionDB.transaction_id,
+        TransactionDB.source_entity,
+        TransactionDB.target_entity,
+        TransactionDB.amount,
+        TransactionDB.timestamp,
+        TransactionDB.transaction_type,
+    )
+    if after_id is not None:
+        stmt = stmt.where(TransactionDB.id > after_id)
+    if entity is not None:
+        stmt = stmt.where(or_(TransactionDB.source_entity == entity, TransactionDB.target_entity == entity))
+    if start is not None:
+        stmt = stmt.where(TransactionDB.timestamp >= _naive_utc(start))
+    if end is not None:
+        stmt = stmt.where(TransactionDB.timestamp < _naive_utc(end))
+    stmt = stmt.order_by(TransactionDB.id)
+    if limit > 0:
+        stmt = stmt.limit(limit)
+    return stmt
+
+def _transaction_row(t) -> dict:
+    return {
+        "id": t.id,
+        "transaction_id": t.transaction_id,
+        "source": t.source_entity,
+        "target": t.target_entity,
+        "amount": t.amount,
+        "timestamp": t.timestamp.isoformat() if t.timestamp else None,
+        "type": t.transaction_type
+    }
+
+def _stream_ndjson(stmt) -> Iterator[str]:
+    """
+    Writes rows as they come off the cursor. Uses its own session because the
+    response body outlives the request-scoped one.
+    """
+    db = database.SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=TRANSACTION_STREAM_CHUNK))
+        for rows in result.partitions(TRANSACTION_STREAM_CHUNK):
+            yield "".join(json.dumps(_transaction_row(t)) + "\n" for t in rows)
+    finally:
+        db.close()
+
 @router.get("/transactions")
-async def get_transactions(limit: int = 1000, db: Session = Depends(database.get_db)):
+async def get_transactions(
+    response: Response,
+    limit: int = 1000,
+    after_id: Optional[int] = None,
+    entity: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: str = "json",
+    db: Session = Depends(database.get_db)
+):
     """
     Fetch raw transactions for the Forensics view.
+    Keyset-paginated: pass the `X-Next-Cursor` header of a page as `after_id`
+    to get the next one. `format=ndjson` streams one JSON object per line
+    (`limit=0` streams every matching row).
     """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    if limit < 0 or (limit == 0 and format == "json"):
+        raise HTTPException(status_code=400, detail="limit must be positive (0 is only allowed with format=ndjson)")
+
+    stmt = _transactions_query(after_id, entity, start, end, limit)
+    if format == "ndjson":
+        return StreamingResponse(_stream_ndjson(stmt), media_type="application/x-ndjson")
+
     try:
-        txs = db.query(TransactionDB).limit(limit).all()
-        return [
-            {
-                "transaction_id": t.transaction_id,
-                "source": t.source_entity,
-                "target": t.target_entity,
-                "amount": t.amount,
-                "timestamp": t.timestamp,
-                "type": t.transaction_type
-            }
-            for t in txs
-        ]
+        page = [_transaction_row(t) for t in db.execute(stmt)]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    # A full page may have more rows behind it
+    if len(page) == limit:
+        response.headers["X-Next-Cursor"] = str(page[-1]["id"])
+    return page
@@ -0,0 +1,187 @@
+import os
+import shutil
+import tempfile
+import threading
+import networkx as nx
+import numpy as np
+from collections import OrderedDict
+from typing import Optional
+from app.core.graph import CompactGraph, build_compact_graph
+from app.core.store import TransactionTable
+
+# Memory bound of the per-process cache and optional spill directory for evicted graphs
+GRAPH_CACHE_MAX_BYTES = int(float(os.getenv("GRAPH_CACHE_MAX_MB", "512")) * 2**20)
+GRAPH_CACHE_SPILL_DIR = os.getenv("GRAPH_CACHE_SPILL_DIR") or None
+
+# Approximate networkx footprint (measured on to_networkx output), for the memory bound
+NX_BYTES_PER_NODE = 300
+NX_BYTES_PER_EDGE = 450
+NX_BYTES_PER_TX = 60
+
+# CompactGraph arrays persisted on spill (`nodes` is stored separately as fixed-width text)
+CSR_ARRAYS = ("indptr", "indices", "weight", "count", "first_ts", "last_ts", "tx_ptr", "tx_order")
+
+
+class _Entry:
+    """Cached graph: CSR arrays (no table reference) plus the networkx view once built."""
+
+    def __init__(self, arrays: dict, spilled: bool = False):
+        self.arrays = arrays
+        self.G: Optional[nx.DiGraph] = None
+        self.spilled = spilled
+        self.nbytes = sum(a.nbytes for a in arrays.values())
+
+    def bind(self, table: TransactionTable) -> CompactGraph:
+        return CompactGraph(table=table, **self.arrays)
+
+    def nx_nbytes(self) -> int:
+        a = self.arrays
+        return (len(a["nodes"]) * NX_BYTES_PER_NODE + len(a["indices"]) * NX_BYTES_PER_EDGE
+                + len(a["tx_order"]) * NX_BYTES_PER_TX)
+
+
+class GraphCache:
+    """
+    Content-addressed LRU cache of built graphs, keyed by the transaction
+    content hash of the table they were built from (TransactionTable.content_hash),
+    so unchanged slices are not rebuilt across analyses.
+
+    Entries are bounded by `max_bytes` (CSR arrays plus an estimate for the
+    networkx view). With `spill_dir`, evicted entries are written there with
+    np.save and memory-mapped back on a later hit; spilled entries are named by
+    their content hash, so the directory can be shared between workers.
+
+    The returned graphs are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_bytes: int = GRAPH_CACHE_MAX_BYTES, spill_dir: Optional[str] = GRAPH_CACHE_SPILL_DIR):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def compact(self, table: TransactionTable, key: Optional[str] = None) -> CompactGraph:
+        """CompactGraph of `table`, built only on a cache miss."""
+        key = key or table.content_hash()
+        return self._entry(key, table).bind(table)
+
+    def networkx(self, table: TransactionTable, key: Optional[str] = None) -> nx.DiGraph:
+        """networkx view of `table`'s graph (see CompactGraph.to_networkx), built only on a cache miss."""
+        key = key or table.content_hash()
+        entry = self._entry(key, table)
+        if entry.G is None:
+            G = entry.bind(table).to_networkx()
+            with self._lock:
+                if entry.G is None:
+                    entry.G = G
+                    self._resize(key, entry, entry.nbytes + entry.nx_nbytes())
+            return G
+        return entry.G
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "spill_dir": self.spill_dir,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _entry(self, key: str, table: TransactionTable) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load(key)
+        if entry is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            cg = build_compact_graph(table)
+            arrays = {name: getattr(cg, name) for name in CSR_ARRAYS}
+            arrays["nodes"] = cg.nodes
+            entry = _Entry(arrays)
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                return existing
+            self._entries[key] = entry
+            self.bytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def _resize(self, key: str, entry: _Entry, nbytes: int):
+        self.bytes += nbytes - entry.nbytes
+        entry.nbytes = nbytes
+        self._evict(keep=key)
+
+    def _evict(self, keep: Optional[str] = None):
+        # Least recently used first; the entry just touched is never evicted
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = next(iter(self._entries.items()))
+            if key == keep:
+                self._entries.move_to_end(key)
+                continue
+            del self._entries[key]
+            self.bytes -= entry.nbytes
+            self.evictions += 1
+            if self.spill_dir and not entry.spilled:
+                self._spill(key, entry)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, key)
+
+    def _spill(self, key: str, entry: _Entry):
+        path = self._path(key)
+        if os.path.isdir(path):
+            return
+        tmp = None
+        try:
+            # Write next to the target and rename, so readers never see a partial entry
+            tmp = tempfile.mkdtemp(dir=self.spill_dir, prefix=".tmp-")
+            for name in CSR_ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), entry.arrays[name])
+            np.save(os.path.join(tmp, "nodes.npy"), entry.arrays["nodes"].astype(str))
+            os.rename(tmp, path)
+        except OSError as e:
+            print(f"DEBUG: graph cache spill failed for {key[:12]}: {e}")
+            if tmp:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    def _load(self, key: str) -> Optional[_Entry]:
+        if not self.spill_dir or not os.path.isdir(self._path(key)):
+            return None
+        path = self._path(key)
+        try:
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in CSR_ARRAYS}
+            arrays["nodes"] = np.load(os.path.join(path, "nodes.npy")).astype(object)
+        except (OSError, ValueError) as e:
+            print(f"DEBUG: graph cache reload failed for {key[:12]}: {e}")
+            return None
+        return _Entry(arrays, spilled=True)
+
+
+# Per-process cache shared by analyses (each analysis worker process has its own)
+graph_cache = GraphCache()
@@ -1,89 +1,365 @@
 import networkx as nx
-from typing import List, Any
-from app.models import Transaction, GraphSnapshot
-from app.core.hashing import hash_content
+import numpy as np
+import pandas as pd
+from typing import Callable, Iterator, List, Any, Optional, Tuple
+from app.models import GraphSnapshot
+from app.core.store import TransactionTable
+from app.core.hashing import MerkleBuilder, merkle_root
 from datetime import datetime
 
-def build_graph(transactions: List[Transaction]) -> nx.DiGraph:
+# Nanoseconds per day (timestamps are int64 ns since the epoch)
+NS_PER_DAY = 86_400 * 10**9
+
+
+class CompactGraph:
+    """
+    Integer-indexed, array-backed directed transaction graph.
+
+    Nodes are local ids 0..n-1 (`nodes` holds the entity names, sorted when
+    built by build_compact_graph). Outgoing edges are stored in CSR form: the edges of node u are
+    `indptr[u]:indptr[u + 1]`, with targets in `indices` and aggregated
+    `weight`, `count`, `first_ts` and `last_ts` per edge.
+
+    Transaction provenance is kept as offsets: the transactions of edge e
+    are rows `tx_order[tx_ptr[e]:tx_ptr[e + 1]]` of `table`, sorted by time.
     """
-    Constructs a directed graph from a list of transactions.
+
+    def __init__(self, nodes: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 weight: np.ndarray, count: np.ndarray, first_ts: np.ndarray, last_ts: np.ndarray,
+                 tx_ptr: np.ndarray, tx_order: np.ndarray, table: Optional[TransactionTable] = None):
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weight = weight
+        self.count = count
+        self.first_ts = first_ts
+        self.last_ts = last_ts
+        self.tx_ptr = tx_ptr
+        self.tx_order = tx_order
+        self.table = table
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def number_of_nodes(self) -> int:
+        return self.num_nodes
+
+    def number_of_edges(self) -> int:
+        return self.num_edges
+
+    @property
+    def sources(self) -> np.ndarray:
+        """Source node of every edge (expanded from indptr)."""
+        return np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.indptr, self.indices, self.weight, self.count,
+                                      self.first_ts, self.last_ts, self.tx_ptr, self.tx_order))
+
+    def edge_transactions(self, e: int) -> np.ndarray:
+        """Table rows of edge e, in time order."""
+        return self.tx_order[self.tx_ptr[e]:self.tx_ptr[e + 1]]
+
+    def to_networkx(self) -> nx.DiGraph:
+        """
+        Adapter for code that still needs networkx. Edge attributes match the
+        legacy builder: weight, count, transactions, types and dates.
+        """
+        G = nx.DiGraph()
+        G.add_nodes_from(self.nodes.tolist())
+        if self.num_edges == 0:
+            return G
+
+        table = self.table
+        srcs = self.nodes[self.sources].tolist()
+        dsts = self.nodes[self.indices].tolist()
+
+        # Provenance lists, cut at the edge offsets
+        tx_ids = _split_list(table.transaction_ids[self.tx_order], self.tx_ptr)
+
+        # Distinct days per edge: rows are time-sorted within an edge, so a day
+        # is new wherever the edge or the day changes
+        edge_of_row = np.repeat(np.arange(self.num_edges), self.count)
+        day = table.timestamp[self.tx_order] // NS_PER_DAY
+        new_day = np.ones(len(day), dtype=bool)
+        new_day[1:] = (day[1:] != day[:-1]) | (edge_of_row[1:] != edge_of_row[:-1])
+        day_str = np.datetime_as_string(day[new_day].astype('datetime64[D]'), unit='D')
+        dates = _split_list(day_str, _offsets(edge_of_row[new_day], self.num_edges))
+
+        # Distinct types per edge via one sort over (edge, type)
+        row_type = table.tx_type[self.tx_order]
+        type_order = np.lexsort((row_type, edge_of_row))
+        e_sorted, t_sorted = edge_of_row[type_order], row_type[type_order]
+        new_type = np.ones(len(e_sorted), dtype=bool)
+        new_type[1:] = (e_sorted[1:] != e_sorted[:-1]) | (t_sorted[1:] != t_sorted[:-1])
+        types = _split_list(table.types[t_sorted[new_type]], _offsets(e_sorted[new_type], self.num_edges))
+
+        G.add_edges_from(
+            (u, v, {'weight': w, 'count': c, 'transactions': ids, 'types': ts, 'dates': ds})
+            for u, v, w, c, ids, ts, ds in zip(srcs, dsts, self.weight.tolist(), self.count.tolist(),
+                                             tx_ids, types, dates)
+        )
+        return G
+
+
+def _offsets(group: np.ndarray, num_groups: int) -> np.ndarray:
+    """CSR-style offsets of a sorted group-id array."""
+    ptr = np.zeros(num_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(group, minlength=num_groups), out=ptr[1:])
+    return ptr
+
+
+def _split_list(values: np.ndarray, ptr: np.ndarray) -> List[list]:
+    """Cuts `values` into Python lists at the given offsets (one tolist for the whole array)."""
+    flat = values.tolist()
+    bounds = ptr.tolist()
+    return [flat[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def build_compact_graph(table: TransactionTable) -> CompactGraph:
+    """
+    Aggregates transactions into a CompactGraph with a single sort / group-by
+    over integer entity ids (no per-transaction Python work). Local node ids
+    follow the entity names, so edges come out in (source name, target name)
+    order whatever the interning order of the table.
+    """
+    m = len(table)
+    # Local node ids: ranks by name of the entity codes present in this table
+    node_codes, inverse = np.unique(np.concatenate([table.src, table.dst]), return_inverse=True)
+    n = len(node_codes)
+    by_name = np.argsort(table.entities[node_codes], kind='stable')
+    node_codes = node_codes[by_name]
+    rank = np.empty(n, dtype=np.int32)
+    rank[by_name] = np.arange(n, dtype=np.int32)
+    src = rank[inverse[:m]]
+    dst = rank[inverse[m:]]
+
+    # Group by (src, dst), time-ordered inside each group
+    order = np.lexsort((table.timestamp, dst, src))
+    s, d = src[order], dst[order]
+    is_start = np.ones(m, dtype=bool)
+    is_start[1:] = (s[1:] != s[:-1]) | (d[1:] != d[:-1])
+    edge_start = np.flatnonzero(is_start)
+    tx_ptr = np.append(edge_start, m).astype(np.int64)
+
+    if m:
+        ts = table.timestamp[order]
+        weight = np.add.reduceat(table.amount[order], edge_start)
+        first_ts = ts[edge_start]
+        last_ts = ts[tx_ptr[1:] - 1]
+    else:
+        weight = np.zeros(0, dtype=np.float64)
+        first_ts = last_ts = np.zeros(0, dtype=np.int64)
+
+    return CompactGraph(
+        nodes=table.entities[node_codes],
+        indptr=_offsets(s[edge_start], n),
+        indices=d[edge_start],
+        weight=weight,
+        count=np.diff(tx_ptr),
+        first_ts=first_ts,
+        last_ts=last_ts,
+        tx_ptr=tx_ptr,
+        tx_order=order,
+        table=table,
+    )
+
+
+def build_graph(table: TransactionTable) -> nx.DiGraph:
+    """
+    Constructs a directed graph from a columnar transaction table.
     Edges are weighted by aggregated amount.
+    Built array-first (see build_compact_graph), then adapted to networkx.
+    """
+    return build_compact_graph(table).to_networkx()
+
+# Edges serialized per chunk while streaming Merkle leaves
+MERKLE_CHUNK_EDGES = 65_536
+
+
+def edge_records(cg: CompactGraph, chunk: int = MERKLE_CHUNK_EDGES) -> Iterator[bytes]:
+    """
+    Canonical byte record of every edge, ordered by (source name, target name)
+    so the stream does not depend on load order or interning:
+    source, target, weight, count, first_ts, last_ts (ns), unit-separated.
+    Records are built `chunk` edges at a time straight from the arrays.
+
+    build_compact_graph numbers nodes by name, so its CSR order already is
+    the canonical order and nothing is sorted; a graph whose nodes are not
+    name-sorted falls back to one sort of its edges.
+    """
+    if cg.num_edges == 0:
+        return
+    sources = cg.sources
+    order = None
+    if np.any(cg.nodes[1:] < cg.nodes[:-1]):
+        rank = np.empty(cg.num_nodes, dtype=np.int64)
+        rank[np.argsort(cg.nodes, kind='stable')] = np.arange(cg.num_nodes)
+        order = np.lexsort((rank[cg.indices], rank[sources]))
+
+    for lo in range(0, cg.num_edges, chunk):
+        part = order[lo:lo + chunk] if order is not None else slice(lo, lo + chunk)
+        rows = zip(cg.nodes[sources[part]].tolist(), cg.nodes[cg.indices[part]].tolist(),
+                   cg.weight[part].tolist(), cg.count[part].tolist(),
+                   cg.first_ts[part].tolist(), cg.last_ts[part].tolist())
+        for u, v, w, c, first, last in rows:
+            yield f"{u}\x1f{v}\x1f{w!r}\x1f{c}\x1f{first}\x1f{last}".encode('utf-8')
+
+
+def snapshot_graph(cg: CompactGraph, window: str = 'M',
+                   slice_graph: Optional[Callable[[str, TransactionTable], CompactGraph]] = None) -> GraphSnapshot:
     """
-    G = nx.DiGraph()
-    
-    for tx in transactions:
-        u, v = tx.source_entity, tx.target_entity
-        amount = tx.amount
-        ts_str = tx.timestamp.strftime("%Y-%m-%d")
-        
-        if G.has_edge(u, v):
-            G[u][v]['weight'] += amount
-            G[u][v]['count'] += 1
-            G[u][v]['transactions'].append(tx.transaction_id)
-            G[u][v]['types'].add(tx.transaction_type)
-            G[u][v]['dates'].add(ts_str)
-        else:
-            G.add_edge(u, v, 
-                weight=amount, 
-                count=1, 
-                transactions=[tx.transaction_id],
-                types={tx.transaction_type},
-                dates={ts_str}
-            )
-            
-    # Convert sets to lists for JSON serialization
-    for u, v, data in G.edges(data=True):
-        data['types'] = list(data['types'])
-        data['dates'] = sorted(list(data['dates']))
-            
-    return G
-
-def snapshot_graph(G: nx.DiGraph) -> GraphSnapshot:
-    """
-    Creates a snapshot metadata object + hash from the graph.
-    """
-    # Serialize for hashing (node-link data)
-    data = nx.node_link_data(G)
-    content_hash = hash_content(data)
-    
+    Creates a snapshot metadata object + Merkle hash from the graph.
+
+    The transactions behind `cg` are cut into disjoint `window` slices
+    (calendar windows; sliding windows fall back to 'M'); each slice root is
+    the Merkle root of its sorted edge records and `data_hash` is the Merkle
+    root over (label, slice root) pairs. A change confined to one slice
+    therefore only changes that slice's subtree and the path above it.
+    Dates are the real bounds of the transactions.
+    `slice_graph(label, view)` supplies each slice's graph (e.g. from the
+    graph cache the analysis filled); slices are built here by default.
+    """
+    table = cg.table if cg.table is not None else TransactionTable.empty()
+    window = window if window in CALENDAR_WINDOWS else 'M'
+
+    slice_roots = {}
+    top = MerkleBuilder()
+    for label, view in time_slices(table, window=window):
+        view_graph = slice_graph(label, view) if slice_graph is not None else build_compact_graph(view)
+        root = merkle_root(edge_records(view_graph))
+        slice_roots[label] = root
+        top.add(f"{label}\x1f{root}".encode('utf-8'))
+    content_hash = top.root()
+
+    if len(table):
+        bounds = pd.to_datetime([table.timestamp.min(), table.timestamp.max()]).to_pydatetime()
+    else:
+        bounds = [datetime.utcnow()] * 2
+
     return GraphSnapshot(
         snapshot_id=content_hash[:16], # partial hash as ID
-        start_date=datetime.now(), # Placeholder, in real app derive from tx range
-        end_date=datetime.now(),
-        node_count=G.number_of_nodes(),
-        edge_count=G.number_of_edges(),
-        data_hash=content_hash
+        start_date=bounds[0],
+        end_date=bounds[1],
+        node_count=cg.num_nodes,
+        edge_count=cg.num_edges,
+        data_hash=content_hash,
+        slice_window=window,
+        slice_roots=slice_roots,
     )
 
-def build_time_sliced_graphs(transactions: List[Transaction], window: str = 'M') -> List[tuple[str, nx.DiGraph]]:
-    """
-    Slices transactions into time windows (e.g., 'M' for Month) and builds graphs for each.
-    Returns list of (slice_label, DiGraph).
-    """
-    slices = {}
-    
-    for tx in transactions:
-        # Determine slice key
-        ts = tx.timestamp
-        if window == 'M':
-            key = ts.strftime('%Y-%m') # 2024-01
-        elif window == 'Q':
-            quarter = (ts.month - 1) // 3 + 1
-            key = f"{ts.year}-Q{quarter}"
-        else:
-            key = "ALL"
-            
-        if key not in slices:
-            slices[key] = []
-        slices[key].append(tx)
-        
+# Calendar windows; any other window is read as a sliding-window length (e.g. "30D", "12h")
+CALENDAR_WINDOWS = ('D', 'W', 'M', 'Q', 'ALL')
+
+
+def _calendar_periods(ts: np.ndarray, window: str) -> np.ndarray:
+    """Integer period number of every (sorted) timestamp for a calendar window."""
+    days = ts // NS_PER_DAY
+    if window == 'D':
+        return days
+    if window == 'W':
+        # Weeks start on Monday (1970-01-01 was a Thursday)
+        return (days + 3) // 7
+    months = ts.view('datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+    if window == 'M':
+        return months
+    if window == 'Q':
+        return months // 3
+    return np.zeros(len(ts), dtype=np.int64)
+
+
+def _calendar_label(period: int, window: str) -> str:
+    if window == 'D':
+        return str(np.datetime64(period, 'D'))
+    if window == 'W':
+        year, week, _ = np.datetime64(period * 7 - 3, 'D').astype(datetime).isocalendar()
+        return f"{year}-W{week:02d}"
+    if window == 'M':
+        return str(np.datetime64(period, 'M')) # 2024-01
+    if window == 'Q':
+        return f"{1970 + period // 4}-Q{period % 4 + 1}"
+    return "ALL"
+
+
+def time_slices(table: TransactionTable, window: str = 'M', stride: Optional[str] = None) -> List[Tuple[str, TransactionTable]]:
+    """
+    Cuts the table into time slices with a single sort by timestamp.
+    Slices are index ranges over the sorted table, returned as zero-copy views.
+
+    `window` is a calendar window ('D', 'W', 'M', 'Q', 'ALL') or a sliding
+    window length such as '30D' or '12h'; sliding windows advance by `stride`
+    (default: the window length, i.e. tumbling windows). Empty slices are skipped.
+    Raises ValueError for an unknown window or stride.
+    """
+    table = table.sort_by_time()
+    ts = table.timestamp
+    if len(ts) == 0:
+        return []
+
+    if window in CALENDAR_WINDOWS:
+        if stride is not None:
+            raise ValueError("stride only applies to sliding windows (e.g. window=30D)")
+        periods = _calendar_periods(ts, window)
+        cuts = np.flatnonzero(periods[1:] != periods[:-1]) + 1
+        starts = np.concatenate([[0], cuts])
+        stops = np.concatenate([cuts, [len(ts)]])
+        return [(_calendar_label(int(periods[lo]), window), table.slice(lo, hi))
+                for lo, hi in zip(starts.tolist(), stops.tolist())]
+
+    size, step, window_starts, unit = sliding_window_starts(ts, window, stride)
+    los = np.searchsorted(ts, window_starts, side='left')
+    his = np.searchsorted(ts, window_starts + size, side='left')
+
+    results = []
+    for start, lo, hi in zip(window_starts.tolist(), los.tolist(), his.tolist()):
+        if hi <= lo:
+            continue
+        results.append((window_label(start, size, unit), table.slice(lo, hi)))
+    return results
+
+
+def sliding_window_starts(ts: np.ndarray, window: str, stride: Optional[str] = None) -> Tuple[int, int, np.ndarray, str]:
+    """
+    Window length and stride (ns), the start of every window covering the
+    sorted timestamps `ts`, and the label unit. Windows are aligned to
+    midnight when both lengths are whole days.
+    """
+    try:
+        size = pd.Timedelta(window)
+        step = pd.Timedelta(stride) if stride is not None else size
+    except ValueError:
+        raise ValueError(f"Unknown window '{window}'. Use one of {', '.join(CALENDAR_WINDOWS)} or a length like '30D'") from None
+    if size.value <= 0 or step.value <= 0:
+        raise ValueError("window and stride must be positive")
+
+    whole_days = size.value % NS_PER_DAY == 0 and step.value % NS_PER_DAY == 0
+    origin = ts[0] - ts[0] % NS_PER_DAY if whole_days else ts[0]
+    starts = np.arange(origin, ts[-1] + 1, step.value, dtype=np.int64)
+    return size.value, step.value, starts, ('D' if whole_days else 'm')
+
+
+def window_label(start: int, size: int, unit: str) -> str:
+    """'start/end' label of the half-open sliding window [start, start + size)."""
+    bounds = np.array([start, start + size], dtype=np.int64).view('datetime64[ns]')
+    return "/".join(np.datetime_as_string(bounds, unit=unit))
+
+
+def build_time_sliced_graphs(table: TransactionTable, window: str = 'M', stride: Optional[str] = None,
+                             cache=None) -> List[tuple[str, nx.DiGraph]]:
+    """
+    Slices transactions into time windows (see time_slices) and builds graphs for each.
+    With a `cache` (core.cache.GraphCache), slices whose transactions are
+    unchanged since an earlier call reuse their graph instead of rebuilding it.
+    Returns list of (slice_label, DiGraph) in chronological order.
+    """
     results = []
-    # Sort keys to ensure chronological order
-    sorted_keys = sorted(slices.keys())
-    
-    for key in sorted_keys:
-        print(f"DEBUG: Building graph for slice {key} with {len(slices[key])} txs")
-        sub_graph = build_graph(slices[key])
-        results.append((key, sub_graph))
-        
+    for key, view in time_slices(table, window=window, stride=stride):
+        print(f"DEBUG: Building graph for slice {key} with {len(view)} txs")
+        results.append((key, cache.networkx(view) if cache is not None else build_graph(view)))
     return results
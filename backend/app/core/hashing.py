@@ -1,6 +1,6 @@
 import hashlib
 import json
-from typing import Any
+from typing import Any, Iterable
 
 def canonical_json(data: Any) -> bytes:
     """
@@ -14,3 +14,56 @@ def hash_content(data: Any) -> str:
     """
     raw_bytes = canonical_json(data)
     return hashlib.sha256(raw_bytes).hexdigest()
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Compute SHA-256 hash of raw bytes (e.g. an uploaded file, as `sha256sum` would).
+    """
+    return hashlib.sha256(data).hexdigest()
+
+# Domain separation so a leaf can never be passed off as an interior node
+MERKLE_LEAF_PREFIX = b"\x00"
+MERKLE_NODE_PREFIX = b"\x01"
+
+
+class MerkleBuilder:
+    """
+    Streaming binary Merkle tree over SHA-256.
+    Leaves are added one at a time; only one pending subtree root per level
+    is kept (O(log n) memory), so arbitrarily long leaf streams hash without
+    being materialized. For n leaves the shape matches RFC 6962 (the left
+    subtree holds the largest power of two below n).
+    """
+
+    def __init__(self):
+        self._stack = []  # (height, digest), heights strictly decreasing
+        self.leaf_count = 0
+
+    def add(self, leaf: bytes):
+        digest = hashlib.sha256(MERKLE_LEAF_PREFIX + leaf).digest()
+        height = 0
+        while self._stack and self._stack[-1][0] == height:
+            _, left = self._stack.pop()
+            digest = hashlib.sha256(MERKLE_NODE_PREFIX + left + digest).digest()
+            height += 1
+        self._stack.append((height, digest))
+        self.leaf_count += 1
+
+    def root(self) -> str:
+        """Hex root of the leaves added so far (SHA-256 of b'' when empty)."""
+        if not self._stack:
+            return hashlib.sha256(b"").hexdigest()
+        digest = self._stack[-1][1]
+        for _, left in reversed(self._stack[:-1]):
+            digest = hashlib.sha256(MERKLE_NODE_PREFIX + left + digest).digest()
+        return digest.hex()
+
+
+def merkle_root(leaves: Iterable[bytes]) -> str:
+    """
+    Merkle root of a stream of leaf byte strings (see MerkleBuilder).
+    """
+    builder = MerkleBuilder()
+    for leaf in leaves:
+        builder.add(leaf)
+    return builder.root()
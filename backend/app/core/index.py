@@ -0,0 +1,244 @@
+import time
+import networkx as nx
+import numpy as np
+from functools import cached_property
+from scipy.sparse import csc_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+from app.core.graph import CompactGraph
+
+
+def _frozen(a: np.ndarray) -> np.ndarray:
+    """Read-only view (the underlying buffer may be shared, e.g. with the graph cache)."""
+    a = a.view()
+    a.flags.writeable = False
+    return a
+
+
+def _frozen_matrix(M):
+    for name in ("data", "indices", "indptr"):
+        setattr(M, name, _frozen(getattr(M, name)))
+    return M
+
+
+def _feature(fn):
+    """Lazily computed index structure; its build time is recorded in `timings`."""
+    def compute(self):
+        started = time.perf_counter()
+        value = fn(self)
+        self.timings[fn.__name__] = time.perf_counter() - started
+        return value
+    compute.__name__ = fn.__name__
+    compute.__doc__ = fn.__doc__
+    return cached_property(compute)
+
+
+class GraphIndex:
+    """
+    Immutable array view of one slice graph, shared by every detector.
+
+    Nodes are ids 0..n-1 (`names` holds the entity names); edges are stored
+    once as a weighted CSR matrix with sorted indices. Everything derived
+    from it (degrees, CSC adjacency, reciprocal edges, SCC labels, the
+    undirected pattern) is built on first use and then reused, so each
+    structure costs one pass per slice however many detectors read it.
+    `prepare` builds a list of them up front (in dependency order), and
+    `timings` records how long each one took.
+
+    The networkx graph is only materialized when something asks for `graph`
+    (from the `networkx` graph or factory given, otherwise from the arrays).
+    """
+
+    # Derived structures, in dependency order
+    FEATURES = ("src", "out_degree", "csc", "in_degree", "edges", "pattern", "reverse_edge",
+                "scc_labels", "undirected")
+
+    def __init__(self, names: np.ndarray, csr: csr_matrix,
+                 networkx: Union[nx.DiGraph, Callable[[], nx.DiGraph], None] = None):
+        csr.sort_indices()
+        self.timings: Dict[str, float] = {}
+        self.names = _frozen(names)
+        self.csr = _frozen_matrix(csr)
+        self._networkx = networkx
+        self._ready = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_ready", False):
+            raise AttributeError(f"GraphIndex is immutable (cannot set '{name}')")
+        super().__setattr__(name, value)
+
+    @classmethod
+    def from_compact(cls, cg: CompactGraph,
+                     networkx: Union[nx.DiGraph, Callable[[], nx.DiGraph], None] = None) -> "GraphIndex":
+        """
+        Index over a CompactGraph's CSR arrays (no copy). `networkx` is the
+        graph or a factory returning it; defaults to cg.to_networkx().
+        """
+        n = cg.num_nodes
+        csr = csr_matrix((cg.weight, cg.indices, cg.indptr), shape=(n, n))
+        return cls(cg.nodes, csr, networkx if networkx is not None else cg.to_networkx)
+
+    @classmethod
+    def from_networkx(cls, G: nx.DiGraph) -> "GraphIndex":
+        """Index over a networkx graph (one walk over its edges; missing weights count as 0)."""
+        names = list(G.nodes())
+        pos = {name: i for i, name in enumerate(names)}
+        edges = list(G.edges(data='weight', default=0))
+        rows = np.fromiter((pos[u] for u, _, _ in edges), dtype=np.int64, count=len(edges))
+        cols = np.fromiter((pos[v] for _, v, _ in edges), dtype=np.int64, count=len(edges))
+        weights = np.fromiter((w for _, _, w in edges), dtype=np.float64, count=len(edges))
+        n = len(names)
+        return cls(np.array(names, dtype=object), csr_matrix((weights, (rows, cols)), shape=(n, n)), G)
+
+    @classmethod
+    def of(cls, G: Union["GraphIndex", CompactGraph, nx.DiGraph]) -> "GraphIndex":
+        """The index itself, or one built from a CompactGraph / networkx graph."""
+        if isinstance(G, GraphIndex):
+            return G
+        if isinstance(G, CompactGraph):
+            return cls.from_compact(G)
+        return cls.from_networkx(G)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.names)
+
+    @property
+    def num_edges(self) -> int:
+        return self.csr.nnz
+
+    @property
+    def dst(self) -> np.ndarray:
+        return self.csr.indices
+
+    @property
+    def weight(self) -> np.ndarray:
+        return self.csr.data
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        """networkx view of the slice (built on first access when the index came from arrays)."""
+        G = self._networkx
+        if not isinstance(G, nx.DiGraph):
+            G = G() if G is not None else self.to_networkx()
+            super().__setattr__("_networkx", G)
+        return G
+
+    def to_networkx(self) -> nx.DiGraph:
+        """networkx graph with only the 'weight' edge attribute (no transaction provenance)."""
+        G = nx.DiGraph()
+        names = self.names.tolist()
+        G.add_nodes_from(names)
+        src = self.names[self.src].tolist()
+        dst = self.names[self.dst].tolist()
+        G.add_weighted_edges_from(zip(src, dst, self.weight.tolist()))
+        return G
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """The index's defining arrays (names as fixed-width text), e.g. for core.shared.SharedArrays."""
+        return {
+            "names": self.names.astype(str),
+            "indptr": self.csr.indptr,
+            "indices": self.csr.indices,
+            "weight": self.csr.data,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "GraphIndex":
+        """Inverse of `arrays` (indptr / indices / weight are used without copying)."""
+        n = len(arrays["names"])
+        csr = csr_matrix((arrays["weight"], arrays["indices"], arrays["indptr"]), shape=(n, n))
+        return cls(arrays["names"].astype(object), csr)
+
+    @cached_property
+    def ids(self) -> Dict[str, int]:
+        """Entity name -> node id."""
+        return {name: i for i, name in enumerate(self.names.tolist())}
+
+    def prepare(self, features: Iterable[str]) -> "GraphIndex":
+        """Builds the given derived structures now, in dependency order."""
+        wanted = set(features)
+        unknown = wanted - set(self.FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown graph index features: {sorted(unknown)}")
+        for name in self.FEATURES:
+            if name in wanted:
+                getattr(self, name)
+        return self
+
+    @_feature
+    def src(self) -> np.ndarray:
+        """Source node of every CSR edge (expanded from indptr once)."""
+        return _frozen(np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.csr.indptr)))
+
+    @_feature
+    def out_degree(self) -> np.ndarray:
+        """Distinct counterparties paid by each node (self-loops included)."""
+        return _frozen(np.diff(self.csr.indptr))
+
+    @_feature
+    def in_degree(self) -> np.ndarray:
+        """Distinct counterparties paying each node (self-loops included)."""
+        return _frozen(np.diff(self.csc.indptr))
+
+    @_feature
+    def csc(self) -> csc_matrix:
+        """Weighted adjacency by column: the payers of node v are csc.indices[csc.indptr[v]:csc.indptr[v + 1]]."""
+        csc = self.csr.tocsc()
+        csc.sort_indices()
+        return _frozen_matrix(csc)
+
+    @_feature
+    def edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(src, dst) of every edge except self-loops, in CSR order."""
+        src, dst = self.src, self.dst
+        keep = src != dst
+        return _frozen(src[keep]), _frozen(dst[keep])
+
+    @_feature
+    def pattern(self) -> csr_matrix:
+        """0/1 adjacency without self-loops (existence only; an edge may carry zero weight)."""
+        src, dst = self.edges
+        n = self.num_nodes
+        adj = csr_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n))
+        adj.sort_indices()
+        return _frozen_matrix(adj)
+
+    @_feature
+    def reverse_edge(self) -> np.ndarray:
+        """CSR position of the reverse edge v -> u of every edge u -> v, or -1 (also for self-loops)."""
+        n = self.num_nodes
+        src, dst = self.src.astype(np.int64), self.dst.astype(np.int64)
+        # Sorted indices make the CSR edge keys u * n + v ascending
+        keys = src * n + dst
+        pos = np.searchsorted(keys, dst * n + src)
+        pos = np.minimum(pos, max(len(keys) - 1, 0))
+        found = (keys[pos] == dst * n + src) & (src != dst) if len(keys) else np.zeros(0, dtype=bool)
+        return _frozen(np.where(found, pos, -1))
+
+    @property
+    def reciprocal(self) -> np.ndarray:
+        """True for edges u -> v whose reverse v -> u also exists (u != v)."""
+        return self.reverse_edge >= 0
+
+    @_feature
+    def scc_labels(self) -> Tuple[int, np.ndarray]:
+        """(count, label per node) of the strongly connected components."""
+        if self.num_nodes == 0:
+            return 0, _frozen(np.zeros(0, dtype=np.int32))
+        num, labels = connected_components(self.pattern, directed=True, connection='strong')
+        return num, _frozen(labels)
+
+    def components(self, min_size: int = 1) -> List[np.ndarray]:
+        """Strongly connected components with at least `min_size` nodes, each a sorted node array."""
+        _, labels = self.scc_labels
+        order = np.argsort(labels, kind='stable')
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        return [comp for comp in np.split(order, bounds) if len(comp) >= min_size]
+
+    @_feature
+    def undirected(self) -> csr_matrix:
+        """Symmetric 0/1 adjacency without self-loops (u -> v and v -> u become one edge)."""
+        sym = ((self.pattern + self.pattern.T) > 0).astype(np.int8).tocsr()
+        sym.sort_indices()
+        return _frozen_matrix(sym)
@@ -1,89 +1,316 @@
 import pandas as pd
+import numpy as np
+import hashlib
 import io
 from fastapi import UploadFile, HTTPException
-from typing import List, Tuple
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 from app.models import Transaction
-from app.core.hashing import hash_content
+from app.core.hashing import hash_bytes
 
-async def ingest_csv(file: UploadFile) -> Tuple[List[Transaction], str]:
+# Map legacy names / potential user variations to strict schema
+# Keys must be lowercase (headers are normalized before renaming)
+RENAME_MAP = {
+    "entity_id": "source_entity",
+    "counterparty_id": "target_entity",
+    "sender": "source_entity",
+    "receiver": "target_entity",
+    "source": "source_entity",
+    "target": "target_entity",
+    "value": "amount",
+    "date": "timestamp",
+    "time": "timestamp",
+    "datetime": "timestamp",
+    "txn_date": "timestamp"
+}
+
+# Critical Structural Columns (Non-Negotiable)
+REQUIRED_COLUMNS = {"source_entity", "target_entity", "amount", "timestamp"}
+
+# Column layout of a validated batch (mirrors the Transaction model)
+TRANSACTION_COLUMNS = list(Transaction.model_fields.keys())
+
+# Subset persisted to TransactionDB
+DB_COLUMNS = ["transaction_id", "source_entity", "target_entity", "amount", "timestamp", "transaction_type"]
+
+# Optional columns with a fixed default when absent / null
+STRING_DEFAULTS = {
+    "currency": "USD",
+    "transaction_type": "TRANSFER",
+    "entity_context": "global",
+    "counterparty_context": "global",
+}
+# Optional observational columns that stay None when absent / null
+OPTIONAL_STRINGS = ["tax_type", "entity_size"]
+OPTIONAL_FLOATS = ["tax_rate", "tax_amount", "input_tax_credit"]
+
+# Row content that identifies a transaction uploaded without a transaction_id
+ID_CONTENT_COLUMNS = ["source_entity", "target_entity", "amount", "timestamp", "transaction_type"]
+
+# Low-cardinality columns stored as categoricals to keep batches compact
+CATEGORICAL_COLUMNS = ["currency", "transaction_type", "entity_context", "counterparty_context", "tax_type", "entity_size"]
+
+# Cap on row numbers echoed back per column in validation errors
+MAX_REPORTED_ROWS = 50
+
+# Streaming mode: raw bytes pulled from the upload per read, rows per parsed chunk
+STREAM_READ_SIZE = 1 << 20
+STREAM_CHUNK_ROWS = 50_000
+
+
+class TransactionBatch:
     """
-    Reads a CSV file, validates rows against Transaction model,
-    returns list of Transaction objects and a hash of the raw dataset.
+    Columnar batch of validated transactions.
+    Columns are coerced as whole arrays; `Transaction` models are only built
+    on demand for callers that still need per-row objects.
     """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def __getitem__(self, i: int) -> Transaction:
+        return Transaction(**self._to_records(self.frame.iloc[[i]], TRANSACTION_COLUMNS)[0])
+
+    def __iter__(self) -> Iterator[Transaction]:
+        for rec in self._to_records(self.frame, TRANSACTION_COLUMNS):
+            yield Transaction(**rec)
+
+    def to_transactions(self) -> List[Transaction]:
+        return list(self)
+
+    def slices(self, size: int) -> Iterator["TransactionBatch"]:
+        """Consecutive sub-batches of at most `size` rows (views, no copy)."""
+        for start in range(0, len(self.frame), size):
+            yield TransactionBatch(self.frame.iloc[start:start + size])
+
+    def records(self) -> List[dict]:
+        """Plain dicts with the TransactionDB columns, ready for insertion."""
+        return self._to_records(self.frame, DB_COLUMNS)
+
+    @staticmethod
+    def _to_records(frame: pd.DataFrame, columns: List[str]) -> List[dict]:
+        sub = frame[columns]
+        # NaN / NaT -> None so optional fields validate as missing
+        sub = sub.astype(object).where(sub.notna(), None)
+        return sub.to_dict("records")
+
+
+def _parse_timestamps(col: pd.Series) -> pd.Series:
+    """
+    Vectorized timestamp parsing. Numbers are treated as unix seconds.
+    The fast path infers a single format; rows that miss it are retried
+    individually so mixed-format files still validate.
+    """
+    if pd.api.types.is_numeric_dtype(col):
+        parsed = pd.to_datetime(col, errors="coerce", unit="s", utc=True)
+    else:
+        parsed = pd.to_datetime(col, errors="coerce", utc=True)
+        retry = parsed.isna() & col.notna()
+        if retry.any():
+            parsed.loc[retry] = pd.to_datetime(col[retry], errors="coerce", utc=True, format="mixed")
+    # Store naive UTC (matches the TransactionDB DateTime column)
+    return parsed.dt.tz_convert(None)
+
+
+def _generated_ids(columns: Dict[str, pd.Series], row_numbers: pd.RangeIndex,
+                   occurrences: Dict[int, int]) -> pd.Series:
+    """
+    Ids for rows without a transaction_id: a hash of the row's coerced
+    content plus its occurrence number among identical rows of the file,
+    so identical rows stay distinct while the same transaction gets the same
+    id in any upload and at any position (append mode skips it).
+    `occurrences` counts the contents seen in earlier chunks of the file and
+    is updated in place.
+    """
+    content = pd.DataFrame({col: columns[col] for col in ID_CONTENT_COLUMNS})
+    digest = pd.util.hash_pandas_object(content, index=False).to_numpy()
+    uniq, inverse, counts = np.unique(digest, return_inverse=True, return_counts=True)
+    earlier = np.array([occurrences.get(d, 0) for d in uniq.tolist()], dtype=np.uint64)
+    within = pd.Series(inverse).groupby(inverse).cumcount().to_numpy()
+    occurrence = earlier[inverse] + within.astype(np.uint64)
+    occurrences.update(zip(uniq.tolist(), (earlier + counts.astype(np.uint64)).tolist()))
+    return pd.Series([f"txn_{h:016x}_{k}" for h, k in zip(digest.tolist(), occurrence.tolist())], index=row_numbers)
+
+
+def normalize_frame(df: pd.DataFrame, row_offset: int = 0,
+                    occurrences: Optional[Dict[int, int]] = None) -> TransactionBatch:
+    """
+    Normalizes headers, coerces every column in one pass and validates
+    the whole frame at once. All invalid rows are reported together.
+    `row_offset` shifts reported row numbers and `occurrences` carries the
+    contents already seen for generated ids (both used when reading in chunks).
+    """
+    # Normalize Headers: content strip and lowercase for robust matching
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    df = df.rename(columns=RENAME_MAP)
+    # Later duplicates (e.g. both 'source' and 'sender') lose to the first
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    missing = REQUIRED_COLUMNS - set(df.columns)
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"CSV Validation Failed. Missing required core columns: {', '.join(sorted(missing))}. Please refer to the schema instructions."
+        )
+
+    row_numbers = pd.RangeIndex(row_offset, row_offset + len(df))
+    df = df.set_axis(row_numbers)
+    out: Dict[str, pd.Series] = {}
+    errors: Dict[str, np.ndarray] = {}
+
+    def flag(column: str, mask: pd.Series):
+        if mask.any():
+            errors[column] = row_numbers[mask.to_numpy()]
+
+    for col in ("source_entity", "target_entity"):
+        values = df[col]
+        flag(col, values.isna())
+        out[col] = values.astype(str)
+
+    amount = pd.to_numeric(df["amount"], errors="coerce").astype("float64")
+    flag("amount", amount.isna())
+    out["amount"] = amount
+
+    timestamp = _parse_timestamps(df["timestamp"])
+    flag("timestamp", timestamp.isna())
+    out["timestamp"] = timestamp
+
+    for col, default in STRING_DEFAULTS.items():
+        if col in df.columns:
+            out[col] = df[col].astype(str).where(df[col].notna(), default)
+        else:
+            out[col] = pd.Series(default, index=row_numbers)
+
+    for col in OPTIONAL_STRINGS:
+        if col in df.columns:
+            out[col] = df[col].astype(str).where(df[col].notna(), None)
+        else:
+            out[col] = pd.Series(None, index=row_numbers, dtype=object)
+
+    for col in OPTIONAL_FLOATS:
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce").astype("float64")
+            flag(col, values.isna() & df[col].notna())
+            out[col] = values
+        else:
+            out[col] = pd.Series(np.nan, index=row_numbers, dtype="float64")
+
+    if errors:
+        bad_rows = np.unique(np.concatenate(list(errors.values())))
+        per_column = []
+        for col, rows in errors.items():
+            shown = ", ".join(str(r) for r in rows[:MAX_REPORTED_ROWS])
+            more = f" (+{len(rows) - MAX_REPORTED_ROWS} more)" if len(rows) > MAX_REPORTED_ROWS else ""
+            per_column.append(f"{col}: rows {shown}{more}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"CSV Validation Failed. {len(bad_rows)} invalid rows. " + "; ".join(per_column)
+        )
+
+    # Identity: rows without an id get one derived from their coerced content
+    generated_ids = _generated_ids(out, row_numbers, {} if occurrences is None else occurrences)
+    if "transaction_id" in df.columns:
+        tid = df["transaction_id"]
+        out["transaction_id"] = tid.astype(str).where(tid.notna(), generated_ids)
+    else:
+        out["transaction_id"] = generated_ids
+
+    frame = pd.DataFrame(out, columns=TRANSACTION_COLUMNS)
+    for col in CATEGORICAL_COLUMNS:
+        frame[col] = frame[col].astype("category")
+    return TransactionBatch(frame)
+
+
+def _check_filename(file: UploadFile):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are allowed detected")
 
+
+async def ingest_csv(file: UploadFile) -> Tuple[TransactionBatch, str]:
+    """
+    Reads a CSV file, validates all rows column-wise against the Transaction schema,
+    returns a columnar TransactionBatch and a hash of the raw dataset.
+    """
+    _check_filename(file)
+
     content = await file.read()
-    # Hash raw content for integrity proof
-    raw_hash = hash_content(content.decode('utf-8')) # Simple string hash of raw bytes
+    # Hash raw content for integrity proof (same digest as the streaming path)
+    raw_hash = hash_bytes(content)
 
     try:
         df = pd.read_csv(io.BytesIO(content))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid CSV format: {str(e)}")
 
-    # Normalize column names (optional, map common names)
-    # For now assume exact match or map loosely
-    # Normalize and Validate
-    # Support both new (source_entity) and legacy (entity_id) naming
-    # Map legacy names to strict schema
-    # Normalize Headers: content strip and lowercase for robust matching
-    df.columns = [c.strip().lower() for c in df.columns]
-    
-    # Map legacy names / potential user variations to strict schema
-    # Keys must be lowercase now
-    rename_map = {
-        "entity_id": "source_entity", 
-        "counterparty_id": "target_entity",
-        "sender": "source_entity",
-        "receiver": "target_entity",
-        "source": "source_entity",
-        "target": "target_entity",
-        "value": "amount",
-        "date": "timestamp",
-        "time": "timestamp",
-        "datetime": "timestamp",
-        "txn_date": "timestamp"
-    }
-    df.rename(columns=rename_map, inplace=True)
-    
-    # Critical Structural Columns (Non-Negotiable)
-    required_cols = {"source_entity", "target_entity", "amount", "timestamp"}
-    missing = required_cols - set(df.columns)
-    
-    if missing:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"CSV Validation Failed. Missing required core columns: {', '.join(missing)}. Please refer to the schema instructions."
-        )
+    return normalize_frame(df), raw_hash
+
+
+class HashingReader:
+    """
+    File-like wrapper handing the CSV parser fixed-size blocks of the raw
+    upload while feeding the same bytes into an incremental SHA-256.
+    """
+
+    def __init__(self, raw: BinaryIO, read_size: int = STREAM_READ_SIZE):
+        self.raw = raw
+        self.read_size = read_size
+        self.bytes_read = 0
+        self._sha = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.read_size:
+            size = self.read_size
+        block = self.raw.read(size)
+        self._sha.update(block)
+        self.bytes_read += len(block)
+        return block
+
+    def drain(self):
+        """Hash any bytes the parser did not consume (e.g. trailing blank lines)."""
+        while self.read(self.read_size):
+            pass
 
-    transactions = []
-    
-    # Iterate and validate
-    for _, row in df.iterrows():
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+
+class CsvStream:
+    """
+    Streaming ingest over an uploaded CSV.
+    Iterating yields validated TransactionBatch chunks of `chunk_rows` rows;
+    only one chunk is held in memory at a time. `content_hash` and
+    `record_count` are final once the stream is exhausted.
+    Iteration is blocking, run it off the event loop.
+    """
+
+    def __init__(self, file: UploadFile, chunk_rows: int = STREAM_CHUNK_ROWS, read_size: int = STREAM_READ_SIZE):
+        _check_filename(file)
+        file.file.seek(0)
+        self.chunk_rows = chunk_rows
+        self.record_count = 0
+        self._reader = HashingReader(file.file, read_size)
+        # Contents seen so far, so identical rows in different chunks get distinct ids
+        self._occurrences: Dict[int, int] = {}
+
+    @property
+    def content_hash(self) -> str:
+        return self._reader.hexdigest()
+
+    @property
+    def bytes_read(self) -> int:
+        return self._reader.bytes_read
+
+    def __iter__(self) -> Iterator[TransactionBatch]:
         try:
-            tx = Transaction(
-                transaction_id=str(row.get("transaction_id", f"txn_{_}")),
-                source_entity=str(row["source_entity"]),
-                target_entity=str(row["target_entity"]),
-                amount=float(row["amount"]),
-                timestamp=row["timestamp"],
-                transaction_type=str(row.get("transaction_type", "TRANSFER")),
-                
-                # Context Data
-                entity_context=str(row.get("entity_context", "global")),
-                counterparty_context=str(row.get("counterparty_context", "global")),
-                
-                # Observational Overlay Data
-                tax_type=str(row.get("tax_type", "")) if not pd.isna(row.get("tax_type")) else None,
-                tax_rate=float(row.get("tax_rate", 0)) if not pd.isna(row.get("tax_rate")) else None,
-                tax_amount=float(row.get("tax_amount", 0)) if not pd.isna(row.get("tax_amount")) else None,
-                input_tax_credit=float(row.get("input_tax_credit", 0)) if not pd.isna(row.get("input_tax_credit")) else None,
-                entity_size=str(row.get("entity_size", "")) if not pd.isna(row.get("entity_size")) else None
-            )
-            transactions.append(tx)
+            chunks = pd.read_csv(self._reader, chunksize=self.chunk_rows)
+            for df in chunks:
+                batch = normalize_frame(df, row_offset=self.record_count, occurrences=self._occurrences)
+                self.record_count += len(batch)
+                yield batch
+        except HTTPException:
+            raise
         except Exception as e:
-            # In production, we might log errors and skip rows, or fail batch
-            raise HTTPException(status_code=400, detail=f"Row {_} validation error: {str(e)}")
-
-    return transactions, raw_hash
+            raise HTTPException(status_code=400, detail=f"Invalid CSV format (after row {self.record_count}): {str(e)}")
+        self._reader.drain()
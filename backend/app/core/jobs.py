@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.engine.analysis import AnalysisCancelled
+
+# "process" (default) keeps CPU-bound analysis off the API's GIL; "thread" is
+# handy for debugging and for hosts where spawning processes is not allowed
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "process")
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+
+# Finished jobs kept in memory for polling before the oldest are dropped
+MAX_FINISHED_JOBS = 100
+
+
+def _init_worker(job_workers: int):
+    # Never reuse pooled DB connections inherited from the parent process
+    from app.core.database import engine
+    engine.dispose(close=False)
+    # Job workers run side by side: split the cores between their slice / cycle-search pools
+    from app.engine import cycles, slices
+    share = max(1, (os.cpu_count() or 1) // job_workers)
+    slices.ANALYSIS_SLICE_WORKERS = min(slices.ANALYSIS_SLICE_WORKERS, share)
+    cycles.CYCLE_SEARCH_WORKERS = min(cycles.CYCLE_SEARCH_WORKERS, share)
+
+
+def _run_analysis(params: Dict[str, Any], progress, cancel_event) -> dict:
+    """
+    Job body, executed inside a pool worker. `progress` is a shared dict and
+    `cancel_event` a shared event (manager proxies in process mode).
+    """
+    from app.core.database import SessionLocal
+    from app.core.context import context_manager
+    from app.engine.analysis import analyze
+
+    params = dict(params)
+    # Workers outlive context switches in the API process: apply the caller's context
+    context_manager.set_context(params.pop("context_id", "global"))
+
+    progress["status"] = "running"
+    progress["started_at"] = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        return analyze(db, progress=progress.update, is_cancelled=cancel_event.is_set, **params)
+    finally:
+        db.close()
+
+
+class AnalysisJob:
+    def __init__(self, job_id: str, params: Dict[str, Any], future: Future, progress, cancel_event):
+        self.job_id = job_id
+        self.params = params
+        self.future = future
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.submitted_at = datetime.utcnow()
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            error = self.future.exception()
+            if error is None:
+                return "completed"
+            return "cancelled" if isinstance(error, AnalysisCancelled) else "failed"
+        if self.cancel_event.is_set():
+            return "cancelling"
+        return self.progress.get("status", "queued")
+
+    def describe(self) -> dict:
+        progress = self.progress.copy()
+        progress.pop("status", None)
+        info = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "params": {k: v for k, v in self.params.items()},
+            "progress": progress,
+        }
+        if self.status == "failed":
+            info["error"] = str(self.future.exception())
+        return info
+
+
+class JobManager:
+    """
+    Runs /analyze jobs on a worker pool (process pool by default) and tracks
+    their progress, results and cancellation. Pools and the shared-state
+    manager are created on first submit.
+    """
+
+    def __init__(self, kind: str = ANALYSIS_EXECUTOR, max_workers: int = ANALYSIS_JOB_WORKERS):
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[Executor] = None
+        self._manager = None
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        if self._executor is not None:
+            return
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="analysis")
+        else:
+            # spawn: the API process runs threads, which makes fork unsafe
+            ctx = multiprocessing.get_context("spawn")
+            self._manager = ctx.Manager()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx,
+                                                 initializer=_init_worker, initargs=(self.max_workers,))
+
+    def _shared_state(self):
+        if self._manager is not None:
+            return self._manager.dict(status="queued"), self._manager.Event()
+        return {"status": "queued"}, threading.Event()
+
+    def submit(self, **params) -> AnalysisJob:
+        with self._lock:
+            self._ensure_pool()
+            progress, cancel_event = self._shared_state()
+            future = self._executor.submit(_run_analysis, params, progress, cancel_event)
+            job = AnalysisJob(uuid.uuid4().hex[:16], params, future, progress, cancel_event)
+            self._jobs[job.job_id] = job
+            self._prune()
+        print(f"DEBUG: submitted analysis job {job.job_id} ({self.kind} pool)")
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[AnalysisJob]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.future.done():
+            return False
+        # Not started yet: drop it from the queue; running: stop before the next slice
+        if not job.future.cancel():
+            job.cancel_event.set()
+        return True
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.future.done()]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.job_id]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+
+job_manager = JobManager()
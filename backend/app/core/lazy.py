@@ -0,0 +1,48 @@
+import importlib
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Optional
+
+# Module name -> seconds spent on its first import (filled as modules load)
+_load_times: Dict[str, float] = {}
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module (torch, web3, ...) that is only imported on
+    first attribute access. Thread-safe; the import time is recorded for the
+    startup report.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    _load_times[self._name] = round(time.perf_counter() - start, 3)
+                    print(f"DEBUG: lazily imported {self._name} in {_load_times[self._name]}s")
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def load_report() -> Dict[str, float]:
+    """Seconds spent importing each lazily loaded module so far."""
+    return dict(_load_times)
@@ -0,0 +1,125 @@
+import io
+import os
+import time
+from typing import Optional
+from sqlalchemy import insert, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models_orm import TransactionDB
+from app.core.ingest import TransactionBatch, DB_COLUMNS
+
+# Rows sent per executemany / COPY round-trip
+DEFAULT_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "10000"))
+
+# Matches the SQLAlchemy DateTime text layout so COPY'd rows compare like ORM rows
+COPY_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Session-local staging table for COPY + ON CONFLICT in append mode (Postgres)
+STAGE_TABLE = "transactions_stage"
+
+
+class BulkLoader:
+    """
+    Bulk-loads TransactionBatch chunks into the transactions table inside the
+    caller's session transaction (the caller commits or rolls back).
+    Postgres uses COPY FROM STDIN; every other backend (SQLite) uses
+    Core-level executemany in batches of `batch_size` rows.
+
+    With `skip_duplicates`, rows whose transaction_id is already stored are
+    skipped through the unique index (INSERT ... ON CONFLICT DO NOTHING)
+    instead of failing the load.
+    """
+
+    def __init__(self, db: Session, batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_id: Optional[str] = None, skip_duplicates: bool = False):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.batch_id = batch_id
+        self.skip_duplicates = skip_duplicates
+        self.dialect = db.get_bind().dialect.name
+        self.rows_loaded = 0
+        self.rows_inserted = 0
+        self.seconds = 0.0
+        self._stage_ready = False
+
+    @property
+    def method(self) -> str:
+        return "COPY" if self.dialect == "postgresql" else "executemany"
+
+    @property
+    def rows_skipped(self) -> int:
+        return self.rows_loaded - self.rows_inserted
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows_loaded / self.seconds, 1) if self.seconds > 0 else 0.0
+
+    def load(self, batch: TransactionBatch) -> int:
+        """Loads one batch, returns the number of rows actually inserted."""
+        start = time.perf_counter()
+        inserted = 0
+        for part in batch.slices(self.batch_size):
+            if self.dialect == "postgresql":
+                inserted += self._copy(part)
+            else:
+                inserted += self._executemany(part)
+        self.seconds += time.perf_counter() - start
+        self.rows_loaded += len(batch)
+        self.rows_inserted += inserted
+        return inserted
+
+    def _insert_stmt(self):
+        table = TransactionDB.__table__
+        if not self.skip_duplicates:
+            return insert(table)
+        dialect_insert = postgresql.insert if self.dialect == "postgresql" else sqlite.insert
+        return dialect_insert(table).on_conflict_do_nothing(index_elements=["transaction_id"])
+
+    def _executemany(self, batch: TransactionBatch) -> int:
+        records = batch.records()
+        if self.batch_id is not None:
+            for rec in records:
+                rec["batch_id"] = self.batch_id
+        result = self.db.execute(self._insert_stmt(), records)
+        return result.rowcount if result.rowcount >= 0 else len(records)
+
+    def _copy(self, batch: TransactionBatch) -> int:
+        frame = batch.frame[DB_COLUMNS].assign(batch_id=self.batch_id)
+        columns = ", ".join(frame.columns)
+        buf = io.StringIO()
+        frame.to_csv(buf, index=False, header=False, date_format=COPY_DATE_FORMAT)
+        buf.seek(0)
+
+        # Raw DBAPI connection bound to the session's current transaction
+        raw = self.db.connection().connection
+        cur = raw.cursor()
+        try:
+            if not hasattr(cur, "copy_expert"):
+                # Non-psycopg2 driver: fall back to executemany
+                return self._executemany(batch)
+
+            if not self.skip_duplicates:
+                cur.copy_expert(f"COPY {TransactionDB.__tablename__} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+                return len(frame)
+
+            # COPY cannot skip conflicts itself: stage the chunk, then upsert from the stage
+            self._ensure_stage()
+            cur.copy_expert(f"COPY {STAGE_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+        finally:
+            cur.close()
+
+        result = self.db.execute(text(
+            f"INSERT INTO {TransactionDB.__tablename__} ({columns}) "
+            f"SELECT {columns} FROM {STAGE_TABLE} ON CONFLICT (transaction_id) DO NOTHING"
+        ))
+        self.db.execute(text(f"TRUNCATE {STAGE_TABLE}"))
+        return result.rowcount
+
+    def _ensure_stage(self):
+        if self._stage_ready:
+            return
+        self.db.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} "
+            f"(LIKE {TransactionDB.__tablename__} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ))
+        self._stage_ready = True
@@ -0,0 +1,106 @@
+import multiprocessing
+import multiprocessing.util
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# Array offsets inside a block are aligned to this many bytes
+ALIGNMENT = 64
+
+# (block name, [(array name, dtype, shape, offset)]): what a worker needs to attach
+SharedSpec = Tuple[str, List[Tuple[str, str, Tuple[int, ...], int]]]
+
+
+class SharedArrays:
+    """
+    Named numpy arrays packed into one shared-memory block, so worker
+    processes can map them instead of receiving a pickled copy.
+
+    The creating process owns the block: `spec` is the small picklable
+    description to send to workers, and `release` unlinks the block once
+    the workers are done with it.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        layout = []
+        offset = 0
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a)
+            layout.append((name, a.dtype.str, a.shape, offset))
+            offset += -(-a.nbytes // ALIGNMENT) * ALIGNMENT
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (name, dtype, shape, start), a in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=start)[...] = a
+        self.spec: SharedSpec = (self.shm.name, layout)
+        self.nbytes = offset
+
+    def release(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def attach(spec: SharedSpec) -> Tuple[shared_memory.SharedMemory, Dict[str, np.ndarray]]:
+    """
+    Maps a block created by SharedArrays in another process. Returns the
+    block and the arrays (views into it); drop the views before `close()`.
+    """
+    name, layout = spec
+    # Spawned workers share the creator's resource tracker, which the creator's unlink settles
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = {key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+              for key, dtype, shape, offset in layout}
+    return shm, arrays
+
+
+class LazySpawnPool:
+    """
+    Process pool started on first use with the spawn context (safe to start
+    from threads and from analysis worker processes) and stopped when the
+    process exits. `initargs` may be a callable that builds the worker
+    arguments when the pool starts (e.g. shared counters of the spawn context).
+    """
+
+    context = multiprocessing.get_context("spawn")
+
+    def __init__(self, initializer: Optional[Callable] = None,
+                 initargs: Union[tuple, Callable[[], tuple]] = ()):
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        _spawn_pools.append(self)
+
+    def get(self, workers: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                initargs = self.initargs() if callable(self.initargs) else self.initargs
+                self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=self.context,
+                                                 initializer=self.initializer, initargs=initargs)
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+_spawn_pools: List[LazySpawnPool] = []
+
+
+def shutdown_pools():
+    for pool in _spawn_pools:
+        pool.shutdown()
+
+
+# Spawned processes (e.g. analysis job workers) exit through multiprocessing's exit
+# handler, which joins child processes and never runs atexit hooks: stop the pools
+# from a finalizer that runs before that join (it also runs at interpreter exit).
+# Priority above the pools' own call-queue finalizers (10), which would otherwise
+# close the queue before the workers' stop sentinels are sent
+multiprocessing.util.Finalize(None, shutdown_pools, exitpriority=20)
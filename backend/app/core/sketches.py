@@ -0,0 +1,197 @@
+import math
+import numpy as np
+import pandas as pd
+from typing import Optional, Sequence
+
+# Odd 64-bit constants for key mixing (splitmix64 / golden ratio)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def hash_names(names: Sequence[str]) -> np.ndarray:
+    """Stable 64-bit hash of every name (same name, same hash, in any process)."""
+    return pd.util.hash_array(np.asarray(names, dtype=object), categorize=False)
+
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads every input bit over the whole 64-bit output."""
+    x = np.asarray(x, dtype=np.uint64).copy()
+    x ^= x >> np.uint64(30)
+    x *= _MIX1
+    x ^= x >> np.uint64(27)
+    x *= _MIX2
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def pair_keys(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """64-bit key of the ordered pair (a, b) of name hashes."""
+    return mix64(np.asarray(a, dtype=np.uint64) * _GOLDEN + np.asarray(b, dtype=np.uint64))
+
+
+def unordered_pair_keys(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """64-bit key of the pair {a, b} (same key for a -> b and b -> a)."""
+    return pair_keys(np.minimum(a, b), np.maximum(a, b))
+
+
+class CountMinSketch:
+    """
+    Count-min sketch of non-negative weights per 64-bit key.
+
+    `query` never underestimates; with probability 1 - exp(-depth) it
+    overestimates a key by at most e / width times the total weight added
+    (`error_bound`), however many distinct keys there are.
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.float64)
+        self.seeds = mix64(np.arange(1, depth + 1, dtype=np.uint64) * _GOLDEN)
+        self.total = 0.0
+
+    def _columns(self, keys: np.ndarray, row: int) -> np.ndarray:
+        return (mix64(keys ^ self.seeds[row]) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, keys: np.ndarray, weights: np.ndarray):
+        for row in range(self.depth):
+            self.table[row] += np.bincount(self._columns(keys, row), weights=weights, minlength=self.width)
+        self.total += float(np.sum(weights))
+
+    def query(self, keys: np.ndarray) -> np.ndarray:
+        keys = np.asarray(keys, dtype=np.uint64)
+        if len(keys) == 0:
+            return np.zeros(0)
+        return np.min([self.table[row, self._columns(keys, row)] for row in range(self.depth)], axis=0)
+
+    @property
+    def error_bound(self) -> float:
+        return math.e / self.width * self.total
+
+    @property
+    def confidence(self) -> float:
+        return 1.0 - math.exp(-self.depth)
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+
+class SpaceSaving:
+    """
+    Heavy hitters by weight (SpaceSaving with `capacity` counters), updated a
+    chunk at a time.
+
+    Every tracked key keeps its slot until it is evicted, and a key whose
+    true weight exceeds `floor` is always tracked. A tracked count
+    overestimates the true weight by at most its `errors` entry (which is
+    at most `floor`); the key's weight before it was tracked is at most
+    that too. A newcomer takes a free slot or that of an evicted key:
+    `update` returns the slots it (re)assigned, so per-slot side structures
+    (e.g. HyperLogLogs) can be reset for them.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.keys = np.zeros(capacity, dtype=np.uint64)
+        self.counts = np.zeros(capacity, dtype=np.float64)
+        self.errors = np.zeros(capacity, dtype=np.float64)
+        self.labels = np.empty(capacity, dtype=object)
+        self.size = 0
+        self.floor = 0.0
+        self.total = 0.0
+        self._index = pd.Index(self.keys[:0])
+
+    def update(self, keys: np.ndarray, weights: np.ndarray, labels: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Adds a chunk of (key, weight) items; `labels` names each key (e.g. the
+        entity). Returns the slots given to keys that were not tracked before.
+        """
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        self.total += float(np.sum(weights))
+        uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        totals = np.bincount(inverse, weights=weights, minlength=len(uniq))
+        pos = self._index.get_indexer(uniq)
+        known = pos >= 0
+        np.add.at(self.counts, pos[known], totals[known])
+
+        new = np.flatnonzero(~known)
+        new_keys = uniq[new]
+        new_labels = labels[first[new]] if labels is not None else np.full(len(new), None, dtype=object)
+        new_counts = totals[new] + self.floor
+        errors = np.full(len(new), self.floor)
+        slots = np.arange(self.size, self.size + len(new))
+        if len(new) > self.capacity - self.size:
+            # Keep the heaviest of tracked + new; newcomers take free slots, then those of the evicted
+            pool = np.concatenate([self.counts[:self.size], new_counts])
+            kept = np.zeros(len(pool), dtype=bool)
+            kept[np.argsort(-pool, kind="stable")[:self.capacity]] = True
+            self.floor = max(self.floor, float(pool[~kept].max()))
+            evicted = np.flatnonzero(~kept[:self.size])
+            take = np.flatnonzero(kept[self.size:])
+            slots = np.concatenate([np.arange(self.size, self.capacity), evicted])
+            new_keys, new_labels, new_counts, errors = new_keys[take], new_labels[take], new_counts[take], errors[take]
+        self.keys[slots] = new_keys
+        self.counts[slots] = new_counts
+        self.errors[slots] = errors
+        self.labels[slots] = new_labels
+        self.size = min(self.capacity, self.size + len(new))
+        self._index = pd.Index(self.keys[:self.size])
+        return slots
+
+    def slots(self, keys: np.ndarray) -> np.ndarray:
+        """Slot of every key, or -1 when it is not tracked."""
+        return self._index.get_indexer(np.asarray(keys, dtype=np.uint64))
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.counts.nbytes + self.errors.nbytes + self.labels.nbytes
+
+
+class HyperLogLogs:
+    """
+    One HyperLogLog distinct counter per slot, 2**precision registers each.
+    Estimates have a relative standard error of about 1.04 / sqrt(2**precision)
+    (`relative_error`); small counts use linear counting and are close to exact.
+    """
+
+    def __init__(self, slots: int, precision: int):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros((slots, self.m), dtype=np.uint8)
+        self.alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def add(self, slots: np.ndarray, item_hashes: np.ndarray):
+        """Counts item `item_hashes[i]` in slot `slots[i]`."""
+        h = mix64(item_hashes)
+        p = np.uint64(self.precision)
+        register = (h & np.uint64(self.m - 1)).astype(np.int64)
+        rest = h >> p
+        # Bit length of the remaining 64 - p bits, exact via two 32-bit halves
+        high, low = (rest >> np.uint64(32)).astype(np.float64), (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        bits = np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+        rank = (64 - self.precision - bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, (slots, register), rank)
+
+    def reset(self, slots: np.ndarray):
+        """Empties the given slots (e.g. when a heavy-hitter slot changes hands)."""
+        self.registers[slots] = 0
+
+    def estimate(self, slots: np.ndarray) -> np.ndarray:
+        regs = self.registers[slots].astype(np.float64)
+        raw = self.alpha * self.m * self.m / np.sum(np.exp2(-regs), axis=1)
+        zeros = np.count_nonzero(regs == 0, axis=1)
+        with np.errstate(divide='ignore'):
+            linear = self.m * np.log(self.m / zeros)
+        return np.where((raw <= 2.5 * self.m) & (zeros > 0), linear, raw)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    @property
+    def nbytes(self) -> int:
+        return self.registers.nbytes
+
@@ -0,0 +1,242 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models_orm import TransactionDB
+
+# Rows pulled from the DB cursor per partition while loading
+LOAD_CHUNK_ROWS = 50_000
+
+
+def select_transactions():
+    """The six ledger columns TransactionTable loads, in insertion order."""
+    return select(
+        TransactionDB.transaction_id,
+        TransactionDB.source_entity,
+        TransactionDB.target_entity,
+        TransactionDB.amount,
+        TransactionDB.timestamp,
+        TransactionDB.transaction_type,
+    ).order_by(TransactionDB.id)
+
+
+def _bounded(stmt, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        stmt = stmt.where(TransactionDB.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(TransactionDB.timestamp < end)
+    return stmt
+
+
+class Vocabulary:
+    """
+    Incremental string interner: maps names to dense int32 codes in first-seen order.
+    """
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:
+        # Factorize the chunk first so the dict is only touched once per distinct name
+        inverse, uniques = pd.factorize(np.asarray(values, dtype=object))
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, name in enumerate(uniques):
+            code = self._codes.get(name)
+            if code is None:
+                code = len(self._names)
+                self._codes[name] = code
+                self._names.append(name)
+            mapping[i] = code
+        return mapping[inverse]
+
+    def names(self) -> np.ndarray:
+        return np.array(self._names, dtype=object)
+
+
+class TransactionTable:
+    """
+    Columnar, read-only view of the transaction ledger shared by graph building,
+    detectors and overlays.
+
+    Entities and transaction types are interned to int32 codes (`entities` and
+    `types` hold the names), timestamps are int64 nanoseconds since the epoch
+    (naive UTC) and amounts float64. Optional observational tax columns are
+    float64 with NaN where unknown.
+    """
+
+    def __init__(self, transaction_ids: np.ndarray, src: np.ndarray, dst: np.ndarray,
+                 amount: np.ndarray, timestamp: np.ndarray, tx_type: np.ndarray,
+                 entities: np.ndarray, types: np.ndarray,
+                 tax_rate: Optional[np.ndarray] = None, input_tax_credit: Optional[np.ndarray] = None):
+        n = len(transaction_ids)
+        self.transaction_ids = transaction_ids
+        self.src = src
+        self.dst = dst
+        self.amount = amount
+        self.timestamp = timestamp
+        self.tx_type = tx_type
+        self.entities = entities
+        self.types = types
+        self.tax_rate = tax_rate if tax_rate is not None else np.full(n, np.nan)
+        self.input_tax_credit = input_tax_credit if input_tax_credit is not None else np.full(n, np.nan)
+        self._id_index: Optional[pd.Index] = None
+
+    def __len__(self) -> int:
+        return len(self.transaction_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate footprint of the numeric columns (ids and names excluded)."""
+        return sum(a.nbytes for a in (self.src, self.dst, self.amount, self.timestamp,
+                                      self.tx_type, self.tax_rate, self.input_tax_credit))
+
+    @classmethod
+    def from_db(cls, db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                stmt=None, chunk_rows: int = LOAD_CHUNK_ROWS) -> "TransactionTable":
+        """
+        Loads straight from the DB cursor in partitions, interning names as it goes,
+        so no ORM objects or per-row models are ever materialized.
+        `start` / `end` bound the half-open range [start, end) and are pushed
+        down to the indexed timestamp column.
+        `stmt` may replace the selection; it must select the same six columns.
+        """
+        stmt = _bounded(stmt if stmt is not None else select_transactions(), start, end)
+        entities = Vocabulary()
+        types = Vocabulary()
+        parts = {k: [] for k in ("ids", "src", "dst", "amount", "ts", "type")}
+
+        result = db.execute(stmt.execution_options(yield_per=chunk_rows))
+        for rows in result.partitions(chunk_rows):
+            ids, srcs, dsts, amounts, stamps, ttypes = zip(*rows)
+            parts["ids"].append(np.array(ids, dtype=object))
+            parts["src"].append(entities.encode(srcs))
+            parts["dst"].append(entities.encode(dsts))
+            parts["amount"].append(np.array(amounts, dtype=np.float64))
+            parts["ts"].append(pd.DatetimeIndex(stamps).as_unit("ns").asi8)
+            parts["type"].append(types.encode([t if t is not None else "" for t in ttypes]))
+
+        if not parts["ids"]:
+            return cls.empty()
+
+        return cls(
+            transaction_ids=np.concatenate(parts["ids"]),
+            src=np.concatenate(parts["src"]),
+            dst=np.concatenate(parts["dst"]),
+            amount=np.concatenate(parts["amount"]),
+            timestamp=np.concatenate(parts["ts"]),
+            tx_type=np.concatenate(parts["type"]),
+            entities=entities.names(),
+            types=types.names(),
+        )
+
+    @classmethod
+    def iter_db(cls, db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                stmt=None, chunk_rows: int = LOAD_CHUNK_ROWS) -> Iterator["TransactionTable"]:
+        """
+        Like from_db, but yields one table per cursor partition, each with its
+        own vocabularies, so a scan over the whole ledger holds one chunk at a time.
+        """
+        stmt = _bounded(stmt if stmt is not None else select_transactions(), start, end)
+        result = db.execute(stmt.execution_options(yield_per=chunk_rows))
+        for rows in result.partitions(chunk_rows):
+            ids, srcs, dsts, amounts, stamps, ttypes = zip(*rows)
+            entities = Vocabulary()
+            types = Vocabulary()
+            yield cls(
+                transaction_ids=np.array(ids, dtype=object),
+                src=entities.encode(srcs),
+                dst=entities.encode(dsts),
+                amount=np.array(amounts, dtype=np.float64),
+                timestamp=pd.DatetimeIndex(stamps).as_unit("ns").asi8,
+                tx_type=types.encode([t if t is not None else "" for t in ttypes]),
+                entities=entities.names(),
+                types=types.names(),
+            )
+
+    @classmethod
+    def empty(cls) -> "TransactionTable":
+        return cls(
+            transaction_ids=np.array([], dtype=object),
+            src=np.array([], dtype=np.int32),
+            dst=np.array([], dtype=np.int32),
+            amount=np.array([], dtype=np.float64),
+            timestamp=np.array([], dtype=np.int64),
+            tx_type=np.array([], dtype=np.int32),
+            entities=np.array([], dtype=object),
+            types=np.array([], dtype=object),
+        )
+
+    def take(self, indices: np.ndarray) -> "TransactionTable":
+        """Row subset sharing the entity / type vocabularies."""
+        return TransactionTable(
+            transaction_ids=self.transaction_ids[indices],
+            src=self.src[indices],
+            dst=self.dst[indices],
+            amount=self.amount[indices],
+            timestamp=self.timestamp[indices],
+            tx_type=self.tx_type[indices],
+            entities=self.entities,
+            types=self.types,
+            tax_rate=self.tax_rate[indices],
+            input_tax_credit=self.input_tax_credit[indices],
+        )
+
+    def slice(self, start: int, stop: int) -> "TransactionTable":
+        """Contiguous row range as views over the same buffers (no copy)."""
+        return TransactionTable(
+            transaction_ids=self.transaction_ids[start:stop],
+            src=self.src[start:stop],
+            dst=self.dst[start:stop],
+            amount=self.amount[start:stop],
+            timestamp=self.timestamp[start:stop],
+            tx_type=self.tx_type[start:stop],
+            entities=self.entities,
+            types=self.types,
+            tax_rate=self.tax_rate[start:stop],
+            input_tax_credit=self.input_tax_credit[start:stop],
+        )
+
+    def sort_by_time(self) -> "TransactionTable":
+        """Time-ordered table (stable, so ties keep load order). No copy if already sorted."""
+        if len(self) < 2 or bool(np.all(self.timestamp[1:] >= self.timestamp[:-1])):
+            return self
+        return self.take(np.argsort(self.timestamp, kind="stable"))
+
+    def content_hash(self) -> str:
+        """
+        SHA-256 over the rows' content by name (id, endpoints, type, amount,
+        timestamp, in row order), so the same transactions hash the same
+        whatever their interned codes or the vocabulary around them.
+        """
+        entity_hash = pd.util.hash_array(self.entities)
+        type_hash = pd.util.hash_array(self.types)
+        sha = hashlib.sha256()
+        for column in (pd.util.hash_array(self.transaction_ids), entity_hash[self.src], entity_hash[self.dst],
+                       type_hash[self.tx_type], self.amount, self.timestamp):
+            sha.update(np.ascontiguousarray(column).tobytes())
+        return sha.hexdigest()
+
+    def lookup(self, transaction_ids: Sequence[str]) -> np.ndarray:
+        """Row positions of the given ids (-1 where unknown)."""
+        if self._id_index is None:
+            self._id_index = pd.Index(self.transaction_ids)
+        return self._id_index.get_indexer(list(transaction_ids))
+
+    def source_names(self) -> np.ndarray:
+        return self.entities[self.src]
+
+    def target_names(self) -> np.ndarray:
+        return self.entities[self.dst]
+
+    def type_names(self) -> np.ndarray:
+        return self.types[self.tx_type]
+
+    def datetimes(self) -> np.ndarray:
+        return self.timestamp.view("datetime64[ns]")
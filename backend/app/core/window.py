@@ -0,0 +1,170 @@
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from typing import Iterator, Optional, Tuple
+from app.core.store import TransactionTable
+from app.core.graph import CompactGraph, build_compact_graph, sliding_window_starts, window_label
+from app.core.index import GraphIndex
+
+
+class SlidingWindowGraph:
+    """
+    Rolling transaction graph maintained incrementally.
+
+    Advancing the window adds the edges of transactions entering it and
+    subtracts those leaving it (weight and count; an edge is removed when its
+    count reaches zero, a node when it has no edges left), so a step costs
+    work proportional to the transactions crossing the window boundaries,
+    not to the window size. `stride` defaults to the window length, as in
+    graph.time_slices.
+
+    `graph` is a live nx.DiGraph keyed by entity name with 'weight' and
+    'count' edge attributes; detectors can run on it after every step.
+    The same deltas update a sorted edge array (keys src * V + dst over the
+    entities' ranks by name) from which `index` builds the window's
+    GraphIndex without re-aggregating the window's transactions.
+    """
+
+    def __init__(self, table: TransactionTable, window: str = "30D", stride: Optional[str] = None):
+        self.table = table.sort_by_time()
+        self.window = window
+        self.stride = stride
+        self.graph = nx.DiGraph()
+        # Entities by name and each entity code's rank among them (edge keys use ranks)
+        self._by_name = np.argsort(self.table.entities, kind='stable')
+        self._rank = np.empty(len(self._by_name), dtype=np.int64)
+        self._rank[self._by_name] = np.arange(len(self._by_name))
+        self._names = self.table.entities[self._by_name]
+        # Live edges sorted by key, with their weight and count; live edges per entity rank
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._weight = np.zeros(0, dtype=np.float64)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._node_edges = np.zeros(len(self.table.entities), dtype=np.int64)
+        # Rows [lo, hi) of the sorted table are inside the window
+        self.lo = 0
+        self.hi = 0
+        ts = self.table.timestamp
+        if len(ts):
+            self.size, self.step, self.starts, self._unit = sliding_window_starts(ts, window, stride)
+        else:
+            self.size, self.step, self.starts, self._unit = 0, 0, np.zeros(0, dtype=np.int64), 'D'
+
+    def __len__(self) -> int:
+        """Number of non-empty windows steps() will yield."""
+        ts = self.table.timestamp
+        los = np.searchsorted(ts, self.starts, side='left')
+        his = np.searchsorted(ts, self.starts + self.size, side='left')
+        return int(np.count_nonzero(his > los))
+
+    def advance_to(self, start: int) -> Tuple[int, int]:
+        """
+        Moves the window to [start, start + size) (start in ns, never backwards).
+        Returns (rows added, rows removed).
+        """
+        ts = self.table.timestamp
+        new_hi = int(np.searchsorted(ts, start + self.size, side='left'))
+        new_lo = int(np.searchsorted(ts, start, side='left'))
+        new_lo = min(new_lo, new_hi)
+
+        # Rows in [hi, new_hi) enter; rows in [lo, new_lo) leave
+        added = self._apply(self.hi, max(self.hi, new_hi), +1)
+        removed = self._apply(self.lo, max(self.lo, new_lo), -1)
+        self.lo, self.hi = max(self.lo, new_lo), max(self.hi, new_hi)
+        return added, removed
+
+    def steps(self) -> Iterator[Tuple[str, nx.DiGraph]]:
+        """
+        Yields (label, graph) for every non-empty window, in order, with the
+        same labels as graph.time_slices. The graph object is the same live
+        instance on every step; copy it to keep a window.
+        """
+        for start in self.starts.tolist():
+            self.advance_to(start)
+            if self.hi > self.lo:
+                yield window_label(start, self.size, self._unit), self.graph
+
+    def window_table(self) -> TransactionTable:
+        return self.table.slice(self.lo, self.hi)
+
+    def compact(self) -> CompactGraph:
+        """Array-backed snapshot of the current window with provenance (O(window) rebuild)."""
+        return build_compact_graph(self.window_table())
+
+    def index(self) -> GraphIndex:
+        """
+        GraphIndex of the current window from the live edge arrays (no sort):
+        nodes and edges come out in the same order as build_compact_graph.
+        The live graph serves networkx consumers.
+        """
+        V = len(self.table.entities)
+        node_ranks = np.flatnonzero(self._node_edges > 0)
+        local = np.zeros(V, dtype=np.int64)
+        local[node_ranks] = np.arange(len(node_ranks))
+        n = len(node_ranks)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(local[self._keys // V], minlength=n), out=indptr[1:])
+        csr = csr_matrix((self._weight.copy(), local[self._keys % V].astype(np.int32), indptr), shape=(n, n))
+        return GraphIndex(self._names[node_ranks], csr, self.graph)
+
+    def _apply(self, start: int, stop: int, sign: int) -> int:
+        if stop <= start:
+            return 0
+        t = self.table
+        V = len(t.entities)
+        src = self._rank[t.src[start:stop]]
+        dst = self._rank[t.dst[start:stop]]
+        # Aggregate the delta per (src, dst) pair first, then touch each edge once
+        pair = src * V + dst
+        pairs, inverse = np.unique(pair, return_inverse=True)
+        weights = np.bincount(inverse, weights=t.amount[start:stop], minlength=len(pairs))
+        counts = np.bincount(inverse, minlength=len(pairs))
+
+        self._apply_arrays(pairs, weights, counts, V, sign)
+
+        names = self._names
+        G = self.graph
+        for p, w, c in zip(pairs.tolist(), weights.tolist(), counts.tolist()):
+            u, v = names[p // V], names[p % V]
+            if sign > 0:
+                if G.has_edge(u, v):
+                    data = G[u][v]
+                    data['weight'] += w
+                    data['count'] += c
+                else:
+                    G.add_edge(u, v, weight=w, count=c)
+            else:
+                data = G[u][v]
+                data['count'] -= c
+                if data['count'] <= 0:
+                    G.remove_edge(u, v)
+                    for node in (u, v):
+                        if node in G and G.degree(node) == 0:
+                            G.remove_node(node)
+                else:
+                    data['weight'] -= w
+        return stop - start
+
+    def _apply_arrays(self, pairs: np.ndarray, weights: np.ndarray, counts: np.ndarray, V: int, sign: int):
+        """Merges one aggregated (sorted, unique) delta into the live edge arrays."""
+        pos = np.searchsorted(self._keys, pairs)
+        found = pos < len(self._keys)
+        found[found] = self._keys[pos[found]] == pairs[found]
+        if sign > 0:
+            self._weight[pos[found]] += weights[found]
+            self._count[pos[found]] += counts[found]
+            new = ~found
+            self._keys = np.insert(self._keys, pos[new], pairs[new])
+            self._weight = np.insert(self._weight, pos[new], weights[new])
+            self._count = np.insert(self._count, pos[new], counts[new])
+            changed = pairs[new]
+        else:
+            # Leaving rows always entered earlier, so every pair is live
+            self._count[pos] -= counts
+            self._weight[pos] -= weights
+            gone = pos[self._count[pos] <= 0]
+            changed = self._keys[gone]
+            self._keys = np.delete(self._keys, gone)
+            self._weight = np.delete(self._weight, gone)
+            self._count = np.delete(self._count, gone)
+        np.add.at(self._node_edges, changed // V, sign)
+        np.add.at(self._node_edges, changed % V, sign)
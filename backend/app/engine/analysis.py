@@ -0,0 +1,328 @@
+import pandas as pd
+from typing import Callable, List, Optional
+from datetime import datetime
+from sqlalchemy.orm import Session
+from app.models import Anomaly
+from app.models_orm import AnomalyDB
+from app.core import graph, hashing, store
+from app.core.cache import graph_cache
+from app.core.index import GraphIndex
+from app.core.window import SlidingWindowGraph
+from app.engine import approximate, detectors, slices, temporal
+from app.engine.pipeline import slice_pipeline
+from app.engine.overlays import TaxOverlay
+
+
+class AnalysisError(Exception):
+    """
+    Client-facing analysis failure (mapped to an HTTP error by the API).
+    Picklable, so it survives the trip back from a worker process.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class AnalysisCancelled(Exception):
+    """Raised between slices when the caller asked to stop."""
+
+
+def _calendar_indexes(views, slice_keys: dict):
+    """
+    (label, GraphIndex) per calendar slice, from the graph cache; networkx only
+    built on demand. Each slice's cache key is recorded in `slice_keys`.
+    """
+    for key, view in views:
+        print(f"DEBUG: Building graph for slice {key} with {len(view)} txs")
+        view_key = view.content_hash()
+        slice_keys[key] = view_key
+        yield key, GraphIndex.from_compact(graph_cache.compact(view, key=view_key),
+                                           networkx=lambda view=view, view_key=view_key: graph_cache.networkx(view, key=view_key))
+
+
+def _rolling_indexes(rolling: SlidingWindowGraph):
+    """(label, GraphIndex) per sliding window, from the incrementally maintained window edges."""
+    for key, _ in rolling.steps():
+        yield key, rolling.index()
+
+
+def _persist_anomalies(db: Session, anomalies: List[Anomaly]):
+    # Re-analysis (e.g. after an append ingest) replaces previously stored rows with the same id
+    persisted = {a.anomaly_id: a for a in anomalies}
+    if persisted:
+        db.query(AnomalyDB).filter(AnomalyDB.anomaly_id.in_(list(persisted))).delete(synchronize_session=False)
+    for a in persisted.values():
+        db.add(AnomalyDB(
+            anomaly_id=a.anomaly_id,
+            anomaly_type=a.anomaly_type,
+            severity=a.severity,
+            description=a.description,
+            entities_involved=a.entities_involved,
+            evidence_data=a.evidence_data,
+            confidence=a.confidence,
+            detection_method=a.detection_method,
+            explanation_metadata=a.explanation_metadata,
+            time_slice=a.evidence_data.get("slice")
+        ))
+    db.commit()
+
+
+def _analyze_approximate(db: Session, start: Optional[datetime], end: Optional[datetime],
+                         report: Callable[..., None], is_cancelled: Optional[Callable[[], bool]]) -> dict:
+    """
+    Full-history wash trading and structuring in bounded memory: the ledger
+    is streamed through the sketches of approximate.SketchScreen, then once
+    more to profile the candidate hubs (approximate.HubProfiles), and only
+    the remaining candidates are streamed into the exact detectors.
+    """
+    report(stage="sketching")
+    screen = approximate.SketchScreen()
+    for chunk in store.TransactionTable.iter_db(db, start=start, end=end):
+        if is_cancelled is not None and is_cancelled():
+            raise AnalysisCancelled(f"Cancelled after sketching {screen.transactions} transactions")
+        screen.add(chunk)
+        report(transactions_sketched=screen.transactions)
+    if screen.transactions == 0:
+        if start is not None or end is not None:
+            raise AnalysisError(400, "No transactions in the requested range")
+        raise AnalysisError(400, "No data ingested")
+    print(f"DEBUG: sketched {screen.transactions} transactions in {screen.stats()['memory_bytes']} bytes")
+
+    report(stage="profiling")
+    profiles = approximate.HubProfiles(screen.structuring_candidates())
+    if len(profiles):
+        for chunk in store.TransactionTable.iter_db(db, start=start, end=end):
+            if is_cancelled is not None and is_cancelled():
+                raise AnalysisCancelled("Cancelled while profiling candidate hubs")
+            profiles.add(chunk)
+
+    report(stage="verifying")
+    anomalies = approximate.verify(db, screen, profiles, start=start, end=end)
+    _persist_anomalies(db, anomalies)
+    return {
+        "range": {"start": start, "end": end, "mode": "approximate", "transaction_count": screen.transactions},
+        "anomalies": anomalies,
+        "results_hash": hashing.hash_content([a.dict() for a in anomalies]),
+        "sketch_stats": dict(screen.stats(), hub_profiles=profiles.stats()),
+    }
+
+
+def analyze(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    window: str = 'M',
+    stride: Optional[str] = None,
+    cycle_duration: str = temporal.TEMPORAL_CYCLE_MAX_DURATION,
+    mode: str = 'exact',
+    gnn_training: str = slices.GNN_TRAINING,
+    progress: Optional[Callable[..., None]] = None,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> dict:
+    """
+    Full anomaly analysis over transactions in [start, end) (naive UTC bounds,
+    everything when unbounded), sliced by `window` (calendar or sliding, see
+    graph.time_slices). Round-trips are also searched over the whole range,
+    closing within `cycle_duration`. Persists the anomalies and
+    returns the API payload.
+    `mode='approximate'` instead screens the whole range with sketches for
+    wash trading and structuring only (see _analyze_approximate); window,
+    stride and cycle_duration do not apply.
+    `gnn_training` picks how the slice GNN is trained (see
+    slices.GNN_TRAINING_MODES): per slice, once on a baseline window, or
+    once and then fine-tuned slice by slice.
+    `progress(**fields)` receives stage / per-slice updates and `is_cancelled()`
+    is polled between slices.
+    """
+    print(f"DEBUG: entering analyze (start={start}, end={end}, window={window}, stride={stride})")
+    report = progress or (lambda **_: None)
+    if mode == 'approximate':
+        return _analyze_approximate(db, start, end, report, is_cancelled)
+    if mode != 'exact':
+        raise AnalysisError(400, f"Invalid mode '{mode}'. Use 'exact' or 'approximate'")
+    if gnn_training not in slices.GNN_TRAINING_MODES:
+        raise AnalysisError(400, f"Invalid gnn_training '{gnn_training}'. Use one of {', '.join(slices.GNN_TRAINING_MODES)}")
+    try:
+        if pd.Timedelta(cycle_duration).value <= 0:
+            raise ValueError
+    except ValueError:
+        raise AnalysisError(400, f"Invalid cycle_duration '{cycle_duration}'. Use a positive length like '30D' or '12h'")
+    report(stage="loading")
+    
+    # Fetch from DB straight into the shared columnar table
+    table = store.TransactionTable.from_db(db, start=start, end=end)
+    if len(table) == 0:
+        if start is not None or end is not None:
+            raise AnalysisError(400, "No transactions in the requested range")
+        raise AnalysisError(400, "No data ingested")
+    print(f"DEBUG: loaded {len(table)} transactions ({table.nbytes} bytes of columns)")
+    
+    print("DEBUG: building time-sliced graphs")
+    slice_keys = {}
+    try:
+        if window in graph.CALENDAR_WINDOWS:
+            views = graph.time_slices(table, window=window, stride=stride)
+            time_slices = _calendar_indexes(views, slice_keys)
+            slices_total = len(views)
+        else:
+            # Sliding windows: one graph advanced step by step instead of a rebuild per window
+            rolling = SlidingWindowGraph(table, window=window, stride=stride)
+            time_slices = _rolling_indexes(rolling)
+            slices_total = len(rolling)
+    except ValueError as e:
+        raise AnalysisError(400, str(e))
+    
+    # One model for every slice: trained up front on the baseline window
+    gnn_state = None
+    if gnn_training != "per_slice":
+        report(stage="gnn_baseline")
+        gnn_state = slices.train_gnn_baseline(table)
+    
+    raw_anomalies = []
+    all_gnn_scores = []
+    pipeline = slice_pipeline()
+    
+    report(stage="slices", slices_total=slices_total, slices_done=0)
+    
+    # Analyze each slice (fanned out to the slice workers when configured), in chronological order
+    slices_done = 0
+    workers = min(slices.ANALYSIS_SLICE_WORKERS, slices_total)
+    results = slices.analyze_slices(time_slices, pipeline, workers=workers, is_cancelled=is_cancelled,
+                                    gnn_state=gnn_state,
+                                    finetune_epochs=slices.GNN_FINETUNE_EPOCHS if gnn_training == "finetune" else 0)
+    try:
+        for slice_key, result in results:
+            raw_anomalies.extend(result.anomalies)
+            all_gnn_scores.extend(result.gnn_scores)
+            slices_done += 1
+            report(current_slice=slice_key, slices_done=slices_done)
+    finally:
+        results.close()
+    if slices_done < slices_total and is_cancelled is not None and is_cancelled():
+        raise AnalysisCancelled(f"Cancelled after {slices_done} of {slices_total} slices")
+
+    # Time-respecting rings over the whole range (not bounded by slices)
+    if is_cancelled is not None and is_cancelled():
+        raise AnalysisCancelled("Cancelled before temporal cycle search")
+    report(stage="temporal_cycles", current_slice=None)
+    print("DEBUG: detect temporal cycles")
+    tcirc_anomalies = detectors.detect_temporal_cycles(table, max_duration=cycle_duration)
+    for c in tcirc_anomalies:
+        span = f"{c.evidence_data['first_transaction_at'][:10]}/{c.evidence_data['last_transaction_at'][:10]}"
+        c.anomaly_id = f"DETERM-TCIRC-{hashing.hash_content(c.evidence_data['transaction_ids'])[:16]}"
+        c.evidence_data["slice"] = span
+        c.detection_method = "DETERMINISTIC"
+        c.confidence = "Low" # Placeholder
+        c.explanation_metadata = {
+            "metric": "Time-Ordered Loop",
+            "value": f"{len(c.entities_involved)} Entities in {c.evidence_data['duration_hours']:.1f}h",
+            "context": "Funds returned to origin through consecutive transfers"
+        }
+        raw_anomalies.append(c)
+
+    report(stage="finalizing", current_slice=None)
+    
+    # Post-Processing: Temporal Persistence & Confidence
+    signature_counts = {}
+    first_seen = {}
+    
+    for a in raw_anomalies:
+        sig = (a.anomaly_type, frozenset(a.entities_involved))
+        if sig not in signature_counts:
+            signature_counts[sig] = 0
+            first_seen[sig] = a.evidence_data.get("slice", "Unknown")
+        signature_counts[sig] += 1
+        
+    final_anomalies = []
+    for a in raw_anomalies:
+        sig = (a.anomaly_type, frozenset(a.entities_involved))
+        count = signature_counts[sig]
+        
+        # Confidence Evolution
+        if count >= 3:
+            a.confidence = "High"
+        elif count == 2:
+            a.confidence = "Medium"
+        else:
+            a.confidence = "Low"
+        
+        # Watchlist Status for Learned Anomalies
+        if a.detection_method == "LEARNED":
+             if a.confidence == "Low":
+                 a.anomaly_type = "WATCHLIST (Possible Anomaly)" # Change type/title for UI
+             elif a.confidence == "Medium":
+                 a.anomaly_type = "LEARNED ANOMALY (Evolving)"
+        
+        if count > 1:
+             if "Persists" not in a.description:
+                a.description += f" [First observed: {first_seen[sig]}]"
+            
+        final_anomalies.append(a)
+    
+    # --- 3. APPLY OBSERVATIONAL TAX OVERLAY ---
+    # This layer never creates anomalies, only adds explanatory context if enabled logic (GST/VAT) matches
+    print("DEBUG: applying tax overlay")
+    overlay = TaxOverlay()
+    anomalies = overlay.apply(final_anomalies, table)
+            
+    # For snapshot, we still take the full graph for the overview
+    table_key = table.content_hash()
+    full = graph_cache.compact(table, key=table_key)
+    G = graph_cache.networkx(table, key=table_key)
+    print(f"DEBUG: graph cache {graph_cache.stats()}")
+    print("DEBUG: creating snapshot")
+    # Calendar slices were cached under their content hash while analyzing: reuse them
+    snapshot = graph.snapshot_graph(full, window=window, slice_graph=lambda label, view: graph_cache.compact(
+        view, key=slice_keys.get(label) or view.content_hash()))
+    
+    # Persist Anomalies
+    _persist_anomalies(db, anomalies)
+    
+    # Hash the result set
+    results_hash = hashing.hash_content([a.dict() for a in anomalies])
+    
+    # Map max GNN scores to edges for visualization
+    edge_score_map = {}
+    for score_item in all_gnn_scores:
+        key = f"{score_item['source']}-{score_item['target']}"
+        # Keep max score across slices
+        if key not in edge_score_map or score_item['score'] > edge_score_map[key]:
+            edge_score_map[key] = score_item['score']
+
+    # Construct safe graph data
+    nodes = [{"data": {"id": str(n), "label": str(n)}} for n in G.nodes()]
+    edges = []
+    
+    for u, v, d in G.edges(data=True):
+         edge_key = f"{u}-{v}"
+         gnn_score = edge_score_map.get(edge_key, 0.0)
+         
+         edge_data = {
+             "source": str(u), 
+             "target": str(v), 
+             "label": f"{d.get('count', 1)} tx",
+             "gnn_score": gnn_score,
+             "id": edge_key,
+             "amount": d.get("weight", 0),
+             "types": d.get("types", []),
+             "dates": d.get("dates", [])
+         }
+         edges.append({"data": edge_data})
+    
+    graph_data = {
+        "elements": nodes + edges
+    }
+    
+    return {
+        "snapshot": snapshot,
+        "range": {"start": start, "end": end, "window": window, "stride": stride, "cycle_duration": cycle_duration,
+                  "gnn_training": gnn_training if gnn_state is not None else "per_slice", "transaction_count": len(table)},
+        "anomalies": anomalies,
+        "results_hash": results_hash,
+        # Baseline weights when shared by the slices, else a fixed tag for per-slice models
+        "model_hash": hashing.hash_bytes(gnn_state) if gnn_state is not None else hashing.hash_content("PoEC_GNN_v1.0")[:66],
+        "detector_stats": pipeline.report(),
+        "graph_data": graph_data
+    }
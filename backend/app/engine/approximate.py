@@ -0,0 +1,386 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from scipy.sparse import csr_matrix
+from typing import Callable, Dict, FrozenSet, Iterator, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.models import Anomaly
+from app.models_orm import TransactionDB
+from app.core import store
+from app.core.index import GraphIndex
+from app.core.sketches import CountMinSketch, HyperLogLogs, SpaceSaving, hash_names, pair_keys, unordered_pair_keys
+from app.engine import detectors
+from app.engine.slices import label_structuring, label_wash
+
+# Count-min sketch of directed pair volumes: counters per row, and rows
+SKETCH_CM_WIDTH = int(os.getenv("SKETCH_CM_WIDTH", str(2**20)))
+SKETCH_CM_DEPTH = int(os.getenv("SKETCH_CM_DEPTH", "4"))
+
+# Heavy-hitter counters: entity pairs by volume, entities by payments sent / received
+SKETCH_PAIR_CAPACITY = int(os.getenv("SKETCH_PAIR_CAPACITY", "2000"))
+SKETCH_NODE_CAPACITY = int(os.getenv("SKETCH_NODE_CAPACITY", "2000"))
+
+# HyperLogLog registers per tracked entity are 2**SKETCH_HLL_PRECISION
+SKETCH_HLL_PRECISION = int(os.getenv("SKETCH_HLL_PRECISION", "8"))
+
+# Upper bound on the edges aggregated at once while verifying candidate hubs
+SKETCH_VERIFY_EDGES = int(os.getenv("SKETCH_VERIFY_EDGES", "1000000"))
+
+# Standard errors added to (or taken from) a counterparty estimate before a hub is ruled out
+HLL_SLACK_SIGMAS = 3
+
+# Relative slack on the amount-spread bound, so float rounding never rules out a borderline hub
+MOMENT_SLACK = 1e-9
+
+# Slice label of approximate-mode anomalies (the whole range, as window=ALL)
+APPROXIMATE_SLICE = "ALL"
+
+
+class SketchScreen:
+    """
+    Bounded-memory pre-screen for wash trading and structuring over a ledger
+    too large to aggregate per edge, fed one TransactionTable chunk at a time.
+
+    - `volume`: count-min sketch of the volume of every directed pair;
+    - `pairs`: heavy-hitter entity pairs (either direction) by volume;
+    - `senders` / `receivers`: heavy-hitter entities by payments, each with a
+      HyperLogLog of its distinct counterparties since it took its slot
+      (`fan_out` / `fan_in`, one per heavy-hitter slot).
+
+    Memory is fixed by the sketch sizes, whatever the number of transactions,
+    entities or edges. Only tracked pairs and entities can become candidates:
+    one under its heavy-hitter floor may be missed, and `stats()["coverage"]`
+    reports whether the floors are low enough to rule that out and which
+    fraction of the volume / payments went unscreened. A tracked candidate is
+    only dropped when the sketch bounds show it cannot meet the detector
+    thresholds; hubs are narrowed further by HubProfiles, and `verify`
+    re-checks what is left exactly.
+    """
+
+    def __init__(self, width: Optional[int] = None, depth: Optional[int] = None,
+                 pair_capacity: Optional[int] = None, node_capacity: Optional[int] = None,
+                 precision: Optional[int] = None):
+        # Sizes default to the SKETCH_* settings, read at call time
+        width, depth = width or SKETCH_CM_WIDTH, depth or SKETCH_CM_DEPTH
+        pair_capacity, node_capacity = pair_capacity or SKETCH_PAIR_CAPACITY, node_capacity or SKETCH_NODE_CAPACITY
+        precision = precision or SKETCH_HLL_PRECISION
+        self.volume = CountMinSketch(width, depth)
+        self.pairs = SpaceSaving(pair_capacity)
+        self.senders = SpaceSaving(node_capacity)
+        self.receivers = SpaceSaving(node_capacity)
+        self.fan_out = HyperLogLogs(node_capacity, precision)
+        self.fan_in = HyperLogLogs(node_capacity, precision)
+        self.transactions = 0
+
+    def add(self, table: store.TransactionTable):
+        n = len(table)
+        if n == 0:
+            return
+        entity_hash = hash_names(table.entities)
+        src, dst = entity_hash[table.src], entity_hash[table.dst]
+        self.volume.update(pair_keys(src, dst), table.amount)
+
+        # Self-transfers are never wash trading; a pair is labelled by its names in hash order
+        other = np.flatnonzero(src != dst)
+        lo = np.where(src < dst, table.src, table.dst)[other]
+        hi = np.where(src < dst, table.dst, table.src)[other]
+        labels = np.empty(len(other), dtype=object)
+        labels[:] = list(zip(table.entities[lo], table.entities[hi]))
+        self.pairs.update(unordered_pair_keys(src[other], dst[other]), table.amount[other], labels)
+
+        ones = np.ones(n)
+        for counters, hlls, hub, counterparty, names in ((self.senders, self.fan_out, src, dst, table.src),
+                                                          (self.receivers, self.fan_in, dst, src, table.dst)):
+            # A slot that changes hands starts empty: it only counts its new entity
+            hlls.reset(counters.update(hub, ones, table.entities[names]))
+            slots = counters.slots(hub)
+            tracked = slots >= 0
+            hlls.add(slots[tracked], counterparty[tracked])
+        self.transactions += n
+
+    def wash_candidates(self, min_volume: float, max_net_ratio: float) -> Dict[FrozenSet[str], dict]:
+        """
+        Heavy-hitter pairs that may pass detect_wash_trading: traded both ways,
+        volume upper bound above `min_volume`, and net flow lower bound under
+        `max_net_ratio` of it. Keyed by the pair's entity names.
+        """
+        n = self.pairs.size
+        if n == 0:
+            return {}
+        lo = hash_names([a for a, _ in self.pairs.labels[:n]])
+        hi = hash_names([b for _, b in self.pairs.labels[:n]])
+        forward, backward = self.volume.query(pair_keys(lo, hi)), self.volume.query(pair_keys(hi, lo))
+        error = self.volume.error_bound
+        total = np.minimum(self.pairs.counts[:n], forward + backward)
+        net = np.maximum(np.abs(forward - backward) - error, 0.0)
+        keep = (forward > 0) & (backward > 0) & (total > min_volume) & (net < total * max_net_ratio)
+        return {
+            frozenset(self.pairs.labels[i]): {
+                "estimated_total_volume": float(self.pairs.counts[i]),
+                "total_volume_overestimate_max": float(self.pairs.errors[i]),
+                "estimated_directed_volumes": [float(forward[i]), float(backward[i])],
+                "directed_volume_error_bound": error,
+                "confidence": self.volume.confidence,
+            }
+            for i in np.flatnonzero(keep).tolist()
+        }
+
+    def structuring_candidates(self) -> Dict[str, Dict[str, dict]]:
+        """
+        Heavy-hitter hubs that may reach STRUCTURING_MIN_COUNTERPARTIES:
+        {"Fan-Out": {entity: estimate}, "Fan-In": {...}}. The upper bound adds
+        the HyperLogLog slack and the payments the hub may have made before it
+        was tracked (each could be a new counterparty), capped by its payments.
+        """
+        hubs = {}
+        for pattern, counters, hlls in (("Fan-Out", self.senders, self.fan_out), ("Fan-In", self.receivers, self.fan_in)):
+            n = counters.size
+            estimate = hlls.estimate(np.arange(n))
+            upper = np.minimum(counters.counts[:n],
+                               estimate * (1 + HLL_SLACK_SIGMAS * hlls.relative_error) + counters.errors[:n])
+            keep = np.flatnonzero(upper >= detectors.STRUCTURING_MIN_COUNTERPARTIES)
+            hubs[pattern] = {
+                counters.labels[i]: {
+                    "estimated_counterparties": round(float(estimate[i]), 1),
+                    "counterparties_relative_error": round(hlls.relative_error, 4),
+                    "counterparties_upper_bound": round(float(upper[i]), 1),
+                    "estimated_payments": float(counters.counts[i]),
+                    "payments_overestimate_max": float(counters.errors[i]),
+                }
+                for i in keep.tolist()
+            }
+        return hubs
+
+    def coverage(self) -> dict:
+        """
+        What the heavy-hitter floors may hide. A pair or hub is always tracked
+        once its true volume / payments exceed the floor, so wash pairs
+        (volume > the wash minimum) or structuring hubs (at least
+        STRUCTURING_MIN_COUNTERPARTIES payments) cannot be missed while the
+        floor is below that; otherwise the unscreened fractions are upper
+        bounds on the share of volume / payments whose pair or entity was
+        not tracked, i.e. could hide a missed candidate.
+        """
+        min_volume, _ = detectors.wash_thresholds()
+
+        def unscreened(counters: SpaceSaving) -> float:
+            if counters.total <= 0:
+                return 0.0
+            screened = float(np.sum(counters.counts[:counters.size] - counters.errors[:counters.size]))
+            return round(max(0.0, 1.0 - screened / counters.total), 6)
+
+        return {
+            "wash_pairs_complete": self.pairs.floor <= min_volume,
+            "structuring_hubs_complete": {
+                "senders": self.senders.floor < detectors.STRUCTURING_MIN_COUNTERPARTIES,
+                "receivers": self.receivers.floor < detectors.STRUCTURING_MIN_COUNTERPARTIES,
+            },
+            "unscreened_volume_fraction": unscreened(self.pairs),
+            "unscreened_payment_fraction": {"senders": unscreened(self.senders),
+                                            "receivers": unscreened(self.receivers)},
+        }
+
+    def stats(self) -> dict:
+        """Sketch sizes and guarantees: heavy hitters above the floors are never missed (see coverage)."""
+        return {
+            "transactions": self.transactions,
+            "total_volume": self.volume.total,
+            "memory_bytes": sum(s.nbytes for s in (self.volume, self.pairs, self.senders, self.receivers,
+                                                   self.fan_out, self.fan_in)),
+            "count_min": {"width": self.volume.width, "depth": self.volume.depth,
+                          "error_bound": self.volume.error_bound, "confidence": self.volume.confidence},
+            "pairs_tracked": self.pairs.size,
+            "pair_volume_floor": self.pairs.floor,
+            "entities_tracked": {"senders": self.senders.size, "receivers": self.receivers.size},
+            "payment_count_floor": {"senders": self.senders.floor, "receivers": self.receivers.floor},
+            "hll_relative_error": round(self.fan_out.relative_error, 4),
+            "coverage": self.coverage(),
+        }
+
+
+class HubFigures:
+    """
+    Exact payment figures of a fixed list of hubs in one direction: payments,
+    total and sum of squared amounts, smallest amount, and a HyperLogLog of
+    distinct counterparties. Memory is fixed by the number of hubs.
+    """
+
+    def __init__(self, names: List[str], precision: int = SKETCH_HLL_PRECISION):
+        n = len(names)
+        self._index = pd.Index(hash_names(names))
+        self.payments = np.zeros(n)
+        self.total = np.zeros(n)
+        self.squares = np.zeros(n)
+        self.low = np.full(n, np.inf)
+        self.counterparties = HyperLogLogs(n, precision)
+
+    def add(self, hub: np.ndarray, counterparty: np.ndarray, amount: np.ndarray):
+        """Counts the payments whose hub (name hash) is one of ours."""
+        slots = self._index.get_indexer(hub)
+        tracked = slots >= 0
+        slots, amount = slots[tracked], amount[tracked]
+        n = len(self.payments)
+        self.payments += np.bincount(slots, minlength=n)
+        self.total += np.bincount(slots, weights=amount, minlength=n)
+        self.squares += np.bincount(slots, weights=amount * amount, minlength=n)
+        np.minimum.at(self.low, slots, amount)
+        self.counterparties.add(slots, counterparty[tracked])
+
+    def may_pass(self) -> np.ndarray:
+        """
+        Hubs whose figures leave detect_structuring a way to flag them, taking
+        the fewest / most counterparties d they can have (HyperLogLog estimate
+        minus / plus its slack, within 1..payments): at most
+        STRUCTURING_MIN_COUNTERPARTIES is too few, a mean edge weight total / d
+        at most STRUCTURING_MIN_MEAN is dust. With non-negative amounts, edge
+        weights (sums of payments) have a sum of squares of at least the
+        payments' `squares`, while a coefficient of variation under c needs
+        that sum times d below (1 + c^2) * total^2.
+        """
+        n = len(self.payments)
+        estimate = self.counterparties.estimate(np.arange(n))
+        slack = HLL_SLACK_SIGMAS * self.counterparties.relative_error
+        upper = np.minimum(self.payments, estimate * (1 + slack))
+        lower = np.clip(estimate * (1 - slack), 1.0, np.maximum(self.payments, 1.0))
+        limit = (1 + detectors.STRUCTURING_MAX_CV ** 2) * self.total ** 2 * (1 + MOMENT_SLACK)
+        spread = (self.low >= 0) & (self.squares * lower >= limit)
+        dust = self.total <= detectors.STRUCTURING_MIN_MEAN * lower
+        return (upper >= detectors.STRUCTURING_MIN_COUNTERPARTIES) & ~spread & ~dust
+
+
+class HubProfiles:
+    """
+    Second, fixed-memory pass over the ledger for the screen's candidate
+    hubs: HubFigures of every hub in both directions (the hub's whole
+    history, unlike the heavy-hitter slots), fed one chunk at a time.
+    `candidates` keeps the hubs whose exact figures may still pass
+    detect_structuring, so only those are verified edge by edge.
+    """
+
+    def __init__(self, hubs: Dict[str, Dict[str, dict]], precision: int = SKETCH_HLL_PRECISION):
+        self.hubs = hubs
+        self.names = sorted(set(hubs["Fan-Out"]) | set(hubs["Fan-In"]))
+        self.fan_out = HubFigures(self.names, precision)
+        self.fan_in = HubFigures(self.names, precision)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, table: store.TransactionTable):
+        if len(table) == 0:
+            return
+        entity_hash = hash_names(table.entities)
+        src, dst = entity_hash[table.src], entity_hash[table.dst]
+        self.fan_out.add(src, dst, table.amount)
+        self.fan_in.add(dst, src, table.amount)
+
+    def candidates(self) -> Dict[str, Dict[str, dict]]:
+        """The screen's hubs ({pattern: {entity: estimate}}) that may pass, with their exact payments added."""
+        refined = {}
+        for pattern, figures in (("Fan-Out", self.fan_out), ("Fan-In", self.fan_in)):
+            passing = figures.may_pass()
+            refined[pattern] = {}
+            for i, name in enumerate(self.names):
+                if name in self.hubs[pattern] and passing[i]:
+                    refined[pattern][name] = dict(self.hubs[pattern][name], payments=int(figures.payments[i]))
+        return refined
+
+    def stats(self) -> dict:
+        """Hubs profiled and hubs left for exact verification, per pattern."""
+        return {
+            "profiled": {pattern: len(hubs) for pattern, hubs in self.hubs.items()},
+            "verified": {pattern: len(hubs) for pattern, hubs in self.candidates().items()},
+        }
+
+    def edges_upper(self, names: List[str]) -> np.ndarray:
+        """Upper bound on each hub's edges: its payments sent plus received."""
+        pos = np.searchsorted(self.names, names)
+        return self.fan_out.payments[pos] + self.fan_in.payments[pos]
+
+
+def _stream_edges(db: Session, stmt, start: Optional[datetime], end: Optional[datetime],
+                  keep: Optional[Callable[[store.TransactionTable], np.ndarray]] = None) -> GraphIndex:
+    """
+    GraphIndex of the edge totals of the transactions `stmt` selects. Rows are
+    streamed (TransactionTable.iter_db) and folded chunk by chunk into running
+    per-(source, target) sums, so memory follows the edges, not the
+    transactions. `keep(chunk)` returns the rows of a chunk to count.
+    """
+    edges: Optional[pd.Series] = None
+    for chunk in store.TransactionTable.iter_db(db, start=start, end=end, stmt=stmt):
+        rows = keep(chunk) if keep is not None else np.arange(len(chunk))
+        part = pd.Series(chunk.amount[rows], index=pd.MultiIndex.from_arrays(
+            [chunk.entities[chunk.src[rows]], chunk.entities[chunk.dst[rows]]]))
+        part = part if edges is None else pd.concat([edges, part])
+        edges = part.groupby(level=[0, 1], sort=False).sum()
+    if edges is None or len(edges) == 0:
+        return GraphIndex(np.array([], dtype=object), csr_matrix((0, 0)))
+    src, dst = edges.index.get_level_values(0), edges.index.get_level_values(1)
+    names = src.append(dst).unique().sort_values()
+    n = len(names)
+    csr = csr_matrix((edges.to_numpy(), (names.get_indexer(src), names.get_indexer(dst))), shape=(n, n))
+    return GraphIndex(np.asarray(names, dtype=object), csr)
+
+
+def _hub_batches(names: List[str], bounds: np.ndarray, budget: int = SKETCH_VERIFY_EDGES) -> Iterator[List[str]]:
+    """Consecutive groups of hubs whose edge upper bounds add up to at most `budget` (a larger hub goes alone)."""
+    batch, edges = [], 0.0
+    for name, bound in zip(names, bounds.tolist()):
+        if batch and edges + bound > budget:
+            yield batch
+            batch, edges = [], 0.0
+        batch.append(name)
+        edges += bound
+    if batch:
+        yield batch
+
+
+def verify(db: Session, screen: SketchScreen, profiles: HubProfiles, start: Optional[datetime] = None,
+           end: Optional[datetime] = None) -> List[Anomaly]:
+    """
+    Exact check of the candidates: wash pairs from the screen, hubs from
+    their profiles. Their transactions are streamed from the database and
+    only per-edge totals are kept (see _stream_edges), and the existing
+    detectors run on that subgraph. Wash pairs are verified together (two
+    edges each), hubs in batches of at most SKETCH_VERIFY_EDGES edges by
+    their payment counts. A candidate pair's or hub's edges are all in its
+    subgraph, so its figures are those of a window=ALL analysis; the sketch
+    estimates and their error bounds are added as evidence_data["sketch"].
+    """
+    anomalies = []
+    min_volume, max_net_ratio = detectors.wash_thresholds()
+    wash = screen.wash_candidates(min_volume, max_net_ratio)
+    print(f"DEBUG: {len(wash)} wash trading candidate pairs from the sketches")
+    if wash:
+        names = sorted({name for pair in wash for name in pair})
+        pairs = [tuple(pair) for pair in wash]
+        wanted = unordered_pair_keys(hash_names([a for a, _ in pairs]), hash_names([b for _, b in pairs]))
+
+        def candidate_rows(chunk: store.TransactionTable) -> np.ndarray:
+            entity_hash = hash_names(chunk.entities)
+            return np.flatnonzero(np.isin(unordered_pair_keys(entity_hash[chunk.src], entity_hash[chunk.dst]), wanted))
+
+        stmt = store.select_transactions().where(TransactionDB.source_entity.in_(names),
+                                                 TransactionDB.target_entity.in_(names))
+        for a in detectors.detect_wash_trading(_stream_edges(db, stmt, start, end, keep=candidate_rows)):
+            a.evidence_data["sketch"] = wash[frozenset(a.entities_involved)]
+            anomalies.append(label_wash(a, APPROXIMATE_SLICE))
+
+    hubs = profiles.candidates()
+    print(f"DEBUG: {len(hubs['Fan-Out'])} fan-out and {len(hubs['Fan-In'])} fan-in candidate hubs after profiling")
+    names = sorted(set(hubs["Fan-Out"]) | set(hubs["Fan-In"]))
+    for batch in _hub_batches(names, profiles.edges_upper(names)):
+        stmt = store.select_transactions().where(or_(TransactionDB.source_entity.in_(batch),
+                                                     TransactionDB.target_entity.in_(batch)))
+        members = set(batch)
+        for s in detectors.detect_structuring(_stream_edges(db, stmt, start, end)):
+            # Only the batch's hubs had every edge loaded
+            hub = s.entities_involved[0]
+            sketch = hubs[s.evidence_data["pattern"]].get(hub)
+            if hub not in members or sketch is None:
+                continue
+            s.evidence_data["sketch"] = sketch
+            anomalies.append(label_structuring(s, APPROXIMATE_SLICE))
+    return anomalies
@@ -0,0 +1,280 @@
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix, triu
+from scipy.sparse.csgraph import connected_components
+from typing import List, Optional, Tuple, Union
+from app.core.graph import CompactGraph
+from app.core.index import GraphIndex
+
+# Smallest group worth reporting
+DENSE_MIN_SIZE = 4
+
+# Wedges checked per vectorized step of the triangle listing (bounds its memory)
+TRIANGLE_WEDGE_CHUNK = 1 << 20
+
+
+class DenseGroup:
+    """Candidate group: member node ids, its directed edge count and density, and where it came from."""
+
+    def __init__(self, members: np.ndarray, edges: int, source: str):
+        self.members = members
+        self.edges = edges
+        self.source = source
+        size = len(members)
+        self.density = edges / (size * (size - 1)) if size > 1 else 0.0
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def score(self, prior_max: float) -> float:
+        """
+        Where the density sits between the context's highest expected
+        density (0) and a complete graph (1); negative when within the prior.
+        """
+        return (self.density - prior_max) / (1.0 - prior_max) if prior_max < 1.0 else 0.0
+
+
+def core_numbers(adj: csr_matrix) -> np.ndarray:
+    """
+    k-core number of every node by bucket-queue peeling (Batagelj-Zaversnik),
+    O(V + E): nodes are removed in order of current degree and each removal
+    only moves its remaining neighbours down one bucket.
+    """
+    n = adj.shape[0]
+    degree = np.diff(adj.indptr).astype(np.int64)
+    if n == 0:
+        return degree
+    # Nodes sorted by degree, with bucket starts and each node's position
+    order = np.argsort(degree, kind='stable')
+    bin_start = np.zeros(int(degree.max()) + 2, dtype=np.int64)
+    np.cumsum(np.bincount(degree, minlength=len(bin_start) - 1), out=bin_start[1:])
+
+    deg = degree.tolist()
+    vert = order.tolist()
+    pos = [0] * n
+    for i, v in enumerate(vert):
+        pos[v] = i
+    bins = bin_start.tolist()
+    indptr = adj.indptr.tolist()
+    indices = adj.indices.tolist()
+
+    for i in range(n):
+        v = vert[i]
+        for u in indices[indptr[v]:indptr[v + 1]]:
+            if deg[u] > deg[v]:
+                # Swap u with the first node of its bucket, then shrink the bucket
+                du = deg[u]
+                pu, pw = pos[u], bins[du]
+                w = vert[pw]
+                if u != w:
+                    vert[pu], vert[pw] = w, u
+                    pos[u], pos[w] = pw, pu
+                bins[du] += 1
+                deg[u] -= 1
+    return np.array(deg, dtype=np.int64)
+
+
+def _partition_edges(labels: np.ndarray, src: np.ndarray, dst: np.ndarray, num_labels: int) -> np.ndarray:
+    """Directed edges inside each label of a partition (one bincount)."""
+    inside = labels[src] == labels[dst]
+    inside &= labels[src] >= 0
+    return np.bincount(labels[src][inside], minlength=num_labels)
+
+
+def _groups(labels: np.ndarray, num_labels: int, src: np.ndarray, dst: np.ndarray,
+            min_size: int, source: str) -> List[DenseGroup]:
+    sizes = np.bincount(labels[labels >= 0], minlength=num_labels)
+    edges = _partition_edges(labels, src, dst, num_labels)
+    order = np.argsort(labels, kind='stable')
+    order = order[labels[order] >= 0]
+    members = np.split(order, np.cumsum(sizes)[:-1])
+    return [DenseGroup(members[g], int(edges[g]), source)
+            for g in np.flatnonzero(sizes >= min_size).tolist()]
+
+
+def core_groups(adj: csr_matrix, core: np.ndarray, src: np.ndarray, dst: np.ndarray,
+                min_size: int = DENSE_MIN_SIZE) -> List[DenseGroup]:
+    """
+    Connected components of every k-core (k >= min_size - 1), i.e. the
+    nested hierarchy peeling produces. One component pass per core level.
+    """
+    groups: List[DenseGroup] = []
+    for k in np.unique(core[core >= min_size - 1]).tolist():
+        keep = core >= k
+        sub = adj[keep][:, keep]
+        num, local = connected_components(sub, directed=False)
+        labels = np.full(len(core), -1, dtype=np.int64)
+        labels[np.flatnonzero(keep)] = local
+        groups.extend(_groups(labels, num, src, dst, min_size, f"{k}-core"))
+    return groups
+
+
+def _offsets(group: np.ndarray, num_groups: int) -> np.ndarray:
+    ptr = np.zeros(num_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(group, minlength=num_groups), out=ptr[1:])
+    return ptr
+
+
+def triangles(adj: csr_matrix) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Undirected edges (u < v, in CSR order) of the symmetric `adj` and its
+    triangles, each as the positions of its three edges.
+
+    Edges are oriented from the lower- to the higher-ranked end by
+    (degree, id), so every node keeps at most O(sqrt(E)) out-neighbours and
+    a hub keeps none: each triangle is found once, from its lowest-ranked
+    node, by checking the wedges between its sorted out-neighbours against
+    the sorted edge keys. Wedges are generated TRIANGLE_WEDGE_CHUNK at a time.
+    """
+    n = adj.shape[0]
+    upper = triu(adj, k=1).tocsr()
+    upper.sort_indices()
+    eu = np.repeat(np.arange(n, dtype=np.int64), np.diff(upper.indptr))
+    ev = upper.indices.astype(np.int64)
+    keys = eu * n + ev
+    m = len(keys)
+    if m == 0:
+        return eu, ev, np.zeros((0, 3), dtype=np.int64)
+
+    degree = np.diff(adj.indptr)
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.lexsort((np.arange(n), degree))] = np.arange(n)
+    low = np.where(rank[eu] < rank[ev], eu, ev)
+    high = eu + ev - low
+    order = np.lexsort((high, low))
+    low, high = low[order], high[order]
+    row_end = _offsets(low, n)[low + 1]
+    # Wedges (low, high[i], high[j]) for every i < j in the same row
+    partners = row_end - np.arange(m) - 1
+
+    found = []
+    starts = np.concatenate([[0], np.cumsum(partners)])
+    first = 0
+    while first < m:
+        last = max(first + 1, int(np.searchsorted(starts, starts[first] + TRIANGLE_WEDGE_CHUNK, side='right')) - 1)
+        last = min(last, m)
+        count = partners[first:last]
+        i = np.repeat(np.arange(first, last), count)
+        j = i + 1 + (np.arange(len(i)) - np.repeat(starts[first:last] - starts[first], count))
+        a, b = high[i], high[j]
+        third = np.minimum(a, b) * n + np.maximum(a, b)
+        pos = np.minimum(np.searchsorted(keys, third), m - 1)
+        hit = keys[pos] == third
+        found.append(np.stack([order[i[hit]], order[j[hit]], pos[hit]], axis=1))
+        first = last
+    return eu, ev, np.concatenate(found)
+
+
+def truss_numbers(num_edges: int, tri: np.ndarray) -> np.ndarray:
+    """
+    Truss number of every edge (2 for edges in no triangle) by bucket-queue
+    peeling, O(E + T): edges are removed in order of current triangle
+    support, and each removal only drops the support of the two other edges
+    of its still-intact triangles.
+    """
+    support = np.bincount(tri.ravel(), minlength=num_edges).astype(np.int64)
+    if num_edges == 0 or len(tri) == 0:
+        return support + 2
+    flat = tri.ravel()
+    by_edge = np.argsort(flat, kind='stable')
+    inc_ptr = _offsets(flat, num_edges).tolist()
+    inc_tri = (by_edge // 3).tolist()
+
+    order = np.argsort(support, kind='stable')
+    bin_start = np.zeros(int(support.max()) + 2, dtype=np.int64)
+    np.cumsum(np.bincount(support, minlength=len(bin_start) - 1), out=bin_start[1:])
+
+    sup = support.tolist()
+    vert = order.tolist()
+    pos = [0] * num_edges
+    for i, e in enumerate(vert):
+        pos[e] = i
+    bins = bin_start.tolist()
+    edges_of = tri.tolist()
+    intact = bytearray(b"\x01") * len(edges_of)
+
+    for i in range(num_edges):
+        e = vert[i]
+        s = sup[e]
+        for t in inc_tri[inc_ptr[e]:inc_ptr[e + 1]]:
+            if not intact[t]:
+                continue
+            intact[t] = 0
+            for f in edges_of[t]:
+                if f != e and sup[f] > s:
+                    # Swap f with the first edge of its bucket, then shrink the bucket
+                    sf = sup[f]
+                    pf, pw = pos[f], bins[sf]
+                    w = vert[pw]
+                    if f != w:
+                        vert[pf], vert[pw] = w, f
+                        pos[f], pos[w] = pw, pf
+                    bins[sf] += 1
+                    sup[f] -= 1
+    return np.array(sup, dtype=np.int64) + 2
+
+
+def truss_groups(adj: csr_matrix, src: np.ndarray, dst: np.ndarray,
+                 min_size: int = DENSE_MIN_SIZE) -> List[DenseGroup]:
+    """
+    Connected parts of every k-truss (k >= 3): the edges that each close at
+    least k - 2 triangles inside it. Triangles are listed once and truss
+    numbers come from one peeling pass (see triangles / truss_numbers), then
+    one component pass per truss level. Near-cliques survive deep into the
+    hierarchy while the sparse bulk of a giant component (few triangles)
+    drops out early, which separates them even when their core number
+    matches the surrounding graph.
+    """
+    groups: List[DenseGroup] = []
+    n = adj.shape[0]
+    eu, ev, tri = triangles(adj)
+    truss = truss_numbers(len(eu), tri)
+    for k in range(3, int(truss.max(initial=2)) + 1):
+        keep = truss >= k
+        sym = csr_matrix((np.ones(2 * int(keep.sum()), dtype=np.int8),
+                          (np.concatenate([eu[keep], ev[keep]]), np.concatenate([ev[keep], eu[keep]]))), shape=(n, n))
+        num, labels = connected_components(sym, directed=False)
+        labels = labels.astype(np.int64)
+        labels[np.diff(sym.indptr) == 0] = -1
+        groups.extend(_groups(labels, num, src, dst, min_size, f"{k}-truss"))
+    return groups
+
+
+def find_dense_groups(G: Union[GraphIndex, CompactGraph, nx.DiGraph], prior_max: float, min_size: int = DENSE_MIN_SIZE,
+                      min_score: float = 0.5, small_min_score: float = 0.75,
+                      stats: Optional[dict] = None) -> List[Tuple[List[str], DenseGroup]]:
+    """
+    Dense groups of entities, scored by directed density against the
+    context's highest expected density `prior_max`.
+
+    Candidates are the connected parts of every k-core and every k-truss,
+    so dense groups inside one giant component are still separated. Groups
+    under 10 entities need `small_min_score` (small groups are dense by
+    chance more often), larger ones `min_score`. Both hierarchies are
+    nested, so overlaps are resolved by keeping the largest passing group.
+    Returns (entity names, group) pairs, largest first; `stats["candidates"]`
+    receives the number of candidate groups scored.
+    """
+    index = GraphIndex.of(G)
+    names = index.names
+    src, dst = index.edges
+    if len(names) < min_size or len(src) == 0:
+        return []
+    adj = index.undirected
+    core = core_numbers(adj)
+
+    candidates = core_groups(adj, core, src, dst, min_size) + truss_groups(adj, src, dst, min_size)
+    if stats is not None:
+        stats["candidates"] = len(candidates)
+    passing = [g for g in candidates
+               if g.score(prior_max) >= (small_min_score if len(g) < 10 else min_score)]
+    passing.sort(key=lambda g: (-len(g), -g.score(prior_max)))
+
+    taken = np.zeros(len(names), dtype=bool)
+    found = []
+    for g in passing:
+        if taken[g.members].any():
+            continue
+        taken[g.members] = True
+        found.append((names[g.members].tolist(), g))
+    return found
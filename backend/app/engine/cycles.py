@@ -0,0 +1,329 @@
+import os
+import threading
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from typing import List, Optional, Tuple, Union
+from app.core.graph import CompactGraph
+from app.core.index import GraphIndex
+from app.core.shared import LazySpawnPool
+
+# Cycle lengths (in entities) reported by the circular trading detector
+CYCLE_MIN_LEN = 3
+CYCLE_MAX_LEN = 6
+
+# Edge expansions allowed per search before it stops and reports truncation
+CYCLE_WORK_BUDGET = int(os.getenv("CYCLE_WORK_BUDGET", "5000000"))
+
+# Worker processes for the cycle search (0 = one per core, 1 = in-process)
+CYCLE_SEARCH_WORKERS = int(os.getenv("CYCLE_SEARCH_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Below this many edges inside cyclic components the pool costs more than it saves
+PARALLEL_MIN_EDGES = 20_000
+
+# Tasks queued per worker, so uneven tasks still balance out
+TASKS_PER_WORKER = 4
+
+# Work a pool task spends between checks of the shared budget
+BUDGET_STEP = 50_000
+
+
+class CycleSearch:
+    """
+    Outcome of a bounded cycle enumeration.
+    `cycles` are entity-name lists rotated to start at their smallest name,
+    sorted. `truncated` is True when the work budget ran out before the
+    search finished, i.e. `cycles` may be incomplete.
+    """
+
+    def __init__(self, cycles: List[List[str]], truncated: bool, work: int, components: int, tasks: int = 1):
+        self.cycles = cycles
+        self.truncated = truncated
+        self.work = work
+        self.components = components
+        self.tasks = tasks
+
+    def __len__(self) -> int:
+        return len(self.cycles)
+
+    def describe(self) -> dict:
+        return {
+            "cycles": len(self.cycles),
+            "truncated": self.truncated,
+            "work": self.work,
+            "components": self.components,
+            "tasks": self.tasks,
+        }
+
+
+class WorkBudget:
+    """
+    Edge-expansion allowance of one search. In-process it is a plain counter;
+    pool tasks draw from a shared counter `BUDGET_STEP` at a time, so the
+    budget is global to the search however unevenly the work is spread.
+    """
+
+    def __init__(self, total: int, shared=None):
+        self.total = total
+        self.shared = shared
+        self.used = 0
+        self._reported = 0
+        self.limit = self._next_limit()
+
+    def _next_limit(self) -> int:
+        if self.shared is None:
+            return self.total
+        with self.shared.get_lock():
+            self.shared.value += self.used - self._reported
+            remaining = self.total - self.shared.value
+        self._reported = self.used
+        return self.used + max(0, min(BUDGET_STEP, remaining))
+
+    def extend(self) -> bool:
+        """Called once `used` reaches `limit`; False when the whole budget is spent."""
+        self.limit = self._next_limit()
+        return self.limit > self.used
+
+    def flush(self):
+        if self.shared is not None:
+            self._next_limit()
+
+
+def cyclic_components(adj: csr_matrix, min_size: int = CYCLE_MIN_LEN) -> List[np.ndarray]:
+    """
+    Strongly connected components with at least `min_size` nodes (smaller
+    ones cannot hold a long enough cycle), each as a sorted node array.
+    """
+    if adj.shape[0] == 0 or adj.nnz == 0:
+        return []
+    _, labels = connected_components(adj, directed=True, connection='strong')
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    return [comp for comp in np.split(order, bounds) if len(comp) >= min_size]
+
+
+def component_csr(adj: csr_matrix, comp: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR (indptr, indices) of the component's induced subgraph over local ids 0..len(comp)-1."""
+    sub = adj[comp][:, comp].tocsr()
+    sub.sort_indices()
+    return sub.indptr.astype(np.int32), sub.indices.astype(np.int32)
+
+
+def adjacency_lists(indptr: np.ndarray, indices: np.ndarray) -> Tuple[List[List[int]], List[List[int]]]:
+    """Successor and predecessor lists from a CSR adjacency."""
+    n = len(indptr) - 1
+    bounds = indptr.tolist()
+    targets = indices.tolist()
+    succ = [targets[a:b] for a, b in zip(bounds, bounds[1:])]
+    pred: List[List[int]] = [[] for _ in range(n)]
+    for u, vs in enumerate(succ):
+        for v in vs:
+            pred[v].append(u)
+    return succ, pred
+
+
+def cycles_from(start: int, succ: List[List[int]], pred: List[List[int]],
+                max_len: int, min_len: int, budget: WorkBudget) -> Tuple[List[List[int]], bool]:
+    """
+    All elementary cycles of length min_len..max_len whose smallest node is
+    `start` (every other node is > start, so each cycle is found exactly once).
+
+    A bounded reverse BFS first gives every node's distance back to `start`;
+    the DFS only extends the path to nodes that can still close the cycle
+    within `max_len`. Path membership is a set. Work is charged to `budget`.
+    Returns (cycles as local id lists, truncated).
+    """
+    # Distance (edges) from each node back to start, over nodes > start
+    dist = {start: 0}
+    frontier = [start]
+    depth = 0
+    work = budget.used
+    while frontier and depth < max_len - 1:
+        depth += 1
+        nxt = []
+        for v in frontier:
+            for u in pred[v]:
+                work += 1
+                if u > start and u not in dist:
+                    dist[u] = depth
+                    nxt.append(u)
+        frontier = nxt
+    budget.used = work
+    if len(dist) < min_len:
+        return [], False
+
+    cycles = []
+    path = [start]
+    on_path = {start}
+    stack = [iter(succ[start])]
+    limit = budget.limit
+    while stack:
+        if work >= limit:
+            budget.used = work
+            if not budget.extend():
+                return cycles, True
+            limit = budget.limit
+        for v in stack[-1]:
+            work += 1
+            if v == start:
+                if len(path) >= min_len:
+                    cycles.append(list(path))
+                continue
+            d = dist.get(v)
+            # d is None for nodes < start or that cannot reach start in time
+            if d is None or v in on_path or len(path) + d > max_len:
+                continue
+            path.append(v)
+            on_path.add(v)
+            stack.append(iter(succ[v]))
+            break
+        else:
+            stack.pop()
+            on_path.discard(path.pop())
+    budget.used = work
+    return cycles, False
+
+
+def search_component(indptr: np.ndarray, indices: np.ndarray, starts: List[int],
+                     max_len: int, min_len: int, budget: WorkBudget) -> Tuple[List[List[int]], bool]:
+    """
+    Cycles of one component (local CSR) whose smallest node is in `starts`.
+    Returns (cycles as local id lists, truncated).
+    """
+    succ, pred = adjacency_lists(indptr, indices)
+    found: List[List[int]] = []
+    for start in starts:
+        cycles, truncated = cycles_from(start, succ, pred, max_len, min_len, budget)
+        found.extend(cycles)
+        if truncated:
+            return found, True
+    return found, False
+
+
+# Shared work counter of the current parallel search (set in pool workers)
+_shared_work = None
+
+
+def _init_search_worker(counter):
+    global _shared_work
+    _shared_work = counter
+
+
+def _search_task(items: list, max_len: int, min_len: int, total_budget: int) -> list:
+    """Pool task: runs search_component for each (key, indptr, indices, starts) item."""
+    budget = WorkBudget(total_budget, _shared_work)
+    results = []
+    for key, indptr, indices, starts in items:
+        before = budget.used
+        cycles, truncated = search_component(indptr, indices, starts, max_len, min_len, budget)
+        results.append((key, cycles, budget.used - before, truncated))
+        if truncated:
+            break
+    budget.flush()
+    return results
+
+
+def _canonical(cycle: List[str]) -> Tuple[str, ...]:
+    i = cycle.index(min(cycle))
+    return tuple(cycle[i:] + cycle[:i])
+
+
+# Shared work counter of the pool's current search (made when the pool starts)
+_pool_counter = None
+# One parallel search at a time per process: they share the pool's work counter
+_search_lock = threading.Lock()
+
+
+def _pool_initargs() -> tuple:
+    global _pool_counter
+    _pool_counter = LazySpawnPool.context.Value('q', 0)
+    return (_pool_counter,)
+
+
+_pool = LazySpawnPool(_init_search_worker, _pool_initargs)
+
+
+def _plan_tasks(components: List[np.ndarray], csrs: list, workers: int) -> List[list]:
+    """
+    Splits the search into about `workers * TASKS_PER_WORKER` tasks: small
+    components are packed together, components larger than one task share are
+    split by start node (strided, since low starts carry the most work).
+    """
+    sizes = [len(indices) for _, indices in csrs]
+    total = max(1, sum(sizes))
+    share = max(1, total // (workers * TASKS_PER_WORKER))
+
+    tasks: List[list] = []
+    packed: list = []
+    packed_edges = 0
+    for key, ((indptr, indices), edges) in enumerate(zip(csrs, sizes)):
+        n = len(components[key])
+        parts = min(n, -(-edges // share))
+        if parts > 1:
+            for p in range(parts):
+                tasks.append([(key, indptr, indices, list(range(p, n, parts)))])
+            continue
+        packed.append((key, indptr, indices, list(range(n))))
+        packed_edges += edges
+        if packed_edges >= share:
+            tasks.append(packed)
+            packed, packed_edges = [], 0
+    if packed:
+        tasks.append(packed)
+    return tasks
+
+
+def find_cycles(G: Union[GraphIndex, CompactGraph, nx.DiGraph], max_len: int = CYCLE_MAX_LEN, min_len: int = CYCLE_MIN_LEN,
+                budget: int = CYCLE_WORK_BUDGET, workers: Optional[int] = None) -> CycleSearch:
+    """
+    Enumerates every elementary cycle with min_len..max_len entities.
+    The graph is split into strongly connected components first (a cycle
+    never leaves its component; the labels come from the GraphIndex) and
+    components too small to hold one are dropped. Stops once `budget` edge expansions are spent and reports it.
+
+    With `workers` > 1 and enough edges, components (and start nodes inside
+    large components) are searched on a process pool drawing on one shared
+    budget; results are merged and deduplicated by canonical rotation.
+    `workers` defaults to CYCLE_SEARCH_WORKERS (read at call time).
+    """
+    if workers is None:
+        workers = CYCLE_SEARCH_WORKERS
+    index = GraphIndex.of(G)
+    names = index.names.tolist()
+    adj = index.pattern
+    components = index.components(min_len)
+    csrs = [component_csr(adj, comp) for comp in components]
+    edges = sum(len(indices) for _, indices in csrs)
+
+    if workers > 1 and edges >= PARALLEL_MIN_EDGES:
+        tasks = _plan_tasks(components, csrs, workers)
+        pool = _pool.get(workers)
+        with _search_lock:
+            _pool_counter.value = 0
+            futures = [pool.submit(_search_task, items, max_len, min_len, budget) for items in tasks]
+            results = [r for f in futures for r in f.result()]
+    else:
+        tasks = [None]
+        results = []
+        shared = WorkBudget(budget)
+        for key, (indptr, indices) in enumerate(csrs):
+            before = shared.used
+            cycles, truncated = search_component(indptr, indices, list(range(len(components[key]))),
+                                                 max_len, min_len, shared)
+            results.append((key, cycles, shared.used - before, truncated))
+            if truncated:
+                break
+
+    unique = set()
+    for key, cycles, _, _ in results:
+        comp_names = [names[i] for i in components[key].tolist()]
+        unique.update(_canonical([comp_names[i] for i in cycle]) for cycle in cycles)
+
+    return CycleSearch(
+        cycles=[list(c) for c in sorted(unique)],
+        truncated=any(r[3] for r in results),
+        work=sum(r[2] for r in results),
+        components=len(components),
+        tasks=len(tasks),
+    )
@@ -1,244 +1,263 @@
 import networkx as nx
-from typing import List
+import numpy as np
+from typing import List, Optional, Tuple, Union
 from app.models import Anomaly
+from app.core.store import TransactionTable
+from app.core.context import context_manager
+from app.core.graph import CompactGraph
+from app.core.index import GraphIndex
+from app.engine import communities, cycles, temporal
+
+# Wash trading defaults when the context does not set thresholds.wash_trading
+WASH_MIN_TOTAL_VOLUME = 5000
+WASH_MAX_NET_FLOW_RATIO = 0.05
+
+# Structuring: distinct counterparties a hub needs before its amounts are judged
+STRUCTURING_MIN_COUNTERPARTIES = 5
+# ... then a mean payment above dust and a coefficient of variation below this
+STRUCTURING_MIN_MEAN = 100
+STRUCTURING_MAX_CV = 0.1
 
 def find_cycles_optimized(G: nx.DiGraph, max_len=6) -> List[List[str]]:
     """
-    Finds elementary cycles with length <= max_len using DFS.
-    Much faster than nx.simple_cycles for large graphs.
+    Finds all elementary cycles with 3..max_len entities (see cycles.find_cycles).
     """
-    cycles = []
-    
-    def dfs(start_node, current_node, path):
-        if len(path) > max_len:
-            return
-            
-        neighbors = list(G.successors(current_node))
-        for neighbor in neighbors:
-            if neighbor == start_node:
-                if len(path) > 2: # Min cycle 3
-                    cycles.append(path + [start_node])
-                continue
-                
-            if neighbor not in path:
-                dfs(start_node, neighbor, path + [neighbor])
-
-    # To avoid duplicates (A-B-C vs B-C-A), we sort nodes and only start from 'min' node in cycle
-    # Or simply dedupe after. For speed on 1000 nodes, iterating all as start is O(N * D^k).
-    # Since we want *robust* detection, let's use a standard backtracking with visited set per path.
-    
-    nodes = list(G.nodes())
-    # Heuristic: Only check nodes with in-degree > 0 and out-degree > 0
-    candidates = [n for n in nodes if G.in_degree(n) > 0 and G.out_degree(n) > 0]
-    
-    # Global visited optimization is tricky for cycles.
-    # We will just limit candidates to a subset if too large, or rely on max_len.
-    if len(candidates) > 200:
-        candidates = candidates[:200] # Safety Sampling for demo speed
-        
-    unique_cycles = set()
-    
-    pass_count = 0
-    for start_node in candidates:
-        pass_count += 1
-        # Quick DFS
-        stack = [(start_node, [start_node])] # (current, path)
-        
-        while stack:
-            curr, path = stack.pop()
-            if len(path) > max_len:
-                continue
-                
-            for nbr in G.successors(curr):
-                if nbr == start_node:
-                    if len(path) >= 3:
-                        # normalize cycle to store unique
-                        # e.g. tuple(sorted_list)?? No, cycle order matters. 
-                        # Canonical rotation: start with min element
-                        cycle = list(path)
-                        min_node = min(cycle)
-                        min_idx = cycle.index(min_node)
-                        canonical = tuple(cycle[min_idx:] + cycle[:min_idx])
-                        unique_cycles.add(canonical)
-                elif nbr not in path:
-                    stack.append((nbr, path + [nbr]))
-        
-        if len(unique_cycles) > 100: # Max cycles to report
-            break
-            
-    return [list(c) for c in unique_cycles]
+    return cycles.find_cycles(G, max_len=max_len).cycles
 
-def detect_circular_trading(G: nx.DiGraph) -> List[Anomaly]:
+def detect_circular_trading(G: Union[GraphIndex, CompactGraph, nx.DiGraph], stats: Optional[dict] = None) -> List[Anomaly]:
     """
     Optimized detection for circular trading.
+    Leg amounts of every cycle are read from the index's weighted CSR in one
+    lookup; `stats["candidates"]` receives the number of cycles examined.
     """
     anomalies = []
     try:
-        # Use optimized finder
-        cycles = find_cycles_optimized(G, max_len=6)
-        
-        for cycle in cycles:
-            # Check Volume Retention
-            is_suspicious = True
-            amounts = []
-            
-            for i in range(len(cycle)):
-                u = cycle[i]
-                v = cycle[(i + 1) % len(cycle)]
-                if G.has_edge(u, v):
-                    weight = G[u][v].get('weight', 0)
-                    amounts.append(weight)
-                else:
-                    is_suspicious = False
-                    break
-            
-            if not is_suspicious or not amounts:
-                continue
-                
-            avg_amt = sum(amounts) / len(amounts)
-            if avg_amt < 100: continue
-            
-            # Check flux consistency
-            for amt in amounts:
-                if abs(amt - avg_amt) / avg_amt > 0.2: # 20% tolerance
-                    is_suspicious = False
-                    break
-            
-            if is_suspicious:
-                anomalies.append(Anomaly(
-                    anomaly_id=f"circ_{hash(str(cycle))}",
-                    anomaly_type="CIRCULAR_TRADING",
-                    severity=0.9, 
-                    entities_involved=list(cycle),
-                    description=f"Risk Alert: Funds are moving in a circle involving {len(cycle)} entities. This is a classic 'Circular Trading' pattern used to fake volume or launder money. Amount retained: ~${avg_amt:.2f}.",
-                    evidence_data={"cycle_path": cycle, "avg_amount": avg_amt}
-                ))
+        index = GraphIndex.of(G)
+        # SCC-pruned, length-bounded enumeration under a work budget
+        search = cycles.find_cycles(index, max_len=6)
+        if search.truncated:
+            print(f"DEBUG: cycle search hit its work budget ({search.work} steps, {len(search)} cycles so far)")
+        if stats is not None:
+            stats["candidates"] = len(search)
+        if not search.cycles:
+            return anomalies
+
+        # Check Volume Retention: leg i of a cycle goes from its entity i to entity i + 1
+        ids = index.ids
+        lengths = np.array([len(cycle) for cycle in search.cycles])
+        u = np.array([ids[name] for cycle in search.cycles for name in cycle])
+        v = np.array([ids[name] for cycle in search.cycles for name in cycle[1:] + cycle[:1]])
+        amounts = np.asarray(index.csr[u, v]).ravel()
+        starts = np.cumsum(lengths) - lengths
+        avg = np.add.reduceat(amounts, starts) / lengths
+
+        # Check flux consistency (20% tolerance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spread = np.abs(amounts - np.repeat(avg, lengths)) / np.repeat(avg, lengths)
+        worst = np.maximum.reduceat(spread, starts)
+
+        for i in np.flatnonzero((avg >= 100) & (worst <= 0.2)).tolist():
+            cycle = search.cycles[i]
+            avg_amt = float(avg[i])
+            anomalies.append(Anomaly(
+                anomaly_id=f"circ_{hash(str(cycle))}",
+                anomaly_type="CIRCULAR_TRADING",
+                severity=0.9, 
+                entities_involved=list(cycle),
+                description=f"Risk Alert: Funds are moving in a circle involving {len(cycle)} entities. This is a classic 'Circular Trading' pattern used to fake volume or launder money. Amount retained: ~${avg_amt:.2f}.",
+                evidence_data={"cycle_path": cycle, "avg_amount": avg_amt, "search_truncated": search.truncated}
+            ))
                 
     except Exception as e:
         print(f"Error in cycle detection: {e}")
         
     return anomalies
 
-def detect_dense_clusters(G: nx.DiGraph) -> List[Anomaly]:
+def detect_temporal_cycles(table: TransactionTable, max_duration: str = temporal.TEMPORAL_CYCLE_MAX_DURATION) -> List[Anomaly]:
     """
-    Detects highly dense cliques or near-cliques indicating collusion rings.
+    Circular trading as genuine round-trips: every leg happens after the
+    previous one and the ring closes within `max_duration`. Runs on the
+    transaction table itself, so rings spanning slice boundaries are found
+    and out-of-order legs inside one slice are not.
     """
     anomalies = []
-    
-    # Use communities (Louvain or similar) or connected components
-    # For robust prototype: Weakly connected components first
-    components = list(nx.weakly_connected_components(G))
-    
-    for comp in components:
-        if len(comp) < 4: # Ignore tiny groups
+    search = temporal.find_temporal_cycles(table, max_duration=max_duration, max_len=6)
+    if search.truncated:
+        print(f"DEBUG: temporal cycle search hit its work budget ({search.work} steps, {len(search)} rings so far)")
+
+    for ring in search.rings:
+        amounts = ring["amounts"]
+        avg_amt = sum(amounts) / len(amounts)
+        if avg_amt < 100:
             continue
-            
-        subgraph = G.subgraph(comp)
-        density = nx.density(subgraph)
-        
-        # High threshold for "Unnatural" density
-        # In financial networks, density usually drops as N increases.
-        # If N > 10 and density > 0.5, that's very suspicious.
-        
-        threshold = 0.8 if len(comp) < 10 else 0.5
-        
-        if density > threshold:
-            anomalies.append(Anomaly(
-                anomaly_id=f"dens_{hash(str(comp))}",
-                anomaly_type="DENSE_CLUSTER",
-                severity=0.7,
-                entities_involved=list(comp),
-                description=f"Collusion Alert: A tight group of {len(comp)} entities is trading almost exclusively with each other ({density*100:.1f}% density). This isolated 'Island' behavior suggests a botnet or shell company ring.",
-                evidence_data={"density": density, "node_count": len(comp)}
-            ))
+        # Same retention rule as the static detector: every leg within 20% of the mean
+        if any(abs(amt - avg_amt) / avg_amt > 0.2 for amt in amounts):
+            continue
+
+        hours = (ring["end"] - ring["start"]) / 3.6e12
+        first_at, last_at = np.datetime_as_string(np.array([ring["start"], ring["end"]], dtype='datetime64[ns]'), unit='s')
+        anomalies.append(Anomaly(
+            anomaly_id=f"tcirc_{hash(str(ring['transaction_ids']))}",
+            anomaly_type="TEMPORAL_CIRCULAR_TRADING",
+            severity=0.95,
+            entities_involved=ring["entities"],
+            description=f"Round-Trip Alert: ~${avg_amt:.2f} left {ring['entities'][0]} and came back through {len(ring['entities']) - 1} other entities in {hours:.1f} hours, each transfer following the previous one. Observed {ring['occurrences']} time(s).",
+            evidence_data={
+                "cycle_path": ring["entities"],
+                "transaction_ids": ring["transaction_ids"],
+                "amounts": amounts,
+                "avg_amount": avg_amt,
+                "duration_hours": hours,
+                "first_transaction_at": str(first_at),
+                "last_transaction_at": str(last_at),
+                "occurrences": ring["occurrences"],
+                "search_truncated": search.truncated,
+            }
+        ))
+    return anomalies
+
+def detect_dense_clusters(G: Union[GraphIndex, CompactGraph, nx.DiGraph], stats: Optional[dict] = None) -> List[Anomaly]:
+    """
+    Detects highly dense cliques or near-cliques indicating collusion rings.
+    Dense groups come from k-core and k-truss peeling (see
+    communities.find_dense_groups), so they are found inside one giant
+    component too, and are judged against the active context's
+    graph_density_range prior.
+    """
+    anomalies = []
+    prior_min, prior_max = context_manager.get_active_context().get("priors", {}).get("graph_density_range", [0.0, 0.1])
+
+    for entities, group in communities.find_dense_groups(G, prior_max, stats=stats):
+        density = group.density
+        score = group.score(prior_max)
+        anomalies.append(Anomaly(
+            anomaly_id=f"dens_{hash(str(entities))}",
+            anomaly_type="DENSE_CLUSTER",
+            severity=round(0.6 + 0.3 * score, 3),
+            entities_involved=entities,
+            description=f"Collusion Alert: A tight group of {len(entities)} entities is trading almost exclusively with each other ({density*100:.1f}% density, against at most {prior_max*100:.0f}% expected in this economy). This isolated 'Island' behavior suggests a botnet or shell company ring.",
+            evidence_data={
+                "density": density,
+                "node_count": len(entities),
+                "edge_count": group.edges,
+                "density_score": score,
+                "prior_density_range": [prior_min, prior_max],
+                "found_by": group.source,
+            }
+        ))
             
     return anomalies
 
-def detect_wash_trading(G: nx.DiGraph) -> List[Anomaly]:
+def wash_thresholds() -> Tuple[float, float]:
+    """(min total volume, max net flow ratio) from the active context's `thresholds.wash_trading`."""
+    limits = context_manager.get_active_context().get("thresholds", {}).get("wash_trading", {})
+    return limits.get("min_total_volume", WASH_MIN_TOTAL_VOLUME), limits.get("max_net_flow_ratio", WASH_MAX_NET_FLOW_RATIO)
+
+def detect_wash_trading(G: Union[GraphIndex, CompactGraph, nx.DiGraph], stats: Optional[dict] = None) -> List[Anomaly]:
     """
     Detects Wash Trading (Ping-Pong): Two entities trading back and forth 
     to inflate volume without net value transfer.
+    Reciprocal pairs come from the index's reverse-edge positions; total
+    volume and net flow are element-wise over all pairs at once. Thresholds
+    are the active context's `thresholds.wash_trading`.
     """
     anomalies = []
-    processed_pairs = set()
-    
-    for u, v in G.edges():
-        if (u, v) in processed_pairs or (v, u) in processed_pairs:
-            continue
-            
-        processed_pairs.add((u, v))
-        
-        # Check bidirectional
-        if G.has_edge(v, u):
-            # Get weights (sum of amounts if multiple txs)
-            vol_uv = G[u][v].get('weight', 0)
-            vol_vu = G[v][u].get('weight', 0)
-            
-            total_vol = vol_uv + vol_vu
-            net_flow = abs(vol_uv - vol_vu)
-            
-            # Heuristic: High Volume (> $5000), Low Net Flow (< 5% of Volume)
-            if total_vol > 5000 and net_flow < (total_vol * 0.05):
-                anomalies.append(Anomaly(
-                    anomaly_id=f"wash_{hash(f'{u}-{v}')}",
-                    anomaly_type="WASH_TRADING",
-                    severity=0.85,
-                    entities_involved=[u, v],
-                    description=f"Wash Trading Detected: These entities traded ${total_vol:,.2f} back-and-forth, but the net money moved was $0. This is typically done to inflate transaction stats artifically.",
-                    evidence_data={"total_volume": total_vol, "net_flow": net_flow}
-                ))
+    min_volume, max_net_ratio = wash_thresholds()
+
+    index = GraphIndex.of(G)
+    names = index.names
+    if index.num_edges == 0:
+        return anomalies
+    # Every pair with both directions once, from its lower node id
+    src, dst, reverse = index.src, index.dst, index.reverse_edge
+    first = np.flatnonzero((reverse >= 0) & (src < dst))
+    u, v = src[first], dst[first]
+    if stats is not None:
+        stats["candidates"] = len(first)
+
+    vol_uv = index.weight[first]
+    vol_vu = index.weight[reverse[first]]
+    total_vol = vol_uv + vol_vu
+    net_flow = np.abs(vol_uv - vol_vu)
+
+    # Heuristic: High Volume, Low Net Flow (relative to volume)
+    hits = np.flatnonzero((total_vol > min_volume) & (net_flow < total_vol * max_net_ratio))
+    for i in hits.tolist():
+        a, b = names[u[i]], names[v[i]]
+        anomalies.append(Anomaly(
+            anomaly_id=f"wash_{hash(f'{a}-{b}')}",
+            anomaly_type="WASH_TRADING",
+            severity=0.85,
+            entities_involved=[a, b],
+            description=f"Wash Trading Detected: These entities traded ${total_vol[i]:,.2f} back-and-forth, but the net money moved was $0. This is typically done to inflate transaction stats artifically.",
+            evidence_data={"total_volume": float(total_vol[i]), "net_flow": float(net_flow[i])}
+        ))
                 
     return anomalies
 
-def detect_structuring(G: nx.DiGraph) -> List[Anomaly]:
+def _spread_stats(group: np.ndarray, weights: np.ndarray, count: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-node mean and standard deviation of edge weights, given edge counts (segment reductions via bincount)."""
+    n = len(count)
+    total = np.bincount(group, weights=weights, minlength=n)
+    total_sq = np.bincount(group, weights=weights * weights, minlength=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean * mean, 0.0)
+    return mean, np.sqrt(variance)
+
+
+def detect_structuring(G: Union[GraphIndex, CompactGraph, nx.DiGraph], stats: Optional[dict] = None) -> List[Anomaly]:
     """
     Detects Structuring / Smurfing: One entity sending/receiving similar amounts 
     to/from many users (Hub & Spoke), often to evade reporting limits.
+    Degree, mean and spread of edge weights are computed for every node at
+    once from the index; anomalies are only built for the nodes that pass.
     """
     anomalies = []
-    
-    for n in G.nodes():
-        # Fan Out check
-        out_edges = G.out_edges(n, data=True)
-        if len(out_edges) >= 5: # Min 5 recipients
-            amounts = [d.get('weight', 0) for _, _, d in out_edges]
-            avg_amt = sum(amounts) / len(amounts)
-            
-            if avg_amt > 100: # Ignore dust
-                # Check variance: Are amounts very similar? (e.g. all $9000-9900)
-                # Coeff of variation < 0.1
-                variance = sum([((x - avg_amt) ** 2) for x in amounts]) / len(amounts)
-                std_dev = variance ** 0.5
-                
-                if std_dev / avg_amt < 0.1:
-                    anomalies.append(Anomaly(
-                        anomaly_id=f"struct_out_{hash(n)}",
-                        anomaly_type="STRUCTURING (Fan-Out)",
-                        severity=0.95,
-                        entities_involved=[n] + [v for _, v, _ in out_edges],
-                        description=f"Smurfing (Fan-Out): A single source sent {len(amounts)} identically sized payments (~${avg_amt:.2f}) to different people. This looks like splitting a large sum to evade detection thresholds.",
-                        evidence_data={"pattern": "Fan-Out", "avg_amount": avg_amt, "std_dev": std_dev}
-                    ))
-                    continue # Don't flag Fan-In if already Fan-Out (simplify)
-
-        # Fan In check
-        in_edges = G.in_edges(n, data=True)
-        if len(in_edges) >= 5:
-            amounts = [d.get('weight', 0) for _, _, d in in_edges]
-            avg_amt = sum(amounts) / len(amounts)
-            
-            if avg_amt > 100:
-                variance = sum([((x - avg_amt) ** 2) for x in amounts]) / len(amounts)
-                std_dev = variance ** 0.5
-                
-                if std_dev / avg_amt < 0.1:
-                    anomalies.append(Anomaly(
-                        anomaly_id=f"struct_in_{hash(n)}",
-                        anomaly_type="STRUCTURING (Fan-In)",
-                        severity=0.95,
-                        entities_involved=[n] + [u for u, _, _ in in_edges],
-                        description=f"Smurfing (Fan-In): A single target received {len(amounts)} identically sized payments (~${avg_amt:.2f}) from different people. This looks like consolidating split funds.",
-                        evidence_data={"pattern": "Fan-In", "avg_amount": avg_amt, "std_dev": std_dev}
-                    ))
+    index = GraphIndex.of(G)
+    names = index.names
+    if index.num_edges == 0:
+        return anomalies
+    A = index.csr
+
+    def flagged(count, mean, std):
+        # Min 5 counterparties, ignore dust, coeff of variation < 0.1 (e.g. all $9000-9900)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (count >= STRUCTURING_MIN_COUNTERPARTIES) & (mean > STRUCTURING_MIN_MEAN) & (std / mean < STRUCTURING_MAX_CV)
+
+    out_count, in_count = index.out_degree, index.in_degree
+    if stats is not None:
+        stats["candidates"] = int(np.count_nonzero((out_count >= STRUCTURING_MIN_COUNTERPARTIES) | (in_count >= STRUCTURING_MIN_COUNTERPARTIES)))
+    out_mean, out_std = _spread_stats(index.src, A.data, out_count)
+    fan_out = flagged(out_count, out_mean, out_std)
+    in_mean, in_std = _spread_stats(A.indices, A.data, in_count)
+    # Don't flag Fan-In if already Fan-Out (simplify)
+    fan_in = flagged(in_count, in_mean, in_std) & ~fan_out
+
+    for i in np.flatnonzero(fan_out).tolist():
+        targets = names[A.indices[A.indptr[i]:A.indptr[i + 1]]].tolist()
+        avg_amt, std_dev = float(out_mean[i]), float(out_std[i])
+        anomalies.append(Anomaly(
+            anomaly_id=f"struct_out_{hash(names[i])}",
+            anomaly_type="STRUCTURING (Fan-Out)",
+            severity=0.95,
+            entities_involved=[names[i]] + targets,
+            description=f"Smurfing (Fan-Out): A single source sent {len(targets)} identically sized payments (~${avg_amt:.2f}) to different people. This looks like splitting a large sum to evade detection thresholds.",
+            evidence_data={"pattern": "Fan-Out", "avg_amount": avg_amt, "std_dev": std_dev}
+        ))
+
+    if fan_in.any():
+        At = index.csc
+        for i in np.flatnonzero(fan_in).tolist():
+            senders = names[At.indices[At.indptr[i]:At.indptr[i + 1]]].tolist()
+            avg_amt, std_dev = float(in_mean[i]), float(in_std[i])
+            anomalies.append(Anomaly(
+                anomaly_id=f"struct_in_{hash(names[i])}",
+                anomaly_type="STRUCTURING (Fan-In)",
+                severity=0.95,
+                entities_involved=[names[i]] + senders,
+                description=f"Smurfing (Fan-In): A single target received {len(senders)} identically sized payments (~${avg_amt:.2f}) from different people. This looks like consolidating split funds.",
+                evidence_data={"pattern": "Fan-In", "avg_amount": avg_amt, "std_dev": std_dev}
+            ))
                     
     return anomalies
@@ -3,9 +3,11 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch_geometric.nn import GCNConv
 from torch_geometric.data import Data
+from torch_geometric.utils import add_self_loops
 import networkx as nx
 import numpy as np
 import gc
+import io
 
 class GCNEncoder(torch.nn.Module):
     def __init__(self, in_channels, hidden_channels, out_channels):
@@ -76,6 +78,23 @@ class AnomalyDetector:
     def __init__(self, input_dim=5):
         self.model = GraphAutoEncoder(input_dim, 16, 8)
         self.optimizer = torch.optim.Adam(self.model.parameters(), lr=0.01)
+
+    def state(self) -> bytes:
+        """
+        Serialized model and optimizer weights, so a trained model can be
+        reused (or fine-tuned further) on other graphs and in other processes.
+        """
+        buffer = io.BytesIO()
+        torch.save({"model": self.model.state_dict(), "optimizer": self.optimizer.state_dict()}, buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_state(cls, state: bytes) -> "AnomalyDetector":
+        detector = cls()
+        checkpoint = torch.load(io.BytesIO(state), weights_only=True)
+        detector.model.load_state_dict(checkpoint["model"])
+        detector.optimizer.load_state_dict(checkpoint["optimizer"])
+        return detector
         
     def prepare_data(self, G: nx.DiGraph) -> Data:
         """
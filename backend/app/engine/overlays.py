@@ -1,7 +1,8 @@
 from typing import List, Dict, Any
-from app.models import Anomaly, Transaction
+import numpy as np
+from app.models import Anomaly
 from app.core.context import context_manager
-import networkx as nx
+from app.core.store import TransactionTable
 
 class TaxOverlay:
     """
@@ -13,40 +14,36 @@ class TaxOverlay:
     def __init__(self):
         pass
 
-    def apply(self, anomalies: List[Anomaly], transactions: List[Transaction]) -> List[Anomaly]:
+    def apply(self, anomalies: List[Anomaly], table: TransactionTable) -> List[Anomaly]:
         context = context_manager.get_active_context()
         flags = context.get("flags", {})
         
-        # Build a quick lookup graph for transaction details if needed
-        # (For simple demo, we iterate anomalies)
-        
-        tx_map = {t.transaction_id: t for t in transactions}
-
+        # Rows are resolved per anomaly through the table's id index
+        # (no per-transaction lookup map is built)
         for anomaly in anomalies:
-            self._enhance_anomaly(anomaly, tx_map, flags)
+            self._enhance_anomaly(anomaly, table, flags)
             
         return anomalies
 
-    def _enhance_anomaly(self, anomaly: Anomaly, tx_map: Dict[str, Transaction], flags: Dict[str, bool]):
+    def _enhance_anomaly(self, anomaly: Anomaly, table: TransactionTable, flags: Dict[str, bool]):
         """
         Adds tax-specific corroboration to the anomaly explanation.
         """
         # We only really care about "circular" or "structuring" for tax overlays usually
         corroboration = []
         
+        tids = anomaly.evidence_data.get("transaction_ids", [])
+        rows = table.lookup(tids) if tids else np.array([], dtype=np.int64)
+        rows = rows[rows >= 0]
+        
         # 1. GST Overlay (India)
         if flags.get("gst_enabled"):
             # Logic: Check if ITC (Input Tax Credit) is claimed along the anomaly path
             # Proof of Concept: If involved entities have high ITC claims, mention it.
             # In a real graph, we'd trace the flow. Here we check the 'evidence' or entities.
             
-            # Simulated Logic: If ANY transaction in the anomaly has ITC > 0
-            has_itc = False
-            for tid in anomaly.evidence_data.get("transaction_ids", []):
-                tx = tx_map.get(tid)
-                if tx and tx.input_tax_credit and tx.input_tax_credit > 0:
-                    has_itc = True
-                    break
+            # Simulated Logic: If ANY transaction in the anomaly has ITC > 0 (NaN compares False)
+            has_itc = bool((table.input_tax_credit[rows] > 0).any())
             
             if has_itc:
                 corroboration.append("ITC_FLOW_DETECTED")
@@ -57,14 +54,9 @@ class TaxOverlay:
         if flags.get("vat_enabled"):
             # Logic: Check for VAT Carousels (Zero-rated export + Domestic import)
             # Simulated Logic: Check if 'tax_rate' varies (0 vs 20)
-            zero_rated_present = False
-            standard_rated_present = False
-            
-            for tid in anomaly.evidence_data.get("transaction_ids", []):
-                tx = tx_map.get(tid)
-                if tx and tx.tax_rate is not None:
-                    if tx.tax_rate == 0: zero_rated_present = True
-                    if tx.tax_rate > 15: standard_rated_present = True
+            rates = table.tax_rate[rows]
+            zero_rated_present = bool((rates == 0).any())
+            standard_rated_present = bool((rates > 15).any())
             
             if zero_rated_present and standard_rated_present:
                  corroboration.append("VAT_ASYMMETRY")
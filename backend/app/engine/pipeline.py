@@ -0,0 +1,110 @@
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from app.models import Anomaly
+from app.core.index import GraphIndex
+from app.engine import detectors
+
+# A detector takes the slice index and an optional stats dict it may fill ("candidates")
+DetectorFn = Callable[[GraphIndex, Optional[dict]], List[Anomaly]]
+
+
+class Detector:
+    """A registered detector and the GraphIndex structures it reads."""
+
+    def __init__(self, name: str, run: DetectorFn, needs: Tuple[str, ...] = ()):
+        unknown = set(needs) - set(GraphIndex.FEATURES)
+        if unknown:
+            raise ValueError(f"Detector '{name}' needs unknown graph index features: {sorted(unknown)}")
+        self.name = name
+        self.run = run
+        self.needs = tuple(needs)
+
+
+class DetectorRun:
+    """Outcome of one detector on one slice."""
+
+    def __init__(self, name: str, anomalies: List[Anomaly], seconds: float, candidates: Optional[int] = None,
+                 error: Optional[str] = None):
+        self.name = name
+        self.anomalies = anomalies
+        self.seconds = seconds
+        self.candidates = candidates
+        self.error = error
+
+
+class DetectorPipeline:
+    """
+    Structural detectors run over one shared GraphIndex per slice.
+
+    Each detector declares the index structures it reads; before the first
+    detector runs, the union of those is built once (see GraphIndex.prepare),
+    so a new detector adds no graph traversal of its own for structures that
+    are already declared. Every run reports its wall time, its candidate
+    count and its anomalies. `totals` accumulates those over all slices, plus
+    the build time of each index structure.
+    """
+
+    def __init__(self):
+        self.detectors: List[Detector] = []
+        self.totals: Dict[str, dict] = {}
+        self.index_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, run: DetectorFn, needs: Tuple[str, ...] = ()) -> Detector:
+        if any(d.name == name for d in self.detectors):
+            raise ValueError(f"Detector '{name}' is already registered")
+        detector = Detector(name, run, needs)
+        self.detectors.append(detector)
+        return detector
+
+    def needs(self) -> List[str]:
+        wanted = {feature for d in self.detectors for feature in d.needs}
+        return [feature for feature in GraphIndex.FEATURES if feature in wanted]
+
+    def run(self, index: GraphIndex) -> List[DetectorRun]:
+        """Runs every detector on `index`, in registration order."""
+        index.prepare(self.needs())
+        runs = []
+        for detector in self.detectors:
+            stats: dict = {}
+            started = time.perf_counter()
+            error = None
+            try:
+                anomalies = detector.run(index, stats)
+            except Exception as e:
+                print(f"ERROR: detector {detector.name} failed: {e}")
+                anomalies, error = [], str(e)
+            seconds = time.perf_counter() - started
+            print(f"DEBUG: detector {detector.name}: {seconds:.3f}s, "
+                  f"{stats.get('candidates', '?')} candidates, {len(anomalies)} anomalies")
+            runs.append(DetectorRun(detector.name, anomalies, seconds, stats.get("candidates"), error))
+        self.record(runs, index.timings)
+        return runs
+
+    def record(self, runs: List[DetectorRun], index_timings: Dict[str, float]):
+        """Adds one slice's runs and index build times to `totals` (also for runs done in another process)."""
+        for run in runs:
+            total = self.totals.setdefault(run.name, {"slices": 0, "seconds": 0.0, "candidates": 0, "anomalies": 0, "errors": 0})
+            total["slices"] += 1
+            total["seconds"] += run.seconds
+            total["candidates"] += run.candidates or 0
+            total["anomalies"] += len(run.anomalies)
+            total["errors"] += run.error is not None
+        for feature, seconds in index_timings.items():
+            self.index_seconds[feature] = self.index_seconds.get(feature, 0.0) + seconds
+
+    def report(self) -> dict:
+        """Per-detector totals and index build times (seconds rounded to ms)."""
+        return {
+            "detectors": {name: dict(total, seconds=round(total["seconds"], 3)) for name, total in self.totals.items()},
+            "index": {feature: round(seconds, 3) for feature, seconds in self.index_seconds.items()},
+        }
+
+
+def slice_pipeline() -> DetectorPipeline:
+    """The per-slice structural detectors, in the order their anomalies are reported."""
+    pipeline = DetectorPipeline()
+    pipeline.register("circular_trading", detectors.detect_circular_trading, needs=("pattern", "scc_labels"))
+    pipeline.register("dense_clusters", detectors.detect_dense_clusters, needs=("edges", "undirected"))
+    pipeline.register("wash_trading", detectors.detect_wash_trading, needs=("reverse_edge",))
+    pipeline.register("structuring", detectors.detect_structuring, needs=("out_degree", "in_degree", "csc"))
+    return pipeline
@@ -0,0 +1,295 @@
+import os
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from app.models import Anomaly
+from app.core import hashing
+from app.core.context import context_manager
+from app.core.graph import build_compact_graph
+from app.core.index import GraphIndex
+from app.core.lazy import lazy_import
+from app.core.shared import LazySpawnPool, SharedArrays, attach
+from app.core.store import TransactionTable
+from app.engine.pipeline import DetectorPipeline, DetectorRun, slice_pipeline
+
+# torch / torch_geometric only load when a slice is large enough for the GNN
+gnn = lazy_import("app.engine.gnn")
+
+# Worker processes analyzing slices side by side (0 = one per core, 1 = in-process);
+# analysis job workers cap it at their share of the cores (see core.jobs)
+ANALYSIS_SLICE_WORKERS = int(os.getenv("ANALYSIS_SLICE_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Slices handed to the pool ahead of the one being merged, per worker
+SLICES_AHEAD_PER_WORKER = 2
+
+# How the slice GNN gets its weights: "per_slice" trains a fresh model on every
+# slice, "baseline" trains one model on the first GNN_BASELINE_WINDOW of the range
+# and only runs inference per slice, "finetune" also fine-tunes it slice by slice
+GNN_TRAINING_MODES = ("per_slice", "baseline", "finetune")
+GNN_TRAINING = os.getenv("GNN_TRAINING", "per_slice")
+GNN_BASELINE_WINDOW = os.getenv("GNN_BASELINE_WINDOW", "90D")
+
+# Epochs of cold training (per slice or baseline) and of fine-tuning per slice
+GNN_TRAIN_EPOCHS = 100
+GNN_FINETUNE_EPOCHS = int(os.getenv("GNN_FINETUNE_EPOCHS", "5"))
+
+# Graphs with at most this many edges skip the GNN
+GNN_MIN_EDGES = 10
+
+
+class SliceResult:
+    """Anomalies, GNN edge scores, detector runs and final GNN weights of one slice."""
+
+    def __init__(self, anomalies: List[Anomaly], gnn_scores: List[dict], runs: List[DetectorRun],
+                 index_timings: Dict[str, float], gnn_state: Optional[bytes] = None):
+        self.anomalies = anomalies
+        self.gnn_scores = gnn_scores
+        self.runs = runs
+        self.index_timings = index_timings
+        self.gnn_state = gnn_state
+
+
+def label_wash(w: Anomaly, slice_key: str) -> Anomaly:
+    """Deterministic id and explanation of a wash-trading anomaly found in `slice_key`."""
+    w.anomaly_id = f"DETERM-WASH-{slice_key}-{w.evidence_data.get('total_volume')}"
+    w.evidence_data["slice"] = slice_key
+    w.detection_method = "DETERMINISTIC"
+    w.confidence = "Low"
+    w.explanation_metadata = {
+        "metric": "Fake Volume Ratio",
+        "value": f"{round((w.evidence_data.get('total_volume', 0) - w.evidence_data.get('net_flow', 0))/w.evidence_data.get('total_volume', 1)*100)}%",
+        "context": "High Volume with Zero Net Transfer"
+    }
+    return w
+
+
+def label_structuring(s: Anomaly, slice_key: str) -> Anomaly:
+    """Deterministic id and explanation of a structuring anomaly found in `slice_key`."""
+    s.anomaly_id = f"DETERM-STRUCT-{slice_key}-{hash(s.description)}"
+    s.evidence_data["slice"] = slice_key
+    s.detection_method = "DETERMINISTIC"
+    s.confidence = "Low"
+    s.explanation_metadata = {
+        "metric": "Split-Transactions",
+        "value": f"Count: {s.evidence_data.get('count', '?')}",
+        "context": "Repeated payments just below reporting limit"
+    }
+    return s
+
+
+def analyze_slice(slice_key: str, index: GraphIndex, pipeline: DetectorPipeline,
+                  gnn_state: Optional[bytes] = None, finetune_epochs: int = 0) -> SliceResult:
+    """
+    Structural detectors (through `pipeline`) and the GNN on one slice.
+    Slices are independent of each other, so this runs in any process.
+    The GNN is trained from scratch on the slice unless `gnn_state` holds
+    trained weights (see train_gnn_baseline), which are used as they are or
+    fine-tuned for `finetune_epochs` first; the result carries the weights
+    the slice ended with.
+    """
+    print(f"DEBUG: analyzing slice {slice_key}")
+    raw_anomalies = []
+    gnn_scores = []
+
+    # 1. Heuristics (Deterministic), sharing one graph index
+    runs = pipeline.run(index)
+    by_name = {run.name: run.anomalies for run in runs}
+    circ_anomalies = by_name["circular_trading"]
+    for c in circ_anomalies:
+        # Update Existing Anomaly Object
+        c.anomaly_id = f"DETERM-CIRC-{slice_key}-{hashing.hash_content(c.entities_involved)}"
+        c.evidence_data["slice"] = slice_key
+        c.detection_method = "DETERMINISTIC"
+        c.confidence = "Low" # Placeholder
+        c.explanation_metadata = {
+            "metric": "Suspicious Loop", 
+            "value": f"{len(c.entities_involved)} Entities Involved",
+            "context": "Funds returned to origin (Circular Logic)"
+        }
+        raw_anomalies.append(c)
+
+    dense_anomalies = by_name["dense_clusters"]
+    for d in dense_anomalies:
+         # Update Existing Anomaly Object
+         d.anomaly_id = f"DETERM-DENSE-{slice_key}-{d.evidence_data.get('density')}"
+         d.evidence_data["slice"] = slice_key
+         d.detection_method = "DETERMINISTIC"
+         d.confidence = "Low"
+         d.explanation_metadata = {
+            "metric": "Network Density",
+            "value": f"{round(d.evidence_data.get('density', 0), 2)} (High)",
+            "context": "Abnormal Clustering > 2x Average"
+         }
+         raw_anomalies.append(d)
+    
+    wash_anomalies = by_name["wash_trading"]
+    for w in wash_anomalies:
+        raw_anomalies.append(label_wash(w, slice_key))
+
+    struct_anomalies = by_name["structuring"]
+    for s in struct_anomalies:
+         raw_anomalies.append(label_structuring(s, slice_key))
+    
+    # 2. Real AI (GNN)
+    print("DEBUG: running GNN inference")
+    next_state = gnn_state
+    try:
+        if index.num_edges > GNN_MIN_EDGES: # Tuned for Demo: Min 10 edges to trigger AI
+            sub_G = index.graph
+            if gnn_state is None:
+                detector = gnn.AnomalyDetector()
+                detector.train_baseline(sub_G, epochs=GNN_TRAIN_EPOCHS) # Keep high epochs for quality
+            else:
+                # Shared weights: scores are comparable across slices
+                detector = gnn.AnomalyDetector.from_state(gnn_state)
+                if finetune_epochs > 0:
+                    detector.train_baseline(sub_G, epochs=finetune_epochs)
+                    next_state = detector.state()
+            gnn_output = detector.detect(sub_G)
+            gnn_results = gnn_output["anomalies"]
+            
+            # Collect scores for visualization
+            if "edge_scores" in gnn_output:
+                 gnn_scores.extend(gnn_output["edge_scores"])
+
+            # Convert GNN dicts to Pydantic Anomaly objects
+            for ga in gnn_results:
+                # Calculate Explainability Metrics
+                src = ga['source']
+                tgt = ga['target']
+                src_deg = sub_G.degree(src)
+                tgt_deg = sub_G.degree(tgt)
+                
+                raw_anomalies.append(Anomaly(
+                    anomaly_id=f"GNN-{slice_key}-{src}-{tgt}",
+                    anomaly_type="STRUCTURAL_ANOMALY",
+                    severity=ga['score'],
+                    description=f"EXISTENCE PARADOX: The AI Model predicts with >99% confidence that a transaction link between these entities is topologically invalid / Impossible, yet it exists.",
+                    entities_involved=[src, tgt],
+                    evidence_data={"score": ga['score'], "slice": slice_key, "tag": "Existence Verification Failed"},
+                    detection_method="LEARNED",
+                    confidence="High",
+                    explanation_metadata={
+                        "factors": [
+                            {"name": "Probability of Fraud", "value": f"{float(ga['score'])*100:.1f}%"},
+                            {"name": "Model Decision", "value": "Structurally Impossible"},
+                            {"name": "Reality Check", "value": "Link Exists (Deviation)"},
+                            {"name": f"Source Activity", "value": f"{src_deg} connections"},
+                            {"name": f"Target Activity", "value": f"{tgt_deg} connections"}
+                        ],
+                        "corroboration": "Violates Economic & Graph Logic"
+                    }
+                ))
+    except Exception as e:
+        print(f"ERROR: GNN failed for slice {slice_key}: {e}")
+
+    return SliceResult(raw_anomalies, gnn_scores, runs, dict(index.timings), next_state)
+
+
+def train_gnn_baseline(table: TransactionTable, window: str = GNN_BASELINE_WINDOW) -> Optional[bytes]:
+    """
+    Trains one GNN on the transactions of the first `window` of `table` and
+    returns its weights (gnn.AnomalyDetector.state), or None when that graph
+    is too small for the GNN or training fails.
+    """
+    ts = table.timestamp
+    baseline = table.take(np.flatnonzero(ts < ts.min() + pd.Timedelta(window).value))
+    index = GraphIndex.from_compact(build_compact_graph(baseline))
+    if index.num_edges <= GNN_MIN_EDGES:
+        print(f"DEBUG: GNN baseline window {window} has only {index.num_edges} edges, training per slice instead")
+        return None
+    print(f"DEBUG: training GNN baseline on {len(baseline)} txs ({index.num_edges} edges)")
+    try:
+        detector = gnn.AnomalyDetector()
+        detector.train_baseline(index.to_networkx(), epochs=GNN_TRAIN_EPOCHS)
+        return detector.state()
+    except Exception as e:
+        print(f"ERROR: GNN baseline training failed: {e}")
+        return None
+
+
+def _init_slice_worker():
+    # Slices already run side by side: no nested cycle-search pool, one torch thread per worker
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    from app.engine import cycles
+    cycles.CYCLE_SEARCH_WORKERS = 1
+
+
+def _slice_task(slice_key: str, spec, context_id: str, gnn_state: Optional[bytes]) -> SliceResult:
+    """Pool task: analyzes one slice whose index arrays live in a shared-memory block."""
+    if context_manager.get_active_context().get("context_id") != context_id:
+        context_manager.set_context(context_id)
+    shm, arrays = attach(spec)
+    try:
+        return analyze_slice(slice_key, GraphIndex.from_arrays(arrays), slice_pipeline(), gnn_state)
+    finally:
+        del arrays
+        try:
+            shm.close()
+        except BufferError:
+            # A view is still referenced (e.g. by a traceback); the mapping goes with the process
+            pass
+
+
+_pool = LazySpawnPool(_init_slice_worker)
+
+
+def analyze_slices(time_slices: Iterable[Tuple[str, GraphIndex]], pipeline: DetectorPipeline,
+                   workers: int = ANALYSIS_SLICE_WORKERS,
+                   is_cancelled: Optional[Callable[[], bool]] = None,
+                   gnn_state: Optional[bytes] = None,
+                   finetune_epochs: int = 0) -> Iterator[Tuple[str, SliceResult]]:
+    """
+    Runs analyze_slice over (label, index) pairs and yields (label, result)
+    in input (chronological) order; detector runs are recorded on `pipeline`.
+
+    With `workers` > 1 every slice's index arrays are copied into a
+    shared-memory block (no pickled graphs) and analyzed on a process pool.
+    Up to SLICES_AHEAD_PER_WORKER slices per worker are in flight while the
+    earliest one is merged, so the whole run takes about as long as its
+    slowest slices. Stops submitting (and yielding) once `is_cancelled()`.
+
+    Every slice's GNN starts from `gnn_state` when given. With
+    `finetune_epochs` each slice continues from the weights of the one
+    before, so the slices then run one after the other in this process.
+    """
+    cancelled = is_cancelled or (lambda: False)
+    if workers <= 1 or finetune_epochs > 0:
+        for slice_key, index in time_slices:
+            if cancelled():
+                return
+            result = analyze_slice(slice_key, index, pipeline, gnn_state, finetune_epochs)
+            if finetune_epochs > 0:
+                gnn_state = result.gnn_state
+            yield slice_key, result
+        return
+
+    pool = _pool.get(workers)
+    context_id = context_manager.get_active_context().get("context_id", "global")
+    remaining = iter(time_slices)
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < workers * SLICES_AHEAD_PER_WORKER and not cancelled():
+                item = next(remaining, None)
+                if item is None:
+                    break
+                slice_key, index = item
+                block = SharedArrays(index.arrays())
+                pending.append((slice_key, pool.submit(_slice_task, slice_key, block.spec, context_id, gnn_state), block))
+            if not pending:
+                return
+            slice_key, future, block = pending.popleft()
+            try:
+                result = future.result()
+            finally:
+                block.release()
+            pipeline.record(result.runs, result.index_timings)
+            yield slice_key, result
+            if cancelled():
+                return
+    finally:
+        for _, future, block in pending:
+            future.cancel()
+            block.release()
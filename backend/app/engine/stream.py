@@ -0,0 +1,359 @@
+import heapq
+import os
+import threading
+import time
+import pandas as pd
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from app.models import Anomaly
+from app.core import hashing
+from app.core.context import context_manager
+from app.engine.cycles import CYCLE_MAX_LEN, CYCLE_MIN_LEN
+from app.engine.detectors import WASH_MAX_NET_FLOW_RATIO, WASH_MIN_TOTAL_VOLUME
+
+# Time window the streaming detectors keep state for
+STREAM_WINDOW = os.getenv("STREAM_WINDOW", "30D")
+
+# Edge expansions allowed per arriving transaction while closing short cycles
+STREAM_CYCLE_BUDGET = int(os.getenv("STREAM_CYCLE_BUDGET", "2000"))
+
+
+class _Spread:
+    """Running fan-out (or fan-in) statistics of one node: counterparties, sum and sum of squares of edge weights."""
+
+    __slots__ = ("count", "total", "total_sq")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, old: float, new: float, edges: int):
+        self.count += edges
+        self.total += new - old
+        self.total_sq += new * new - old * old
+
+    def flagged(self) -> bool:
+        # Same rule as detectors.detect_structuring: 5+ counterparties, no dust, coeff of variation < 0.1
+        if self.count < 5:
+            return False
+        mean = self.total / self.count
+        variance = max(self.total_sq / self.count - mean * mean, 0.0)
+        return mean > 100 and variance ** 0.5 / mean < 0.1
+
+    def describe(self) -> Tuple[float, float]:
+        mean = self.total / self.count
+        return mean, max(self.total_sq / self.count - mean * mean, 0.0) ** 0.5
+
+
+class StreamDetector:
+    """
+    Incremental detectors over the transactions of a sliding time window.
+
+    Per directed pair the window keeps [weight, count]; per node the running
+    fan-out and fan-in statistics of its edge weights. A transaction
+    entering or leaving the window updates both in O(1), after which the
+    arriving transaction u -> v is checked:
+
+    - wash trading: volumes of u -> v and v -> u against the context's
+      thresholds.wash_trading;
+    - structuring: u's fan-out and v's fan-in from the running sums;
+    - circular trading: paths v -> ... -> u of up to CYCLE_MAX_LEN - 1 edges
+      that close a ring through the new edge, found by a depth-bounded
+      search limited to `cycle_budget` edge expansions.
+
+    Rules match the batch detectors on the same window contents. Alerts are
+    raised by arriving transactions, at most once per pattern and window.
+    Transactions may arrive out of order: the window is a heap keyed by
+    timestamp, so a late one still leaves once the watermark (the newest
+    timestamp seen) moves a window past it. Transactions already older than
+    the window and repeated transaction ids are skipped.
+    """
+
+    def __init__(self, window: str = STREAM_WINDOW, cycle_budget: int = STREAM_CYCLE_BUDGET):
+        self.cycle_budget = cycle_budget
+        self.lock = threading.Lock()
+        self._clear(window)
+
+    def reset(self, window: Optional[str] = None):
+        """Drops all window state (and switches to `window` if given). Raises ValueError for an invalid window."""
+        with self.lock:
+            self._clear(window or self.window)
+
+    def _clear(self, window: str):
+        horizon = pd.Timedelta(window).value
+        if horizon <= 0:
+            raise ValueError("window must be positive")
+        self.window = window
+        self.horizon = horizon
+        self.edges: Dict[Tuple[str, str], List[float]] = {}
+        self.succ: Dict[str, Set[str]] = {}
+        self.pred: Dict[str, Set[str]] = {}
+        self.out: Dict[str, _Spread] = {}
+        self.into: Dict[str, _Spread] = {}
+        # Heap of (ts ns, transaction id, source, target, amount), oldest first
+        self.live: List[tuple] = []
+        self.live_ids: Set[str] = set()
+        self.alerted: "OrderedDict[tuple, int]" = OrderedDict()
+        self.watermark: Optional[int] = None
+        self.processed = 0
+        self.skipped = 0
+        self.alerts = 0
+        self.seconds = 0.0
+
+    def process(self, transactions: List[dict]) -> List[Anomaly]:
+        """
+        Feeds transactions (dicts with transaction_id, source_entity,
+        target_entity, amount and a naive UTC timestamp) in order and returns
+        the alerts they raised.
+        """
+        limits = context_manager.get_active_context().get("thresholds", {}).get("wash_trading", {})
+        min_volume = limits.get("min_total_volume", WASH_MIN_TOTAL_VOLUME)
+        max_net_ratio = limits.get("max_net_flow_ratio", WASH_MAX_NET_FLOW_RATIO)
+        found = []
+        with self.lock:
+            started = time.perf_counter()
+            for tx in transactions:
+                arrived = time.perf_counter()
+                alerts = self._add(tx, min_volume, max_net_ratio)
+                if alerts:
+                    latency_ms = round((time.perf_counter() - arrived) * 1000, 3)
+                    for a in alerts:
+                        a.evidence_data["latency_ms"] = latency_ms
+                    found.extend(alerts)
+            self.seconds += time.perf_counter() - started
+            self.alerts += len(found)
+        return found
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "window": self.window,
+                "watermark": str(pd.Timestamp(self.watermark)) if self.watermark is not None else None,
+                "transactions_in_window": len(self.live),
+                "edges_in_window": len(self.edges),
+                "processed": self.processed,
+                "skipped": self.skipped,
+                "alerts": self.alerts,
+                "transactions_per_second": round(self.processed / self.seconds, 1) if self.seconds > 0 else 0.0,
+            }
+
+    def _add(self, tx: dict, min_volume: float, max_net_ratio: float) -> List[Anomaly]:
+        ts = pd.Timestamp(tx["timestamp"]).value
+        tid = tx["transaction_id"]
+        if tid in self.live_ids or (self.watermark is not None and ts < self.watermark - self.horizon):
+            self.skipped += 1
+            return []
+        if self.watermark is None or ts > self.watermark:
+            self.watermark = ts
+            self._evict()
+
+        u, v, amount = tx["source_entity"], tx["target_entity"], float(tx["amount"])
+        heapq.heappush(self.live, (ts, tid, u, v, amount))
+        self.live_ids.add(tid)
+        self._apply(u, v, amount, +1)
+        self.processed += 1
+
+        alerts = []
+        if u != v:
+            alerts.extend(self._check_wash(u, v, tid, min_volume, max_net_ratio))
+            alerts.extend(self._check_cycles(u, v, tid))
+        alerts.extend(self._check_structuring(u, v, tid))
+        return alerts
+
+    def _evict(self):
+        cutoff = self.watermark - self.horizon
+        while self.live and self.live[0][0] < cutoff:
+            _, tid, u, v, amount = heapq.heappop(self.live)
+            self.live_ids.discard(tid)
+            self._apply(u, v, amount, -1)
+        while self.alerted and next(iter(self.alerted.values())) < cutoff:
+            self.alerted.popitem(last=False)
+
+    def _apply(self, u: str, v: str, amount: float, sign: int):
+        edge = self.edges.get((u, v))
+        created = edge is None
+        if created:
+            edge = self.edges[(u, v)] = [0.0, 0]
+            self.succ.setdefault(u, set()).add(v)
+            self.pred.setdefault(v, set()).add(u)
+        old = edge[0]
+        edge[0] += sign * amount
+        edge[1] += sign
+        if edge[1] == 0:
+            del self.edges[(u, v)]
+            self._unlink(self.succ, u, v)
+            self._unlink(self.pred, v, u)
+            self._spread(self.out, u, old, 0.0, -1)
+            self._spread(self.into, v, old, 0.0, -1)
+        else:
+            self._spread(self.out, u, old, edge[0], int(created))
+            self._spread(self.into, v, old, edge[0], int(created))
+
+    @staticmethod
+    def _unlink(adjacency: Dict[str, Set[str]], a: str, b: str):
+        adjacency[a].discard(b)
+        if not adjacency[a]:
+            del adjacency[a]
+
+    @staticmethod
+    def _spread(side: Dict[str, _Spread], node: str, old: float, new: float, edges: int):
+        spread = side.get(node)
+        if spread is None:
+            spread = side[node] = _Spread()
+        spread.update(old, new, edges)
+        if spread.count == 0:
+            # Drop the node (and any rounding drift in its sums) once it has no edges left
+            del side[node]
+
+    def _fresh(self, key: tuple) -> bool:
+        """True (and remembered) unless the pattern already alerted within the window."""
+        if key in self.alerted:
+            return False
+        self.alerted[key] = self.watermark
+        return True
+
+    def _alert(self, kind: str, key: tuple, anomaly_type: str, severity: float, entities: List[str],
+               description: str, evidence: dict, tid: str, explanation: dict) -> Anomaly:
+        evidence.update({
+            "trigger_transaction_id": tid,
+            "window": self.window,
+            "detected_at": datetime.utcnow().isoformat(),
+        })
+        return Anomaly(
+            anomaly_id=f"STREAM-{kind}-{hashing.hash_content(list(key))[:16]}-{self.watermark}",
+            anomaly_type=anomaly_type,
+            severity=severity,
+            entities_involved=entities,
+            description=description,
+            evidence_data=evidence,
+            confidence="Low",
+            detection_method="DETERMINISTIC",
+            explanation_metadata=explanation,
+        )
+
+    def _check_wash(self, u: str, v: str, tid: str, min_volume: float, max_net_ratio: float) -> List[Anomaly]:
+        back = self.edges.get((v, u))
+        if back is None:
+            return []
+        vol_uv, vol_vu = self.edges[(u, v)][0], back[0]
+        total_vol = vol_uv + vol_vu
+        net_flow = abs(vol_uv - vol_vu)
+        if not (total_vol > min_volume and net_flow < total_vol * max_net_ratio):
+            return []
+        a, b = sorted((u, v))
+        if not self._fresh(("WASH", a, b)):
+            return []
+        return [self._alert(
+            "WASH", (a, b), "WASH_TRADING", 0.85, [a, b],
+            f"Wash Trading Detected: These entities traded ${total_vol:,.2f} back-and-forth, but the net money moved was $0. This is typically done to inflate transaction stats artifically.",
+            {"total_volume": total_vol, "net_flow": net_flow}, tid,
+            {
+                "metric": "Fake Volume Ratio",
+                "value": f"{round((total_vol - net_flow) / total_vol * 100)}%",
+                "context": "High Volume with Zero Net Transfer",
+            },
+        )]
+
+    def _check_structuring(self, u: str, v: str, tid: str) -> List[Anomaly]:
+        alerts = []
+        fan_out = self.out.get(u)
+        if fan_out is not None and fan_out.flagged() and self._fresh(("STRUCT_OUT", u)):
+            avg_amt, std_dev = fan_out.describe()
+            targets = sorted(self.succ.get(u, ()))
+            alerts.append(self._alert(
+                "STRUCT-OUT", (u,), "STRUCTURING (Fan-Out)", 0.95, [u] + targets,
+                f"Smurfing (Fan-Out): A single source sent {len(targets)} identically sized payments (~${avg_amt:.2f}) to different people. This looks like splitting a large sum to evade detection thresholds.",
+                {"pattern": "Fan-Out", "avg_amount": avg_amt, "std_dev": std_dev, "count": fan_out.count}, tid,
+                {"metric": "Split-Transactions", "value": f"Count: {fan_out.count}",
+                 "context": "Repeated payments just below reporting limit"},
+            ))
+        fan_in = self.into.get(v)
+        # Don't flag Fan-In if already Fan-Out (as the batch detector)
+        if (fan_in is not None and fan_in.flagged() and not (v in self.out and self.out[v].flagged())
+                and self._fresh(("STRUCT_IN", v))):
+            avg_amt, std_dev = fan_in.describe()
+            senders = sorted(self.pred.get(v, ()))
+            alerts.append(self._alert(
+                "STRUCT-IN", (v,), "STRUCTURING (Fan-In)", 0.95, [v] + senders,
+                f"Smurfing (Fan-In): A single target received {len(senders)} identically sized payments (~${avg_amt:.2f}) from different people. This looks like consolidating split funds.",
+                {"pattern": "Fan-In", "avg_amount": avg_amt, "std_dev": std_dev, "count": fan_in.count}, tid,
+                {"metric": "Split-Transactions", "value": f"Count: {fan_in.count}",
+                 "context": "Repeated payments just below reporting limit"},
+            ))
+        return alerts
+
+    def _distances_to(self, u: str, budget: int) -> Tuple[Dict[str, int], int]:
+        """Edges from each node back to u (reverse BFS up to CYCLE_MAX_LEN - 1 edges), and the work spent."""
+        dist = {u: 0}
+        frontier = [u]
+        work = 0
+        for depth in range(1, CYCLE_MAX_LEN):
+            nxt = []
+            for x in frontier:
+                for p in self.pred.get(x, ()):
+                    work += 1
+                    if p not in dist:
+                        dist[p] = depth
+                        nxt.append(p)
+            frontier = nxt
+            if not frontier or work >= budget:
+                break
+        return dist, work
+
+    def _check_cycles(self, u: str, v: str, tid: str) -> List[Anomaly]:
+        """
+        Rings through the edge u -> v: paths v -> ... -> u, searched forward
+        from v only through nodes whose distance back to u still fits.
+        """
+        dist, work = self._distances_to(u, self.cycle_budget)
+        if dist.get(v, CYCLE_MAX_LEN) > CYCLE_MAX_LEN - 1:
+            return []
+        alerts = []
+        path = [u, v]
+        on_path = {u, v}
+        stack = [iter(self.succ.get(v, ()))]
+        while stack and work < self.cycle_budget:
+            for w in stack[-1]:
+                work += 1
+                if w == u:
+                    if len(path) >= CYCLE_MIN_LEN:
+                        alert = self._ring(path, tid)
+                        if alert is not None:
+                            alerts.append(alert)
+                    continue
+                d = dist.get(w)
+                # d is None for nodes that cannot get back to u in time
+                if d is None or w in on_path or len(path) + d > CYCLE_MAX_LEN:
+                    continue
+                path.append(w)
+                on_path.add(w)
+                stack.append(iter(self.succ.get(w, ())))
+                break
+            else:
+                stack.pop()
+                on_path.discard(path.pop())
+        return alerts
+
+    def _ring(self, path: List[str], tid: str) -> Optional[Anomaly]:
+        # Same retention rule as the batch detector: mean >= 100, every leg within 20% of it
+        amounts = [self.edges[(path[i], path[(i + 1) % len(path)])][0] for i in range(len(path))]
+        avg_amt = sum(amounts) / len(amounts)
+        if avg_amt < 100 or any(abs(amt - avg_amt) / avg_amt > 0.2 for amt in amounts):
+            return None
+        i = path.index(min(path))
+        cycle = path[i:] + path[:i]
+        if not self._fresh(("CIRC",) + tuple(cycle)):
+            return None
+        return self._alert(
+            "CIRC", tuple(cycle), "CIRCULAR_TRADING", 0.9, cycle,
+            f"Risk Alert: Funds are moving in a circle involving {len(cycle)} entities. This is a classic 'Circular Trading' pattern used to fake volume or launder money. Amount retained: ~${avg_amt:.2f}.",
+            {"cycle_path": cycle, "avg_amount": avg_amt}, tid,
+            {"metric": "Suspicious Loop", "value": f"{len(cycle)} Entities Involved",
+             "context": "Funds returned to origin (Circular Logic)"},
+        )
+
+
+# Per-process streaming state (the API process owns it)
+stream_detector = StreamDetector()
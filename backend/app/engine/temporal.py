@@ -0,0 +1,181 @@
+import os
+import numpy as np
+import pandas as pd
+from bisect import bisect_right
+from scipy.sparse import csr_matrix
+from typing import Dict, List, Tuple
+from app.core.store import TransactionTable
+from app.engine.cycles import CYCLE_MAX_LEN, CYCLE_MIN_LEN, CYCLE_WORK_BUDGET, WorkBudget, cyclic_components
+
+# Longest time a round-trip may take from its first to its last transaction
+TEMPORAL_CYCLE_MAX_DURATION = os.getenv("TEMPORAL_CYCLE_MAX_DURATION", "30D")
+
+
+class TemporalIndex:
+    """
+    Outgoing transactions of every entity, sorted by time.
+    The transactions of entity u are positions `ptr[u]:ptr[u + 1]` of the
+    parallel `ts` / `dst` lists (row `rows[i]` of `table`); `between` finds
+    the ones inside a time interval with two binary searches.
+    """
+
+    def __init__(self, table: TransactionTable):
+        order = np.lexsort((table.timestamp, table.src))
+        ptr = np.zeros(len(table.entities) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(table.src, minlength=len(table.entities)), out=ptr[1:])
+        self.table = table
+        self.rows = order
+        # Plain lists: the search does scalar bisects, which numpy would only slow down
+        self.ptr = ptr.tolist()
+        self.ts = table.timestamp[order].tolist()
+        self.dst = table.dst[order].tolist()
+
+    def between(self, u: int, after: int, until: int) -> Tuple[int, int]:
+        """Positions of u's transactions with after < ts <= until."""
+        lo = bisect_right(self.ts, after, self.ptr[u], self.ptr[u + 1])
+        hi = bisect_right(self.ts, until, lo, self.ptr[u + 1])
+        return lo, hi
+
+
+class TemporalCycleSearch:
+    """
+    Outcome of a time-respecting cycle search. Each ring is a dict with the
+    entities in transaction order, the transaction rows of its earliest
+    occurrence, their timestamps and how many times it occurred.
+    """
+
+    def __init__(self, rings: List[dict], truncated: bool, work: int):
+        self.rings = rings
+        self.truncated = truncated
+        self.work = work
+
+    def __len__(self) -> int:
+        return len(self.rings)
+
+
+def _canonical(ring: Tuple[int, ...]) -> Tuple[int, ...]:
+    i = ring.index(min(ring))
+    return ring[i:] + ring[:i]
+
+
+def find_temporal_cycles(table: TransactionTable, max_duration: str = TEMPORAL_CYCLE_MAX_DURATION,
+                         max_len: int = CYCLE_MAX_LEN, min_len: int = CYCLE_MIN_LEN,
+                         budget: int = CYCLE_WORK_BUDGET) -> TemporalCycleSearch:
+    """
+    Finds round-trips A -> B -> ... -> A whose transactions occur in strictly
+    increasing time order and span at most `max_duration`, over the whole
+    table (no slice boundaries).
+
+    Every transaction is tried as the first leg. From each entity the walk
+    takes, per next entity, only the earliest qualifying transaction (it
+    leaves the most time for the rest of the ring). Entities outside the
+    start's strongly connected component are never expanded, and the whole
+    search stops after `budget` transaction scans (reported as truncated).
+    A ring is reported once per entity cycle, with its earliest occurrence.
+    Each occurrence is found again from every other entity of the ring, so
+    `occurrences` counts the closing start transactions per start entity
+    and keeps the largest count.
+    Raises ValueError for an invalid duration.
+    """
+    horizon = pd.Timedelta(max_duration).value
+    if horizon <= 0:
+        raise ValueError("max_duration must be positive")
+
+    n = len(table.entities)
+    loops = table.src != table.dst
+    adj = csr_matrix((np.ones(int(loops.sum()), dtype=np.int8), (table.src[loops], table.dst[loops])), shape=(n, n))
+    adj.sum_duplicates()
+    components = cyclic_components(adj, min_len)
+    if not components:
+        return TemporalCycleSearch([], False, 0)
+
+    # A ring never leaves the strongly connected component of its start
+    comp_of = np.full(n, -1, dtype=np.int64)
+    for label, comp in enumerate(components):
+        comp_of[comp] = label
+    comp_of = comp_of.tolist()
+
+    index = TemporalIndex(table)
+    ts, dst = index.ts, index.dst
+    work_budget = WorkBudget(budget)
+    work = 0
+    rings: Dict[Tuple[int, ...], dict] = {}
+
+    for start in np.concatenate(components).tolist():
+        label = comp_of[start]
+        for first in range(index.ptr[start], index.ptr[start + 1]):
+            v = dst[first]
+            work += 1
+            if v == start or comp_of[v] != label:
+                continue
+            t0 = ts[first]
+            deadline = t0 + horizon
+
+            # DFS over (entity, arrival time); each level scans the entity's
+            # transactions in (arrival, deadline] once, earliest per next entity
+            path = [start, v]
+            legs = [first]
+            on_path = {start, v}
+            lo, hi = index.between(v, t0, deadline)
+            stack = [(lo, hi, set())]
+            while stack:
+                if work >= work_budget.limit:
+                    work_budget.used = work
+                    if not work_budget.extend():
+                        return _result(rings, index, True, work)
+                lo, hi, seen = stack[-1]
+                advanced = False
+                while lo < hi:
+                    pos = lo
+                    lo += 1
+                    work += 1
+                    w = dst[pos]
+                    if w in seen:
+                        continue
+                    seen.add(w)
+                    if w == start:
+                        if len(path) >= min_len:
+                            key = _canonical(tuple(path))
+                            ring = rings.get(key)
+                            closes = ring["closes"] if ring else {}
+                            # Keep the earliest occurrence of the entity cycle
+                            if ring is None or t0 < ts[ring["legs"][0]]:
+                                ring = rings[key] = {"entities": list(path), "legs": legs + [pos], "closes": closes}
+                            closes[start] = closes.get(start, 0) + 1
+                        continue
+                    # The ring still needs a leg back after w
+                    if len(path) >= max_len or comp_of[w] != label or w in on_path:
+                        continue
+                    stack[-1] = (lo, hi, seen)
+                    path.append(w)
+                    legs.append(pos)
+                    on_path.add(w)
+                    stack.append(index.between(w, ts[pos], deadline) + (set(),))
+                    advanced = True
+                    break
+                if not advanced:
+                    stack.pop()
+                    on_path.discard(path.pop())
+                    legs.pop()
+
+    return _result(rings, index, False, work)
+
+
+def _result(rings: Dict[Tuple[int, ...], dict], index: TemporalIndex, truncated: bool, work: int) -> TemporalCycleSearch:
+    """Resolves entity codes and leg positions to names, ids, amounts and times."""
+    table = index.table
+    out = []
+    for ring in rings.values():
+        rows = index.rows[ring["legs"]]
+        stamps = table.timestamp[rows]
+        out.append({
+            "entities": table.entities[ring["entities"]].tolist(),
+            "transaction_ids": table.transaction_ids[rows].tolist(),
+            "amounts": table.amount[rows].tolist(),
+            "start": int(stamps[0]),
+            "end": int(stamps[-1]),
+            # Every occurrence also closes from the ring's other entities: count one rotation only
+            "occurrences": max(ring["closes"].values()),
+        })
+    out.sort(key=lambda r: (r["start"], r["entities"]))
+    return TemporalCycleSearch(out, truncated, work)
@@ -1,3 +1,6 @@
+import time
+_startup_t0 = time.perf_counter() # Cold start clock for the startup report
+
 from dotenv import load_dotenv
 load_dotenv() # Load .env file
 
@@ -23,6 +26,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Keyset pagination cursor of /transactions
 )
 
 @app.get("/")
@@ -31,3 +35,20 @@ def read_root():
 
 from app.api import routes
 app.include_router(routes.router, prefix="/api/v1")
+
+from app.core import lazy
+STARTUP_SECONDS = round(time.perf_counter() - _startup_t0, 3)
+print(f"DEBUG: app.main ready in {STARTUP_SECONDS}s")
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    from app.core.jobs import job_manager
+    job_manager.shutdown()
+
+@app.get("/startup")
+def startup_report():
+    """Cold start time of app.main plus modules loaded lazily since."""
+    return {
+        "import_seconds": STARTUP_SECONDS,
+        "lazy_imports": lazy.load_report()
+    }
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class Transaction(BaseModel):
@@ -28,6 +28,10 @@ class IngestResponse(BaseModel):
     record_count: int
     content_hash: str
     message: str
+    rows_per_second: Optional[float] = None # Insert throughput of the bulk loader
+    mode: str = "replace" # replace, append
+    inserted_count: Optional[int] = None
+    duplicate_count: int = 0 # Rows skipped in append mode (transaction_id already stored)
 
 class Anomaly(BaseModel):
     anomaly_id: str
@@ -40,6 +44,22 @@ class Anomaly(BaseModel):
     detection_method: str = "UNKNOWN" # LEARNED, DETERMINISTIC
     explanation_metadata: dict = {} # Structured metrics
 
+class StreamTransaction(BaseModel):
+    transaction_id: Optional[str] = None # Generated when missing
+    source_entity: str
+    target_entity: str
+    amount: float
+    timestamp: datetime
+    transaction_type: str = "TRANSFER"
+
+class StreamResponse(BaseModel):
+    processed: int
+    alerts: List[Anomaly]
+    detection_ms: float # Detector time for the whole request
+    transactions_per_second: float
+    batch_id: Optional[str] = None # Set when the transactions were persisted
+    inserted_count: int = 0
+
 class GraphSnapshot(BaseModel):
     snapshot_id: str
     start_date: datetime
@@ -47,3 +67,6 @@ class GraphSnapshot(BaseModel):
     node_count: int
     edge_count: int
     data_hash: str
+    # Merkle roots of the per-slice edge sets that data_hash commits to
+    slice_window: Optional[str] = None
+    slice_roots: Optional[Dict[str, str]] = None
@@ -10,9 +10,22 @@ class TransactionDB(Base):
     source_entity = Column(String, index=True)
     target_entity = Column(String, index=True)
     amount = Column(Float)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True) # Range pushdown for /analyze
     transaction_type = Column(String, default="payment")
+    batch_id = Column(String, index=True) # IngestBatchDB.batch_id that first wrote this row
     
+class IngestBatchDB(Base):
+    __tablename__ = "ingest_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String, unique=True, index=True)
+    content_hash = Column(String, index=True)
+    mode = Column(String) # replace, append, stream
+    record_count = Column(Integer) # Rows in the upload
+    inserted_count = Column(Integer) # Rows actually written
+    duplicate_count = Column(Integer) # Rows skipped (transaction_id already stored)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class AnomalyDB(Base):
     __tablename__ = "anomalies"
     
@@ -1,5 +1,5 @@
 from app.core.database import engine, Base
-from app.models_orm import AnomalyDB, TransactionDB, SnapshotDB
+from app.models_orm import AnomalyDB, TransactionDB, SnapshotDB, IngestBatchDB
 
 def reset_db():
     print("Dropping all tables...")
@@ -0,0 +1,100 @@
+import networkx as nx
+import numpy as np
+import pytest
+from app.core.index import GraphIndex
+from app.engine import communities, cycles
+from app.engine.communities import core_numbers, triangles, truss_numbers
+from app.engine.cycles import find_cycles
+
+
+def _random_digraph(seed, nodes=40, edges=120):
+    G = nx.gnm_random_graph(nodes, edges, seed=seed, directed=True)
+    return nx.relabel_nodes(G, {i: f"E{i:03d}" for i in G})
+
+
+def _expected_cycles(G, max_len, min_len=3):
+    found = set()
+    for cycle in nx.simple_cycles(G, length_bound=max_len):
+        if len(cycle) >= min_len:
+            i = cycle.index(min(cycle))
+            found.add(tuple(cycle[i:] + cycle[:i]))
+    return [list(c) for c in sorted(found)]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4, 5])
+def test_find_cycles_matches_networkx(seed):
+    G = _random_digraph(seed)
+    for max_len in (3, 5):
+        search = find_cycles(G, max_len=max_len, workers=1)
+        assert not search.truncated
+        assert search.cycles == _expected_cycles(G, max_len)
+
+
+def test_find_cycles_reports_truncation():
+    G = _random_digraph(7, nodes=60, edges=300)
+    full = find_cycles(G, max_len=5, workers=1)
+    partial = find_cycles(G, max_len=5, budget=200, workers=1)
+    assert partial.truncated
+    assert len(partial) < len(full)
+    assert set(map(tuple, partial.cycles)) <= set(map(tuple, full.cycles))
+
+
+def test_parallel_cycle_search_matches_networkx(monkeypatch):
+    # Lower the threshold so a small graph takes the pool path (tasks split by component and start node)
+    monkeypatch.setattr(cycles, "PARALLEL_MIN_EDGES", 100)
+    G = _random_digraph(11, nodes=200, edges=800)
+    search = find_cycles(G, max_len=5, workers=2)
+    assert search.tasks > 1
+    assert not search.truncated
+    assert search.cycles == _expected_cycles(G, 5)
+
+    partial = find_cycles(G, max_len=5, budget=500, workers=2)
+    assert partial.truncated
+    assert set(map(tuple, partial.cycles)) < set(map(tuple, search.cycles))
+
+
+def _undirected(seed, nodes=40, edges=240):
+    """Index of a random digraph with a planted 6-clique, and the same graph as an undirected networkx graph."""
+    G = _random_digraph(seed, nodes, edges)
+    clique = [f"E{i:03d}" for i in range(6)]
+    G.add_edges_from((a, b) for a in clique for b in clique if a < b)
+    index = GraphIndex.of(G)
+    return index, nx.Graph(G.to_undirected())
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_core_numbers_match_networkx(seed):
+    index, U = _undirected(seed)
+    core = core_numbers(index.undirected)
+    assert dict(zip(index.names.tolist(), core.tolist())) == nx.core_number(U)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_triangles_match_networkx(seed, monkeypatch):
+    # Small wedge chunks so the listing runs over several chunks
+    monkeypatch.setattr(communities, "TRIANGLE_WEDGE_CHUNK", 64)
+    index, U = _undirected(seed)
+    names = index.names
+    eu, ev, tri = triangles(index.undirected)
+    found = [frozenset(names[np.concatenate([eu[t], ev[t]])].tolist()) for t in tri]
+    assert all(len(t) == 3 for t in found)
+    assert len(set(found)) == len(found)
+
+    per_node = dict.fromkeys(U, 0)
+    for t in found:
+        for node in t:
+            per_node[node] += 1
+    assert per_node == nx.triangles(U)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_truss_numbers_match_networkx(seed):
+    index, U = _undirected(seed)
+    names = index.names
+    eu, ev, tri = triangles(index.undirected)
+    truss = truss_numbers(len(eu), tri)
+    assert truss.max() >= 6
+    for k in range(3, int(truss.max()) + 2):
+        keep = truss >= k
+        ours = {frozenset(e) for e in zip(names[eu[keep]].tolist(), names[ev[keep]].tolist())}
+        assert ours == {frozenset(e) for e in nx.k_truss(U, k).edges()}
@@ -0,0 +1,60 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import routes
+from app.core import database
+from app.engine.stream import StreamDetector
+
+
+def _tx(tid, source, target, amount, timestamp):
+    return {"transaction_id": tid, "source_entity": source, "target_entity": target,
+            "amount": amount, "timestamp": timestamp}
+
+
+def test_late_transaction_leaves_window_on_time():
+    detector = StreamDetector(window="1D")
+    detector.process([
+        _tx("t1", "A", "B", 100.0, "2024-01-10 00:00"),
+        # Late but still inside the window: arrives after t1, is older than it
+        _tx("t2", "X", "Y", 100.0, "2024-01-09 12:00"),
+    ])
+    assert ("X", "Y") in detector.edges
+
+    detector.process([_tx("t3", "C", "D", 100.0, "2024-01-10 13:00")])
+    # The cutoff (01-09 13:00) passed t2 but not t1
+    assert ("X", "Y") not in detector.edges
+    assert ("A", "B") in detector.edges
+    assert "t2" not in detector.live_ids
+    assert detector.stats()["transactions_in_window"] == 2
+
+    # Older than the window outright: skipped
+    detector.process([_tx("t4", "X", "Y", 100.0, "2024-01-09 00:00")])
+    assert ("X", "Y") not in detector.edges
+    assert detector.skipped == 1
+
+
+def test_late_leg_still_closes_wash_trade():
+    detector = StreamDetector(window="1D")
+    detector.process([_tx("t1", "A", "B", 50000.0, "2024-01-10 00:00")])
+    alerts = detector.process([_tx("t2", "B", "A", 50000.0, "2024-01-09 18:00")])
+    assert [a.anomaly_type for a in alerts] == ["WASH_TRADING"]
+
+
+def test_failed_persist_leaves_window_untouched(monkeypatch):
+    detector = StreamDetector(window="1D")
+    monkeypatch.setattr(routes, "stream_detector", detector)
+
+    def failing_persist(records, db):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(routes, "_persist_stream", failing_persist)
+    app = FastAPI()
+    app.include_router(routes.router)
+    app.dependency_overrides[database.get_db] = lambda: None
+    client = TestClient(app, raise_server_exceptions=False)
+
+    payload = {"transaction_id": "t1", "source_entity": "A", "target_entity": "B",
+               "amount": 100.0, "timestamp": "2024-01-10T00:00:00"}
+    response = client.post("/stream/transactions", json=payload)
+    assert response.status_code == 500
+    assert detector.processed == 0
+    assert not detector.edges
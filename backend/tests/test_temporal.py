@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from app.core.store import TransactionTable, Vocabulary
+from app.engine.temporal import find_temporal_cycles
+
+
+def _table(rows):
+    """Table from (source, target, timestamp) rows, each transfer 1000.0, ids t0, t1, ..."""
+    entities = Vocabulary()
+    src = entities.encode([r[0] for r in rows])
+    dst = entities.encode([r[1] for r in rows])
+    return TransactionTable(
+        transaction_ids=np.array([f"t{i}" for i in range(len(rows))], dtype=object),
+        src=src,
+        dst=dst,
+        amount=np.full(len(rows), 1000.0),
+        timestamp=pd.to_datetime([r[2] for r in rows]).values.astype("datetime64[ns]").astype(np.int64),
+        tx_type=np.zeros(len(rows), dtype=np.int32),
+        entities=entities.names(),
+        types=np.array(["TRANSFER"], dtype=object),
+    )
+
+
+def test_legs_out_of_time_order_are_not_a_ring():
+    search = find_temporal_cycles(_table([
+        ("A", "B", "2024-01-02"),
+        ("B", "C", "2024-01-01"),
+        ("C", "A", "2024-01-03"),
+    ]))
+    assert search.rings == []
+
+
+def test_ring_longer_than_max_duration_is_not_reported():
+    search = find_temporal_cycles(_table([
+        ("A", "B", "2024-01-01"),
+        ("B", "C", "2024-01-20"),
+        ("C", "A", "2024-02-10"),
+    ]), max_duration="30D")
+    assert search.rings == []
+
+
+def test_ring_across_month_boundary_is_reported():
+    search = find_temporal_cycles(_table([
+        ("A", "B", "2024-01-30"),
+        ("B", "C", "2024-02-01"),
+        ("C", "A", "2024-02-02"),
+    ]))
+    assert len(search) == 1
+    ring = search.rings[0]
+    assert ring["entities"] == ["A", "B", "C"]
+    assert ring["transaction_ids"] == ["t0", "t1", "t2"]
+    assert ring["occurrences"] == 1
+
+
+def test_repeated_ring_counts_each_occurrence_once():
+    # The second round also closes from B and C (B -> C, C -> A, then the next A -> B)
+    search = find_temporal_cycles(_table([
+        ("A", "B", "2024-01-01"),
+        ("B", "C", "2024-01-02"),
+        ("C", "A", "2024-01-03"),
+        ("A", "B", "2024-01-10"),
+        ("B", "C", "2024-01-11"),
+        ("C", "A", "2024-01-12"),
+    ]))
+    assert len(search) == 1
+    assert search.rings[0]["transaction_ids"] == ["t0", "t1", "t2"]
+    assert search.rings[0]["occurrences"] == 2
+
+
+def test_first_legs_sharing_the_rest_of_the_ring_count_separately():
+    # Two A -> B transfers continue through the same B -> C -> A legs:
+    # each start transaction that closes the ring is one occurrence
+    search = find_temporal_cycles(_table([
+        ("A", "B", "2024-01-01"),
+        ("A", "B", "2024-01-02"),
+        ("B", "C", "2024-01-03"),
+        ("C", "A", "2024-01-04"),
+    ]))
+    assert len(search) == 1
+    assert search.rings[0]["transaction_ids"] == ["t0", "t2", "t3"]
+    assert search.rings[0]["occurrences"] == 2